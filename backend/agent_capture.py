@@ -1,37 +1,79 @@
-import pyshark
 import time
 import asyncio
 import websockets
 import json
-from utils import extract_features_from_packet, aggregate_window
-from queue import Queue
+import argparse
+import os
+import logging
+import socket
+from urllib.parse import urlencode
+from utils import FEATURE_ORDER, extract_features_from_packet, agg_value, window_alert
+from feature_schema import FeatureSchema, FLOW_SCHEMA, SCHEMA_FILE
+from flow_table import FlowAggregator
+from sharding import ShardedAggregator
+from windowing import SlidingWindow, WindowClock, start_timer
+from packet_decoder import RawSocketCapture
+from pcap_reader import replay_packets
 import threading
+from channel import BoundedChannel, OVERFLOW_POLICIES
+from wire_protocol import encode_batch
+from tree_eval import load_compiled
+import logs
+import metrics
+
+log = logging.getLogger("agent")
 
 # -----------------------
 # CONFIG
 # -----------------------
 WS_URL = "ws://127.0.0.1:8000/ws/agent"
 TSHARK_IFACE = "en0"  # your live network interface
-WINDOW = 10  # aggregation window in seconds
+CAPTURE_BACKEND = "auto"  # "raw" (AF_PACKET + struct decoder), "pyshark", or "auto"
+WINDOW = 10  # aggregation window length in seconds
+HOP = 10  # seconds between window emissions; HOP < WINDOW gives overlapping windows
+STATS_INTERVAL = 5  # seconds between throughput reports
+QUEUE_SIZE = 256  # max aggregated windows waiting to be sent
+QUEUE_POLICY = "drop_oldest"  # "drop_oldest", "drop_newest" or "block" when the sender falls behind
+WIRE_FORMAT = "binary"  # "binary" (per-flow float32 batches, scored by the backend) or "json" (local alerts)
+COMPRESS = False  # zlib-compress binary frames
+AGENT_ID = socket.gethostname()
+WORKERS = 1  # >1 shards flows across that many worker processes
+TOP_HOSTS = 5  # top sources/destinations reported per window
+EDGE_INFERENCE = False  # score windows on the agent and send only alerts
+EDGE_MODEL = "models/xgb_model.joblib"  # compiled once to models/xgb_model.npz
+EDGE_SCALER = "models/scaler.joblib"
+METRICS_PORT = 0  # >0 serves Prometheus /metrics on this port
+
+QUEUE_WAIT = metrics.stage("queue_wait")
+ENCODE = metrics.stage("encode")
+WS_SEND = metrics.stage("ws_send")
+EDGE_PREDICT = metrics.stage("edge_predict")
 
 # -----------------------
-# THREAD-SAFE QUEUE
+# CAPTURE -> SENDER CHANNEL
 # -----------------------
-packet_queue = Queue()
+packet_queue = BoundedChannel(QUEUE_SIZE, QUEUE_POLICY)
+edge_model = None  # tree_eval.TreeEnsemble when EDGE_INFERENCE is on
+edge_columns = None  # the edge model's columns of FEATURE_ORDER, None for all in order
+
+metrics.REGISTRY.callback("ids_agent_channel_depth", "Windows waiting for the sender", lambda: len(packet_queue))
+metrics.REGISTRY.callback("ids_agent_channel_dropped_total", "Windows dropped by the channel's overflow policy",
+                          lambda: packet_queue.dropped, kind="counter")
 
 # -----------------------
 # HELPER: Create human-readable alert
 # -----------------------
-def create_alert_from_features(features: dict):
+def create_alert_from_features(agg: dict):
     """
-    Convert aggregated features into a meaningful alert dictionary.
+    Convert an aggregated window into a meaningful alert dictionary.
     Customize thresholds based on your needs.
     """
+    features = agg["features"]
     # Example logic
-    if features.get("total fwd packets", 0) > 1000:
+    if agg_value(features, "total fwd packets", "max") > 1000:
         alert_type = "Possible Port Scan"
         description = "High number of forward packets"
-    elif features.get("total backward packets", 0) > 500:
+    elif agg_value(features, "total backward packets", "max") > 500:
         alert_type = "Possible DDoS"
         description = "High backward traffic detected"
     else:
@@ -40,75 +82,269 @@ def create_alert_from_features(features: dict):
 
     return {
         "alert_type": alert_type,
-        "src_ip": features.get("src_ip", "unknown"),
+        "src_ip": agg.get("src_ip", "unknown"),
         "description": description,
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "top_sources": agg["traffic"].sources.report(TOP_HOSTS),
     }
 
+def edge_alert(agg):
+    """Score every flow of a window with the local compiled model and summarize it as one alert."""
+    rows = agg["rows"] if edge_columns is None else agg["rows"][:, edge_columns]
+    with EDGE_PREDICT.time(len(rows)):
+        proba = edge_model.predict_proba(rows)
+    return window_alert(
+        agg["keys"], proba.argmax(axis=1), proba,
+        src_ip=agg["src_ip"],
+        timestamp=agg["end"],
+        agent_id=AGENT_ID,
+        top_sources=agg["traffic"].sources.report(TOP_HOSTS),
+    )
+
+def load_edge_model(model_path=EDGE_MODEL, scaler_path=EDGE_SCALER):
+    """
+    The compiled edge model and its columns of FEATURE_ORDER, checked
+    against the feature schema saved with the scaler (if any).
+    """
+    model = load_compiled(model_path, scaler_path)
+    schema_path = os.path.join(os.path.dirname(scaler_path), SCHEMA_FILE)
+    schema = FeatureSchema.load(schema_path) if os.path.exists(schema_path) else FLOW_SCHEMA
+    schema.check_width(model.n_features, model_path)
+    return model, schema.columns(FEATURE_ORDER)
+
 # -----------------------
 # PACKET CAPTURE
 # -----------------------
-def capture_packets():
-    """Capture live packets and push aggregated features to the queue."""
-    print(f"[INFO] Starting live capture on interface: {TSHARK_IFACE}")
-    capture = pyshark.LiveCapture(interface=TSHARK_IFACE)
-    window = []
-    last_time = time.time()
-
+def pyshark_packets(iface):
+    """Fallback capture: tshark dissection through pyshark."""
+    import pyshark
+    capture = pyshark.LiveCapture(interface=iface)
     for pkt in capture.sniff_continuously():
-        # Extract features
-        features = extract_features_from_packet(pkt)
-        if features:
-            window.append(features)
-
-        # Aggregate every WINDOW seconds
-        if time.time() - last_time >= WINDOW:
-            agg = aggregate_window(window)
-            if agg:
-                packet_queue.put(agg)
-            window = []
-            last_time = time.time()
+        info = extract_features_from_packet(pkt)
+        if info is not None:
+            yield info
+
+def open_capture(iface, backend=CAPTURE_BACKEND):
+    """Return an iterator of PacketInfo records from the selected capture backend."""
+    if backend in ("raw", "auto"):
+        try:
+            return RawSocketCapture(iface).packets()
+        except OSError as e:
+            if backend == "raw":
+                raise
+            log.warning("Raw capture unavailable (%s), falling back to pyshark", e)
+    return pyshark_packets(iface)
+
+class ThroughputStats:
+    """Packet and window counters with periodic packets/s and windows/s reports."""
+
+    def __init__(self, interval=STATS_INTERVAL):
+        self.interval = interval
+        self.packets = 0
+        self.windows = 0
+        self.start = self.last_report = time.monotonic()
+
+    def maybe_report(self):
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self, prefix="Throughput"):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        queue = packet_queue.stats()
+        log.info(f"{prefix}: {self.packets} packets, {self.windows} windows in {elapsed:.2f}s "
+                 f"({self.packets / elapsed:.0f} packets/s, {self.windows / elapsed:.2f} windows/s); "
+                 f"queue depth {queue['depth']}/{queue['maxsize']}, max {queue['max_depth']}, "
+                 f"dropped {queue['dropped']}")
+
+def capture_packets(packets=None, packet_time=False):
+    """
+    Track packets as flows and push aggregated flow features to the queue.
+
+    packets defaults to a live capture on TSHARK_IFACE. A window of WINDOW
+    seconds is emitted every HOP seconds, even when no packets arrive: live
+    capture runs the window clock on a timer thread, while packet_time
+    (replay) advances it with packet timestamps. A finite source flushes its
+    remaining flows and then closes the queue. With WORKERS > 1 flow
+    tracking is sharded across worker processes.
+    """
+    live = packets is None
+    if live:
+        log.info("Starting live capture on interface: %s", TSHARK_IFACE)
+        packets = open_capture(TSHARK_IFACE)
+    stats = ThroughputStats()
+
+    def emit(window):
+        stats.windows += 1
+        window["queued_at"] = time.monotonic()
+        packet_queue.put(window)
+
+    sliding = SlidingWindow(WINDOW, HOP, emit)
+    if WORKERS > 1:
+        log.info("Sharding flows across %d worker processes", WORKERS)
+        aggregator = ShardedAggregator(sliding, WORKERS)
+    else:
+        aggregator = FlowAggregator(sliding)
+    clock = WindowClock(HOP, aggregator.close_window)
+    lock = threading.Lock()
+    stop = threading.Event()
+    if not packet_time:
+        start_timer(clock, lock, stop)
+
+    now = None
+    for info in packets:
+        with lock:
+            if packet_time:
+                # Close every pane boundary this packet has passed
+                now = info.ts
+                clock.advance(now)
+            # Update the packet's bidirectional flow
+            aggregator.add(info)
+        stats.packets += 1
+        stats.maybe_report()
+
+    stop.set()
+    if not live:
+        # End of replay: expire every remaining flow into a final window
+        if now is not None:
+            clock.flush(now)
+        aggregator.close()
+        stats.report("Replay finished")
+        packet_queue.close()
+
+def replay(paths, speed=0.0):
+    """Replay pcap/pcapng files through the capture pipeline."""
+    mode = "as fast as possible" if speed <= 0 else f"at {speed}x original speed"
+    log.info("Replaying %d capture file(s) %s", len(paths), mode)
+    capture_packets(replay_packets(paths, speed), packet_time=True)
 
 # -----------------------
 # WEBSOCKET SENDER
 # -----------------------
+def encode_window(agg):
+    """Pack a window's per-flow feature rows and top talkers into one binary frame."""
+    with ENCODE.time():
+        return encode_batch(agg["rows"], agg["keys"], AGENT_ID, agg["start"], agg["end"],
+                            compress=COMPRESS, meta=agg["traffic"].report(TOP_HOSTS))
+
+def take_window(agg):
+    """Record how long a window waited in the channel."""
+    if agg is not None and "queued_at" in agg:
+        QUEUE_WAIT.observe(time.monotonic() - agg["queued_at"])
+    return agg
+
+async def send(ws, message):
+    with WS_SEND.time():
+        await ws.send(message)
+
 async def send_ws():
-    """Send alerts to backend via WebSocket."""
+    """Send windows (binary), agent-side alerts (json) or edge-scored alerts to backend via WebSocket."""
     traffic_state = None  # None, "normal", or "abnormal"
     
     while True:
         try:
-            async with websockets.connect(WS_URL) as ws:
-                print(f"[INFO] Connected to backend WebSocket at {WS_URL}")
+            async with websockets.connect(f"{WS_URL}?{urlencode({'agent_id': AGENT_ID})}") as ws:
+                log.info("Connected to backend WebSocket at %s", WS_URL)
                 while True:
-                    if not packet_queue.empty():
-                        agg = packet_queue.get()
+                    # Woken by the capture thread as soon as a window is ready
+                    agg = take_window(await packet_queue.get())
+                    if agg is None:
+                        return  # replay finished
+                    if EDGE_INFERENCE:
+                        # NumPy releases the GIL, so scoring does not stall the connection
+                        alert = await asyncio.to_thread(edge_alert, agg)
+                    elif WIRE_FORMAT == "binary":
+                        # The backend scores every flow and raises the alerts
+                        await send(ws, encode_window(agg))
+                        continue
+                    else:
                         alert = create_alert_from_features(agg)
 
-                        # Logic to send normal alert only once until abnormal traffic
-                        if alert["alert_type"] == "Normal Traffic":
-                            if traffic_state != "normal":
-                                await ws.send(json.dumps(alert))
-                                print("[INFO] Sent alert:", alert)
-                                traffic_state = "normal"
-                            # else: skip sending repeated normal alerts
-                        else:
-                            # Always send abnormal alerts
-                            await ws.send(json.dumps(alert))
-                            print("[INFO] Sent alert:", alert)
-                            traffic_state = "abnormal"
-                    await asyncio.sleep(0.1)
+                    # Logic to send normal alert only once until abnormal traffic
+                    if alert["alert_type"] == "Normal Traffic":
+                        if traffic_state != "normal":
+                            await send(ws, json.dumps(alert))
+                            log.info("Sent alert: %s", alert)
+                            traffic_state = "normal"
+                        # else: skip sending repeated normal alerts
+                    else:
+                        # Always send abnormal alerts
+                        await send(ws, json.dumps(alert))
+                        log.info("Sent alert: %s", alert)
+                        traffic_state = "abnormal"
         except Exception as e:
-            print(f"[ERROR] WS connection failed, retrying in 5s: {e}")
+            log.error("WS connection failed, retrying in 5s: %s", e)
             await asyncio.sleep(5)
 
+async def drain_queue():
+    """Consume windows without a backend connection (benchmarking)."""
+    while True:
+        agg = take_window(await packet_queue.get())
+        if agg is None:
+            return
+        if EDGE_INFERENCE:
+            edge_alert(agg)
+        elif WIRE_FORMAT == "binary":
+            encode_window(agg)
+        else:
+            create_alert_from_features(agg)
+
 # -----------------------
 # MAIN
 # -----------------------
 if __name__ == "__main__":
-    # Start packet capture in a separate thread
-    capture_thread = threading.Thread(target=capture_packets, daemon=True)
+    parser = argparse.ArgumentParser(description="IDS capture agent")
+    parser.add_argument("--replay", nargs="+", metavar="PCAP",
+                        help="replay pcap/pcapng files instead of capturing live")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="replay speed multiplier; 0 replays as fast as possible")
+    parser.add_argument("--no-send", action="store_true",
+                        help="do not connect to the backend; only run capture and aggregation")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="max aggregated windows buffered between capture and sender")
+    parser.add_argument("--queue-policy", choices=OVERFLOW_POLICIES, default=QUEUE_POLICY,
+                        help="what to do when the sender falls behind")
+    parser.add_argument("--wire-format", choices=("binary", "json"), default=WIRE_FORMAT,
+                        help="send per-flow feature batches (binary) or locally built alerts (json)")
+    parser.add_argument("--compress", action="store_true", help="zlib-compress binary frames")
+    parser.add_argument("--window", type=float, default=WINDOW, help="window length in seconds")
+    parser.add_argument("--hop", type=float, default=HOP, help="seconds between window emissions")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="shard flow tracking across this many worker processes")
+    parser.add_argument("--agent-id", default=AGENT_ID,
+                        help="name this agent reports under (default: hostname)")
+    parser.add_argument("--backend", default=WS_URL, help="backend agent WebSocket URL")
+    parser.add_argument("--edge-inference", action="store_true",
+                        help="score flows on the agent with the compiled model and send only alerts")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on this port (0: off)")
+    parser.add_argument("--log-level", default=logs.LOG_LEVEL, help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument("--log-format", choices=logs.LOG_FORMATS, default=logs.LOG_FORMAT,
+                        help="plain text or one JSON object per line")
+    args = parser.parse_args()
+    logs.configure(args.log_level, args.log_format)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+        log.info("Serving metrics on port %d", args.metrics_port)
+    WIRE_FORMAT, COMPRESS, WORKERS = args.wire_format, args.compress, args.workers
+    AGENT_ID, WS_URL = args.agent_id, args.backend
+    EDGE_INFERENCE = args.edge_inference or EDGE_INFERENCE
+    if EDGE_INFERENCE:
+        edge_model, edge_columns = load_edge_model()
+        log.info("Edge inference with %d compiled trees", edge_model.n_trees)
+    WINDOW, HOP = args.window, min(args.hop, args.window)
+    packet_queue = BoundedChannel(args.queue_size, args.queue_policy)
+
+    # Start packet capture (or replay) in a separate thread
+    if args.replay:
+        capture_thread = threading.Thread(target=replay, args=(args.replay, args.speed), daemon=True)
+    else:
+        capture_thread = threading.Thread(target=capture_packets, daemon=True)
     capture_thread.start()
 
-    # Run websocket sender in main asyncio loop
-    asyncio.run(send_ws())
+    if args.no_send:
+        asyncio.run(drain_queue())
+    else:
+        # Run websocket sender in main asyncio loop
+        asyncio.run(send_ws())
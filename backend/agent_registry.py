@@ -0,0 +1,289 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import deque
+from wire_protocol import decode_batch, WireFormatError
+from inference import run_model
+import metrics
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# CONFIG
+# -----------------------
+AGENT_QUEUE = 32     # windows buffered per agent before the oldest is dropped
+MAX_ROWS = 4096      # flows per shared scoring call (one window may exceed it)
+SCORERS = 2          # scoring calls in flight at once
+RATE_TAU = 10.0      # seconds; time constant of the per-agent rate estimates
+
+FRAME_DECODE = metrics.stage("frame_decode")
+QUEUE_WAIT = metrics.stage("queue_wait")
+SCORE = metrics.stage("score")
+DROPPED = metrics.REGISTRY.counter("ids_agent_windows_dropped_total", "Windows evicted from full agent buffers")
+MALFORMED = metrics.REGISTRY.counter("ids_agent_frames_malformed_total", "Agent frames rejected at ingest")
+
+
+class _DecayingRate:
+    """Events per second, exponentially weighted with time constant tau."""
+    __slots__ = ("tau", "value", "last")
+
+    def __init__(self, tau):
+        self.tau = tau
+        self.value = 0.0
+        self.last = None
+
+    def add(self, now, n=1):
+        if self.last is not None:
+            self.value *= math.exp(-(now - self.last) / self.tau)
+        self.value += n / self.tau
+        self.last = now
+
+    def at(self, now):
+        if self.last is None:
+            return 0.0
+        return self.value * math.exp(-(now - self.last) / self.tau)
+
+
+class AgentSession:
+    """One connected agent: identity, bounded window buffer and counters."""
+
+    def __init__(self, session_id, agent_id, addr, maxsize):
+        self.session_id = session_id
+        self.agent_id = agent_id
+        self.addr = addr
+        self.inbox = deque()  # (received_at, WindowBatch)
+        self.maxsize = maxsize
+        self.connected_at = time.time()
+        self.last_seen = None
+        self.connected = True
+        self.traffic_state = None  # None, "normal" or "abnormal"; for the alert consumer
+        self.frames = 0
+        self.bytes = 0
+        self.flows = 0
+        self.malformed = 0
+        self.dropped = 0
+        self.scored = 0
+        self.window_rate = _DecayingRate(RATE_TAU)
+        self.flow_rate = _DecayingRate(RATE_TAU)
+        self.queue_lag = 0.0   # seconds the last scored window waited in the backend
+        self.window_lag = 0.0  # seconds from the last scored window's end to its alert
+
+
+class AgentRegistry:
+    """
+    Ingestion for many agents with one shared scoring stage.
+
+    serve() runs one ingest loop per agent connection: frames are decoded
+    and appended to that agent's bounded buffer (oldest dropped when full),
+    so receiving never waits on the models. The scoring stage takes windows
+    round-robin, one per agent per pass, until max_rows flows are collected,
+    and hands them to score(batches) -> alerts as a single call on the
+    executor; a burst from one agent therefore only fills its own buffer
+    and gets its fair share of each call. Each alert is passed to
+    emit(session, alert); text messages (alerts the agent already built)
+    go to emit directly. Frames narrower than min_features columns, with a
+    flow key count other than their rows, or with meta the alert builder
+    cannot read are rejected at ingest so they cannot fail a call shared
+    with other agents.
+    """
+
+    def __init__(self, score, emit, executor=None, maxsize=AGENT_QUEUE, max_rows=MAX_ROWS, scorers=SCORERS,
+                 min_features=0):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.score = score
+        self.emit = emit
+        self.executor = executor
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.n_scorers = scorers
+        self.min_features = min_features
+        self.sessions = {}  # session id -> AgentSession
+        self._ids = itertools.count(1)
+        self._turn = 0
+        self._ready = None
+        self._scorers = []
+        self.calls = 0
+        self.windows = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def connect(self, agent_id=None, addr=None):
+        session_id = next(self._ids)
+        addr = f"{addr[0]}:{addr[1]}" if addr else None
+        session = AgentSession(session_id, agent_id or addr or f"agent-{session_id}", addr, self.maxsize)
+        self.sessions[session_id] = session
+        return session
+
+    def disconnect(self, session):
+        """End a session; windows it already sent are still scored."""
+        session.connected = False
+        if not session.inbox:
+            self.sessions.pop(session.session_id, None)
+
+    def start(self):
+        """Start the scoring stage on the running loop (done by serve() on first use)."""
+        if self._scorers:
+            return
+        self._ready = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._scorers = [loop.create_task(self._score_loop()) for _ in range(self.n_scorers)]
+
+    def stop(self):
+        for task in self._scorers:
+            task.cancel()
+        self._scorers = []
+
+    async def serve(self, ws, agent_id=None):
+        """Ingest loop of one accepted agent websocket; returns when it disconnects."""
+        self.start()
+        session = self.connect(agent_id, getattr(ws, "client", None))
+        try:
+            while True:
+                message = await ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    return session
+                self.ingest(session, message)
+        finally:
+            self.disconnect(session)
+
+    def ingest(self, session, message):
+        """Buffer one websocket message of session for scoring (or emit it, if text)."""
+        now = time.time()
+        session.last_seen = now
+        data = message.get("bytes")
+        if data is None:
+            session.frames += 1
+            session.window_rate.add(now)
+            self.emit(session, message["text"])
+            return
+        session.bytes += len(data)
+        try:
+            with FRAME_DECODE.time():
+                batch = decode_batch(data)
+        except WireFormatError as e:
+            session.malformed += 1
+            MALFORMED.inc()
+            log.warning("Dropping malformed frame: %s", e, extra={"agent_id": session.agent_id})
+            return
+        problem = self._frame_problem(batch)
+        if problem:
+            session.malformed += 1
+            MALFORMED.inc()
+            log.warning("Dropping frame: %s", problem, extra={"agent_id": session.agent_id})
+            return
+        if batch.agent_id and session.agent_id == session.addr:
+            session.agent_id = batch.agent_id  # identify agents that connected without a name
+        session.frames += 1
+        session.flows += len(batch.features)
+        session.window_rate.add(now)
+        session.flow_rate.add(now, len(batch.features))
+        if len(session.inbox) >= session.maxsize:
+            session.inbox.popleft()
+            session.dropped += 1
+            DROPPED.inc()
+        session.inbox.append((now, batch))
+        if self._ready is not None:
+            self._ready.set()
+
+    def _frame_problem(self, batch):
+        """Why a decoded frame could fail a shared scoring call, or None."""
+        if batch.features.shape[1] < self.min_features:
+            return f"{batch.features.shape[1]} features, expected {self.min_features}"
+        if batch.keys and len(batch.keys) != len(batch.features):
+            return f"{len(batch.keys)} flow keys for {len(batch.features)} rows"
+        if not isinstance(batch.meta, dict):
+            return "meta is not an object"
+        top_sources = batch.meta.get("top_sources", [])
+        if not isinstance(top_sources, list) or not all(isinstance(t, dict) and "host" in t for t in top_sources):
+            return "top_sources is not a list of {host, ...} objects"
+        return None
+
+    def _take(self):
+        """Pending windows, round-robin over agents, up to max_rows flows."""
+        sessions = [s for s in self.sessions.values() if s.inbox]
+        if not sessions:
+            return []
+        start = self._turn % len(sessions)
+        self._turn += 1
+        sessions = sessions[start:] + sessions[:start]
+        picked, rows = [], 0
+        while sessions and rows < self.max_rows:
+            for session in list(sessions):
+                if not session.inbox:
+                    sessions.remove(session)
+                    continue
+                received_at, batch = session.inbox.popleft()
+                picked.append((session, received_at, batch))
+                if not session.inbox and not session.connected:
+                    self.sessions.pop(session.session_id, None)
+                rows += len(batch.features)
+                if rows >= self.max_rows:
+                    break
+        return picked
+
+    async def _score_loop(self):
+        while True:
+            await self._ready.wait()
+            picked = self._take()
+            if not picked:
+                self._ready.clear()
+                continue
+            self.calls += 1
+            self.windows += len(picked)
+            started = time.time()
+            for _, received_at, _ in picked:
+                QUEUE_WAIT.observe(started - received_at)
+            try:
+                alerts = await run_model(self.executor, self.score, [batch for _, _, batch in picked])
+            except Exception as e:
+                self.errors += 1
+                log.error("Scoring %d windows failed: %r", len(picked), e)
+                continue
+            now = time.time()
+            SCORE.observe(now - started, len(picked))
+            for (session, received_at, batch), alert in zip(picked, alerts):
+                session.scored += 1
+                session.queue_lag = now - received_at
+                if batch.window_end:
+                    session.window_lag = now - batch.window_end
+                try:
+                    self.emit(session, alert)
+                except Exception as e:
+                    log.error("Alert failed: %r", e, extra={"agent_id": session.agent_id})
+
+    def stats(self):
+        """Registry totals plus rate, buffer and lag figures per agent."""
+        now = time.time()
+        agents = []
+        for s in self.sessions.values():
+            agents.append({
+                "agent_id": s.agent_id,
+                "addr": s.addr,
+                "connected": s.connected,
+                "connected_for": round(now - s.connected_at, 3),
+                "last_seen": s.last_seen,
+                "frames": s.frames,
+                "bytes": s.bytes,
+                "flows": s.flows,
+                "windows_per_s": round(s.window_rate.at(now), 3),
+                "flows_per_s": round(s.flow_rate.at(now), 3),
+                "queued": len(s.inbox),
+                "dropped": s.dropped,
+                "malformed": s.malformed,
+                "scored": s.scored,
+                "queue_lag": s.queue_lag,
+                "window_lag": s.window_lag,
+            })
+        return {
+            "agents": sum(s.connected for s in self.sessions.values()),
+            "scoring_calls": self.calls,
+            "windows_scored": self.windows,
+            "mean_windows_per_call": self.windows / self.calls if self.calls else 0.0,
+            "scoring_errors": self.errors,
+            "per_agent": agents,
+        }
@@ -1,11 +1,25 @@
 import os
-import joblib
+import atexit
 import asyncio
-import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+import logging
+import time
+import numpy as np
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from utils import FEATURE_ORDER, preprocess_features
+import logs
+import metrics
+from utils import FEATURE_ORDER, window_alert
+from feature_schema import FLOW_SCHEMA
+from model_registry import ModelRegistry, MODELS_DIR
+from broadcast import BroadcastHub, CLIENT_QUEUE, POLICY
+from agent_registry import AgentRegistry, AGENT_QUEUE
+from database import init_db, EventWriter, query_events, timeline, label_events, PAGE_SIZE
+from inference import (BatchScheduler, make_executor, run_model, rows_from_ndjson, rows_from_frame,
+                       MAX_BATCH, MAX_WAIT, EXECUTOR, WORKERS)
+
+logs.configure()
+log = logging.getLogger("app")
 
 # -----------------------------
 # FASTAPI SETUP
@@ -22,25 +36,78 @@ app.add_middleware(
 # -----------------------------
 # LOAD MODELS & SCALER
 # -----------------------------
-MODELS_DIR = "models"
+# Models are swapped in place when their files change (or on POST /admin/models/reload)
+models = ModelRegistry(os.environ.get("IDS_MODELS_DIR", MODELS_DIR))
 try:
-    rf_model = joblib.load(os.path.join(MODELS_DIR, "rf_model.joblib"))
-    xgb_model = joblib.load(os.path.join(MODELS_DIR, "xgb_model.joblib"))
-    scaler = joblib.load(os.path.join(MODELS_DIR, "scaler.joblib"))
+    models.reload()
 except FileNotFoundError as e:
-    raise FileNotFoundError(
-        f"Missing model/scaler file: {e.filename}. Make sure models exist in {MODELS_DIR}"
-    )
+    raise FileNotFoundError(f"{e}. Make sure models exist in {models.models_dir}") from None
+models.watch()
 
 # -----------------------------
 # PREDICTION FUNCTION
 # -----------------------------
-def predict_intrusion(features: dict):
-    """Accepts dict of features, preprocesses, scales, and predicts."""
-    processed = preprocess_features(features, scaler)
-    rf_pred = rf_model.predict(processed)
-    xgb_pred = xgb_model.predict(processed)
-    return {"rf_pred": rf_pred.tolist(), "xgb_pred": xgb_pred.tolist()}
+def score(X):
+    """Scores a (rows x FEATURE_ORDER) matrix with the live models, see ModelSet.score."""
+    return models.current.score(X)
+
+def predict_rows(X):
+    """
+    Predicts a (rows x FEATURE_ORDER) matrix; one {"rf_pred", "xgb_pred"}
+    result per row (rf_pred is None without an RF model).
+    """
+    rf_pred, proba = score(X)
+    rf_pred = rf_pred.tolist() if rf_pred is not None else [None] * len(proba)
+    return [{"rf_pred": [r] if r is not None else None, "xgb_pred": [x]}
+            for r, x in zip(rf_pred, proba.argmax(axis=1).tolist())]
+
+def model_features():
+    """Feature names /predict and /predict/bulk take, in order: the agents' FEATURE_ORDER."""
+    return FEATURE_ORDER
+
+# Models run on this pool so predictions never block the websockets
+executor = make_executor(os.environ.get("IDS_EXECUTOR", EXECUTOR), int(os.environ.get("IDS_WORKERS", WORKERS)))
+# Concurrent /predict requests share one batched model call
+predict_scheduler = BatchScheduler(predict_rows, MAX_BATCH, MAX_WAIT, executor)
+BULK_CHUNK = 65536  # rows per model call for /predict/bulk
+
+def predict_batch(X):
+    """
+    Scores a (rows x features) matrix in one call per model.
+    Returns (rf labels, xgb labels, xgb class probabilities).
+    """
+    rf_pred, proba = score(X)
+    return rf_pred, proba.argmax(axis=1), proba
+
+def alerts_from_batches(batches):
+    """
+    Scores every flow of several agent window frames in one model call and
+    summarizes each window as one alert (with its riskiest flow's features
+    for the event store). Columns past FEATURE_ORDER (zero pads from older
+    agents) are dropped, so frames of any width mix.
+    """
+    sizes = [len(batch.features) for batch in batches]
+    width = len(FEATURE_ORDER)
+    X, labels, proba = np.zeros((0, width), dtype=np.float32), np.zeros(0, dtype=int), np.zeros((0, 1))
+    if sum(sizes):
+        X = np.concatenate([batch.features[:, :width] for batch in batches if len(batch.features)])
+        _, labels, proba = predict_batch(X)
+    alerts = []
+    bounds = np.cumsum([0] + sizes)
+    for batch, lo, hi in zip(batches, bounds[:-1], bounds[1:]):
+        top_sources = batch.meta.get("top_sources", [])
+        alerts.append(window_alert(
+            batch.keys, labels[lo:hi], proba[lo:hi], X[lo:hi],
+            src_ip=top_sources[0]["host"] if top_sources else "unknown",
+            timestamp=batch.window_end or time.time(),
+            agent_id=batch.agent_id,
+            top_sources=top_sources,
+        ))
+    return alerts
+
+def alert_from_batch(batch):
+    """Scores every flow of an agent window frame and summarizes it as one alert."""
+    return alerts_from_batches([batch])[0]
 
 # -----------------------------
 # MANUAL FEATURE PREDICTION
@@ -49,9 +116,132 @@ def predict_intrusion(features: dict):
 async def manual_predict(features: dict):
     if "features" not in features:
         return JSONResponse(content={"error": "Missing 'features' key"}, status_code=400)
-    preds = predict_intrusion(features["features"])
+    try:
+        row = FLOW_SCHEMA.vector(features["features"])
+    except KeyError as e:
+        return JSONResponse(content={"error": f"Missing feature {e}"}, status_code=400)
+    except (TypeError, ValueError) as e:
+        return JSONResponse(content={"error": f"Invalid features: {e}"}, status_code=400)
+    preds = await predict_scheduler.submit(row)
     return JSONResponse(content=preds)
 
+@app.post("/predict/bulk")
+async def bulk_predict(request: Request):
+    """
+    Scores many feature vectors in one request. The body is either NDJSON
+    (one object keyed by feature name, or one array in model feature order,
+    per line) or, with Content-Type application/octet-stream, a float32
+    matrix in an IDSW frame whose optional meta {"features": [...]} names
+    its columns. Returns per-row labels and XGBoost class probabilities.
+    """
+    body = await request.body()
+    feature_names = model_features()
+    binary = request.headers.get("content-type", "").startswith("application/octet-stream")
+    try:
+        parse = rows_from_frame if binary else rows_from_ndjson
+        X = await asyncio.to_thread(parse, body, feature_names)
+    except ValueError as e:  # includes WireFormatError
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    if len(X) and X.shape[1] < len(feature_names):
+        return JSONResponse(content={"error": f"Expected {len(feature_names)} features, got {X.shape[1]}"},
+                            status_code=400)
+
+    rf_pred, xgb_pred, proba = [], [], []
+    for start in range(0, len(X), BULK_CHUNK):
+        rf, xgb, p = await run_model(executor, predict_batch, X[start:start + BULK_CHUNK])
+        rf_pred.append(rf)
+        xgb_pred.append(xgb)
+        proba.append(p)
+    if not rf_pred:
+        return JSONResponse(content={"n": 0, "rf_pred": [], "xgb_pred": [], "proba": []})
+    return JSONResponse(content={
+        "n": len(X),
+        "rf_pred": None if any(r is None for r in rf_pred) else np.concatenate(rf_pred).tolist(),
+        "xgb_pred": np.concatenate(xgb_pred).tolist(),
+        "proba": np.round(np.concatenate(proba), 6).tolist(),
+    })
+
+# -----------------------------
+# HISTORY
+# -----------------------------
+@app.get("/events")
+async def list_events(start: float = None, end: float = None, label: int = None, cluster: int = None,
+                      min_risk: float = None, agent_id: str = None, cursor: str = None, limit: int = PAGE_SIZE):
+    """
+    Stored events in [start, end) (unix seconds), newest first. Follow
+    next_cursor for older pages.
+    """
+    try:
+        events, next_cursor = await asyncio.to_thread(
+            query_events, None, start, end, label, cluster, min_risk, agent_id, cursor, limit,
+        )
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return {"events": events, "next_cursor": next_cursor}
+
+@app.get("/results")
+async def results(limit: int = PAGE_SIZE):
+    """Most recent stored events (the dashboard's fetchResults)."""
+    return await list_events(limit=limit)
+
+@app.get("/timeline")
+async def event_timeline(start: float = None, end: float = None, buckets: int = 100, bucket: float = None,
+                         label: int = None, cluster: int = None, min_risk: float = None, agent_id: str = None):
+    """
+    Fixed-width buckets over [start, end) (default: the last hour) with
+    event count, max risk and per-label counts, for charts over long ranges.
+    """
+    end = time.time() if end is None else end
+    start = end - 3600 if start is None else start
+    try:
+        return await asyncio.to_thread(
+            timeline, None, start, end, buckets, bucket, label, cluster, min_risk, agent_id,
+        )
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+# -----------------------------
+# MODEL ADMIN
+# -----------------------------
+ADMIN_TOKEN = os.environ.get("IDS_ADMIN_TOKEN")  # if set, required in X-Admin-Token
+
+@app.get("/models")
+async def model_info():
+    return models.info()
+
+def _forbidden(request):
+    if ADMIN_TOKEN and request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        return JSONResponse(content={"error": "Invalid admin token"}, status_code=403)
+    return None
+
+@app.post("/admin/models/reload")
+async def reload_models(request: Request):
+    """Load the model files now; the old models stay live if they fail to load."""
+    denied = _forbidden(request)
+    if denied is not None:
+        return denied
+    try:
+        await asyncio.to_thread(models.reload)
+    except Exception as e:
+        return JSONResponse(content={"error": f"{type(e).__name__}: {e}", **models.info()}, status_code=409)
+    return models.info()
+
+@app.post("/admin/events/label")
+async def label_stored_events(request: Request):
+    """
+    Record the true class of stored events, body {"ids": [...], "label": n};
+    incremental_train.py learns from the labeled events.
+    """
+    denied = _forbidden(request)
+    if denied is not None:
+        return denied
+    try:
+        body = await request.json()
+        ids, label = [int(i) for i in body["ids"]], int(body["label"])
+    except (KeyError, TypeError, ValueError) as e:
+        return JSONResponse(content={"error": f"Expected {{\"ids\": [...], \"label\": n}}: {e}"}, status_code=400)
+    return {"labeled": await asyncio.to_thread(label_events, ids, label)}
+
 # -----------------------------
 # HEALTH CHECK
 # -----------------------------
@@ -62,74 +252,120 @@ async def health():
 # -----------------------------
 # LIVE WEBSOCKET
 # -----------------------------
-frontend_clients = set()
-agent_client = None
+hub = BroadcastHub(
+    int(os.environ.get("IDS_CLIENT_QUEUE", CLIENT_QUEUE)),
+    os.environ.get("IDS_SLOW_CLIENT_POLICY", POLICY),
+)
 
-@app.websocket("/ws/frontend")
-async def frontend_ws(ws: WebSocket):
-    await ws.accept()
-    frontend_clients.add(ws)
-    print(f"[INFO] Frontend connected: {ws.client}")
-    try:
-        while True:
-            await asyncio.sleep(1)  # keep connection alive
-    except WebSocketDisconnect:
-        print(f"[INFO] Frontend disconnected: {ws.client}")
-        frontend_clients.remove(ws)
+# Every scored window is stored; inserts are batched on the writer's thread
+init_db()
+event_writer = EventWriter().start()
+atexit.register(event_writer.close)
 
+def publish_alert(session, alert):
+    """
+    Persist one agent's alert and forward it to the frontends; normal
+    traffic is forwarded only once until it turns abnormal.
+    """
+    event_writer.add(alert, agent_id=session.agent_id)
+    if isinstance(alert, str):
+        hub.publish(alert)  # alert already built by the agent
+        return
+    if "features" in alert:
+        alert = {k: v for k, v in alert.items() if k != "features"}  # stored, not sent to dashboards
+    if alert["alert_type"] == "Normal Traffic":
+        if session.traffic_state == "normal":
+            return
+        session.traffic_state = "normal"
+    else:
+        session.traffic_state = "abnormal"
+    hub.publish(alert)
 
-# -----------------------------
-# LIVE WEBSOCKET
-# -----------------------------
-frontend_clients = set()
-agent_client = None
+# Every agent's windows are scored together, see AgentRegistry
+agents = AgentRegistry(
+    alerts_from_batches, publish_alert, executor,
+    maxsize=int(os.environ.get("IDS_AGENT_QUEUE", AGENT_QUEUE)),
+    min_features=models.current.input_width,
+)
+
+def _models_swapped(new_models):
+    agents.min_features = new_models.input_width
+
+models.on_swap = _models_swapped
+
+@app.get("/broadcast/stats")
+async def broadcast_stats():
+    return hub.stats()
+
+@app.get("/events/stats")
+async def event_stats():
+    return event_writer.stats()
+
+@app.get("/agents")
+async def agent_stats():
+    return agents.stats()
+
+def _peer(ws):
+    return f"{ws.client.host}:{ws.client.port}" if ws.client else None
 
 @app.websocket("/ws/frontend")
 async def frontend_ws(ws: WebSocket):
     await ws.accept()
-    frontend_clients.add(ws)
-    print(f"[INFO] Frontend connected: {ws.client}")
-    try:
-        while True:
-            await asyncio.sleep(1)  # keep connection alive
-    except WebSocketDisconnect:
-        print(f"[INFO] Frontend disconnected: {ws.client}")
-        frontend_clients.remove(ws)
+    log.info("Frontend connected", extra={"client": _peer(ws)})
+    await hub.serve(ws)
+    log.info("Frontend disconnected", extra={"client": _peer(ws)})
 
 @app.websocket("/ws/agent")
 async def agent_ws(ws: WebSocket):
+    """One connection per agent; ?agent_id=<name> identifies it (binary frames carry it too)."""
     await ws.accept()
-    global agent_client
-    agent_client = ws
-    print(f"[INFO] Agent connected: {ws.client}")
-
+    agent_id = ws.query_params.get("agent_id")
+    log.info("Agent connected", extra={"client": _peer(ws), "agent_id": agent_id})
     try:
-        while True:
-            data = await ws.receive_text()  # receive alert from agent
-            print("[DEBUG] Received from agent:", data)
-
-            # Broadcast to all connected frontend clients
-            disconnected = []
-            for client in frontend_clients:
-                try:
-                    await client.send_text(data)  # data is already JSON string
-                    print(f"[DEBUG] Sent to frontend {client.client}: {str(data)[:100]}...")
-                except WebSocketDisconnect:
-                    disconnected.append(client)
-            # Remove disconnected frontends
-            for d in disconnected:
-                frontend_clients.remove(d)
-
+        await agents.serve(ws, agent_id)
+        log.info("Agent disconnected", extra={"client": _peer(ws), "agent_id": agent_id})
     except WebSocketDisconnect:
-        print(f"[INFO] Agent disconnected: {ws.client}")
-        agent_client = None
+        log.info("Agent disconnected", extra={"client": _peer(ws), "agent_id": agent_id})
     except Exception as e:
-        print(f"[ERROR] WS error: {e}")
-        agent_client = None
+        log.error("WS error: %s", e, extra={"client": _peer(ws), "agent_id": agent_id})
         await ws.close()
 
+# -----------------------------
+# METRICS
+# -----------------------------
+# Stage latencies and counters are recorded where the work happens (see
+# metrics.stage); queue depths and totals are read from the components
+# when Prometheus scrapes
+def _agent_depths():
+    depths = {}
+    for session in list(agents.sessions.values()):
+        depths[session.agent_id] = depths.get(session.agent_id, 0) + len(session.inbox)
+    return depths
+
+def _client_depths():
+    return [len(client.queue) for client in list(hub.clients.values())]
 
+_callbacks = [
+    ("ids_agents_connected", "Connected agents", lambda: agents.stats()["agents"], "gauge"),
+    ("ids_agent_queue_depth", "Windows waiting to be scored per agent", _agent_depths, "gauge", ["agent_id"]),
+    ("ids_scoring_errors_total", "Failed shared scoring calls", lambda: agents.errors, "counter"),
+    ("ids_broadcast_clients", "Connected frontend clients", lambda: len(hub), "gauge"),
+    ("ids_broadcast_queue_depth", "Messages queued for all frontend clients", lambda: sum(_client_depths()), "gauge"),
+    ("ids_broadcast_max_client_queue", "Deepest frontend client queue", lambda: max(_client_depths(), default=0),
+     "gauge"),
+    ("ids_event_writer_backlog", "Alerts waiting to be written", lambda: len(event_writer), "gauge"),
+    ("ids_events_written_total", "Events written to the database", lambda: event_writer.written, "counter"),
+    ("ids_events_dropped_total", "Alerts dropped from a full write backlog", lambda: event_writer.dropped, "counter"),
+    ("ids_predict_pending", "Rows waiting for a /predict batch", lambda: predict_scheduler.stats()["pending"], "gauge"),
+    ("ids_model_version", "Version of the live models", lambda: models.current.version, "gauge"),
+]
+for name, help, fn, kind, *labelnames in _callbacks:
+    metrics.REGISTRY.callback(name, help, fn, *labelnames, kind=kind)
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms, throughput counters and queue depths in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 # -----------------------------
@@ -137,5 +373,5 @@ async def agent_ws(ws: WebSocket):
 # -----------------------------
 if __name__ == "__main__":
     import uvicorn
-    print("[INFO] Starting FastAPI backend on http://127.0.0.1:8000")
+    log.info("Starting FastAPI backend on http://127.0.0.1:8000")
     uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
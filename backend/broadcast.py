@@ -0,0 +1,189 @@
+import asyncio
+import json
+import time
+from collections import deque
+import metrics
+
+# -----------------------
+# CONFIG
+# -----------------------
+CLIENT_QUEUE = 64     # outbound messages buffered per client
+POLICY = "drop_oldest"  # what to do when a client's queue is full
+SEND_TIMEOUT = 5.0    # seconds one send may take before the client is dropped
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "conflate", "disconnect")
+
+BROADCAST = metrics.stage("broadcast")
+SEND_QUEUE_WAIT = metrics.stage("broadcast_queue_wait")
+WS_SEND = metrics.stage("ws_send")
+DROPPED = metrics.REGISTRY.counter("ids_broadcast_dropped_total", "Messages dropped for slow frontend clients")
+
+
+class _Client:
+    """Outbound queue, writer task and lag counters of one subscriber."""
+
+    def __init__(self, ws, maxsize):
+        self.ws = ws
+        self.queue = deque()  # (enqueued_at, message)
+        self.maxsize = maxsize
+        self.ready = asyncio.Event()
+        self.writer = None
+        self.closed = False
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+
+class BroadcastHub:
+    """
+    Fan-out of messages to many websocket clients.
+
+    publish() never waits on a client: the message is serialized once and
+    the same string is appended to every client's bounded queue, and each
+    client has its own writer task that drains its queue. A slow or stuck
+    client therefore only delays itself. When a client's queue is full the
+    policy decides what happens:
+
+    - "drop_oldest": evict the client's oldest queued message
+    - "conflate": replace everything queued with the newest message, so a
+      client that falls behind skips straight to the current state
+    - "disconnect": close the client
+    """
+
+    def __init__(self, maxsize=CLIENT_QUEUE, policy=POLICY, send_timeout=SEND_TIMEOUT):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy '{policy}', expected one of {SLOW_CLIENT_POLICIES}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.clients = {}  # ws -> _Client
+        self.published = 0
+        self.disconnected = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def add(self, ws):
+        """Register an accepted websocket and start its writer task."""
+        client = _Client(ws, self.maxsize)
+        client.writer = asyncio.get_running_loop().create_task(self._write(client))
+        self.clients[ws] = client
+        return client
+
+    def remove(self, ws):
+        client = self.clients.pop(ws, None)
+        if client is not None and not client.closed:
+            client.closed = True
+            client.writer.cancel()
+
+    async def serve(self, ws):
+        """
+        Register ws and hold the connection until the client goes away or
+        is dropped by the hub. Incoming messages are read and discarded, which
+        is how a closed browser tab is noticed.
+        """
+        client = self.add(ws)
+        reader = asyncio.get_running_loop().create_task(self._read(ws))
+        try:
+            await asyncio.wait({reader, client.writer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            reader.cancel()
+            self.remove(ws)
+
+    @staticmethod
+    async def _read(ws):
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    def publish(self, message):
+        """Queue message (a JSON string, or an object to serialize) for every client."""
+        start = time.perf_counter()
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        self.published += 1
+        now = time.monotonic()
+        for client in list(self.clients.values()):
+            queue = client.queue
+            if len(queue) >= client.maxsize:
+                if self.policy == "disconnect":
+                    self._drop(client)
+                    continue
+                if self.policy == "conflate":
+                    client.dropped += len(queue)
+                    DROPPED.inc(len(queue))
+                    queue.clear()
+                else:
+                    queue.popleft()
+                    client.dropped += 1
+                    DROPPED.inc()
+            queue.append((now, message))
+            client.ready.set()
+        BROADCAST.observe(time.perf_counter() - start, len(self.clients))
+
+    def _drop(self, client):
+        self.disconnected += 1
+        self.remove(client.ws)
+        asyncio.get_running_loop().create_task(self._close(client.ws))
+
+    @staticmethod
+    async def _close(ws):
+        try:
+            await ws.close()
+        except Exception:
+            pass  # already gone
+
+    async def _write(self, client):
+        queue, ws = client.queue, client.ws
+        try:
+            while True:
+                await client.ready.wait()
+                while queue:
+                    enqueued_at, message = queue.popleft()
+                    started = time.monotonic()
+                    await asyncio.wait_for(ws.send_text(message), self.send_timeout)
+                    client.sent += 1
+                    now = time.monotonic()
+                    SEND_QUEUE_WAIT.observe(started - enqueued_at)
+                    WS_SEND.observe(now - started)
+                    client.last_lag = now - enqueued_at
+                    client.max_lag = max(client.max_lag, client.last_lag)
+                client.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Disconnected, timed out or failed: only this client is affected
+            if not client.closed:
+                self.disconnected += 1
+                client.closed = True
+                self.clients.pop(ws, None)
+                await self._close(ws)
+
+    def stats(self):
+        """Hub totals plus queue depth, drops and lag (seconds) per client."""
+        now = time.monotonic()
+        clients = []
+        for client in self.clients.values():
+            addr = getattr(client.ws, "client", None)
+            clients.append({
+                "client": f"{addr[0]}:{addr[1]}" if addr else None,
+                "connected_for": round(time.time() - client.connected_at, 3),
+                "queued": len(client.queue),
+                "sent": client.sent,
+                "dropped": client.dropped,
+                "lag": now - client.queue[0][0] if client.queue else 0.0,
+                "last_lag": client.last_lag,
+                "max_lag": client.max_lag,
+            })
+        return {
+            "policy": self.policy,
+            "clients": len(self.clients),
+            "published": self.published,
+            "disconnected": self.disconnected,
+            "per_client": clients,
+        }
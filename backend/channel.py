@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from collections import deque
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class BoundedChannel:
+    """
+    Bounded handoff from a producer thread to an asyncio consumer.
+
+    put() is called from the capture thread and wakes the consumer's event
+    loop directly (call_soon_threadsafe) instead of being polled. When the
+    channel is full the overflow policy decides what happens:
+
+    - "drop_oldest": evict the oldest item to make room (freshest data wins)
+    - "drop_newest": discard the item being put
+    - "block": wait until the consumer frees a slot
+    """
+
+    def __init__(self, maxsize=256, policy="drop_oldest"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._loop = None
+        self._waiter = None
+        self._closed = False
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, timeout=None):
+        """
+        Enqueue from any thread. Returns False if the item was dropped
+        (drop_newest, a closed channel, or a block that timed out).
+        """
+        with self._not_full:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                if self.policy == "drop_oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    if not self._not_full.wait_for(
+                        lambda: len(self._items) < self.maxsize or self._closed, timeout
+                    ) or self._closed:
+                        self.dropped += 1
+                        return False
+            self._items.append(item)
+            self.enqueued += 1
+            if len(self._items) > self.max_depth:
+                self.max_depth = len(self._items)
+            waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            self._loop.call_soon_threadsafe(_wake, waiter)
+        return True
+
+    def close(self):
+        """Stop accepting items; get() returns None once the channel is drained."""
+        with self._not_full:
+            self._closed = True
+            self._not_full.notify_all()
+            waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            self._loop.call_soon_threadsafe(_wake, waiter)
+
+    def _pop(self):
+        item = self._items.popleft()
+        self.dequeued += 1
+        self._not_full.notify()
+        return item
+
+    def get_nowait(self):
+        """Return the next item, or None if the channel is empty."""
+        with self._not_full:
+            return self._pop() if self._items else None
+
+    async def get(self):
+        """Wait for the next item; returns None when the channel is closed and empty."""
+        while True:
+            with self._not_full:
+                if self._items:
+                    return self._pop()
+                if self._closed:
+                    return None
+                self._loop = asyncio.get_running_loop()
+                waiter = self._waiter = self._loop.create_future()
+            await waiter
+
+    def stats(self):
+        """Backpressure counters."""
+        return {
+            "depth": len(self._items),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "dropped": self.dropped,
+            "max_depth": self.max_depth,
+        }
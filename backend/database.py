@@ -1,9 +1,57 @@
-from sqlalchemy import create_engine, Column, Integer, Float, JSON
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import (create_engine, event, inspect, text, select, func, tuple_, and_, cast,
+                        Column, Index, Integer, Float, String, JSON)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import metrics
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# CONFIG
+# -----------------------
+DB_URL = os.environ.get("IDS_DATABASE_URL", "sqlite:///instance/database.db")
+FLUSH_ROWS = 500       # events per INSERT transaction
+FLUSH_INTERVAL = 1.0   # seconds a buffered event may wait for a flush
+MAX_BACKLOG = 50000    # events buffered before the oldest are dropped
+PAGE_SIZE = 100        # default events per /events page
+MAX_PAGE_SIZE = 1000
+MAX_BUCKETS = 2000     # timeline buckets per request
+
+DB_FLUSH = metrics.stage("db_flush")
+
+# Applied to every SQLite connection: WAL lets readers run during batch
+# writes, and with WAL synchronous=NORMAL only syncs at checkpoints
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -16000,  # KiB
+    "busy_timeout": 5000,  # ms
+}
 
 Base = declarative_base()
-engine = create_engine('sqlite:///instance/database.db', echo=True)
+
+
+def make_engine(url=DB_URL):
+    engine = create_engine(url, echo=False)
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine)
 
 class Event(Base):
@@ -15,6 +63,298 @@ class Event(Base):
     cluster = Column(Integer)
     risk = Column(Float)
     features = Column(JSON)
+    timestamp = Column(Float)
+    agent_id = Column(String)
+    alert_type = Column(String)
+    src_ip = Column(String)
+    n_flows = Column(Integer)
+    description = Column(String)
+    top_sources = Column(JSON)
+    verified_label = Column(Integer)  # the true class, set by an analyst (label_events)
+    labeled_at = Column(Float)
+
+    # SQLite appends the rowid (id) to every index entry, so these also
+    # serve the (timestamp, id) keyset order within each filter
+    __table_args__ = (
+        Index("ix_events_timestamp", "timestamp"),
+        Index("ix_events_label_timestamp", "label", "timestamp"),
+        Index("ix_events_cluster_timestamp", "cluster", "timestamp"),
+        Index("ix_events_labeled_at", "labeled_at"),
+    )
+
+def init_db(bind=None):
+    """Create the tables and add columns that older database files lack."""
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    existing = {c["name"] for c in inspect(bind).get_columns(Event.__tablename__)}
+    with bind.begin() as conn:
+        for column in Event.__table__.columns:
+            if column.name not in existing:
+                conn.execute(text(
+                    f"ALTER TABLE {Event.__tablename__} ADD COLUMN {column.name} "
+                    f"{column.type.compile(bind.dialect)}"
+                ))
+    for index in Event.__table__.indexes:
+        index.create(bind, checkfirst=True)
+
+
+_EVENT_COLUMNS = [c.name for c in Event.__table__.columns if c.name != "id"]
+
+
+def event_row(alert, defaults=None):
+    """Map a scored-window alert (dict or JSON string) to an events row; defaults fill empty fields."""
+    if isinstance(alert, (str, bytes)):
+        alert = json.loads(alert)
+    row = {name: alert.get(name) for name in _EVENT_COLUMNS}
+    for name, value in (defaults or {}).items():
+        if not row.get(name):
+            row[name] = value
+    return row
+
+
+def _filters(start, end, label, cluster, min_risk, agent_id):
+    table = Event.__table__
+    clauses = [table.c.timestamp.is_not(None)]
+    if start is not None:
+        clauses.append(table.c.timestamp >= start)
+    if end is not None:
+        clauses.append(table.c.timestamp < end)
+    if label is not None:
+        clauses.append(table.c.label == label)
+    if cluster is not None:
+        clauses.append(table.c.cluster == cluster)
+    if min_risk is not None:
+        clauses.append(table.c.risk >= min_risk)
+    if agent_id is not None:
+        clauses.append(table.c.agent_id == agent_id)
+    return clauses
+
+
+def encode_cursor(row):
+    return f"{row['timestamp']!r}:{row['id']}"
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, id_ = cursor.rsplit(":", 1)
+        return float(timestamp), int(id_)
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'") from None
+
+
+def query_events(bind=None, start=None, end=None, label=None, cluster=None, min_risk=None, agent_id=None,
+                 cursor=None, limit=PAGE_SIZE):
+    """
+    One page of events in [start, end), newest first, with optional
+    filters. Pages are keyset-paginated on (timestamp, id): pass the
+    returned next_cursor to get the following page, which costs the same
+    however deep it is. Returns (rows, next_cursor or None).
+    """
+    bind = bind or engine
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    table = Event.__table__
+    clauses = _filters(start, end, label, cluster, min_risk, agent_id)
+    if cursor is not None:
+        clauses.append(tuple_(table.c.timestamp, table.c.id) < decode_cursor(cursor))
+    query = (select(table).where(and_(*clauses))
+             .order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(limit + 1))
+    with bind.connect() as conn:
+        rows = [dict(row._mapping) for row in conn.execute(query)]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def timeline(bind=None, start=None, end=None, buckets=None, bucket=None, label=None, cluster=None,
+             min_risk=None, agent_id=None):
+    """
+    Downsampled history: [start, end) split into equal buckets (bucket
+    seconds wide, or `buckets` of them), each with its event count, max
+    risk and count per label. Aggregated by one GROUP BY in the database,
+    so the result size depends on the bucket count, not on the events.
+    """
+    bind = bind or engine
+    if start is None or end is None or end <= start:
+        raise ValueError("Need start < end")
+    if bucket is not None and bucket <= 0:
+        raise ValueError(f"bucket must be positive, got {bucket}")
+    if buckets is not None and buckets <= 0:
+        raise ValueError(f"buckets must be positive, got {buckets}")
+    if bucket is None:
+        bucket = (end - start) / (buckets or 100)
+    n = math.ceil((end - start) / bucket)
+    if not 1 <= n <= MAX_BUCKETS:
+        raise ValueError(f"Between 1 and {MAX_BUCKETS} buckets allowed, got {n}")
+    table = Event.__table__
+    index = cast((table.c.timestamp - start) / bucket, Integer).label("bucket")
+    query = (select(index, table.c.label, func.count(), func.max(table.c.risk))
+             .where(and_(*_filters(start, end, label, cluster, min_risk, agent_id)))
+             .group_by(index, table.c.label))
+    out = [{"start": start + i * bucket, "count": 0, "max_risk": None, "labels": {}} for i in range(n)]
+    with bind.connect() as conn:
+        for i, label_, count, max_risk in conn.execute(query):
+            entry = out[min(i, n - 1)]
+            entry["count"] += count
+            entry["labels"][str(label_)] = entry["labels"].get(str(label_), 0) + count
+            if max_risk is not None and (entry["max_risk"] is None or max_risk > entry["max_risk"]):
+                entry["max_risk"] = max_risk
+    return {"start": start, "end": end, "bucket": bucket, "buckets": out}
+
+
+def label_events(ids, label, bind=None, labeled_at=None):
+    """
+    Record the true class of stored events (an analyst's verdict), which
+    incremental training learns from. Returns the number of events updated.
+    """
+    bind = bind or engine
+    table = Event.__table__
+    labeled_at = time.time() if labeled_at is None else labeled_at
+    with bind.begin() as conn:
+        result = conn.execute(table.update().where(table.c.id.in_(list(ids)))
+                              .values(verified_label=int(label), labeled_at=labeled_at))
+    return result.rowcount
+
+
+def iter_labeled_events(bind=None, after=None, page_size=MAX_PAGE_SIZE):
+    """
+    Events labeled after the (labeled_at, id) position `after`, oldest
+    verdict first, read in keyset-paginated pages. Yields (id, labeled_at,
+    verified_label, features) rows; features is None for events stored
+    without them.
+    """
+    bind = bind or engine
+    table = Event.__table__
+    position = tuple(after) if after is not None else None
+    while True:
+        clauses = [table.c.labeled_at.is_not(None)]
+        if position is not None:
+            clauses.append(tuple_(table.c.labeled_at, table.c.id) > position)
+        query = (select(table.c.id, table.c.labeled_at, table.c.verified_label, table.c.features)
+                 .where(and_(*clauses)).order_by(table.c.labeled_at, table.c.id).limit(page_size))
+        with bind.connect() as conn:
+            rows = conn.execute(query).all()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        position = (rows[-1].labeled_at, rows[-1].id)
+
+
+class EventWriter:
+    """
+    Write-behind persistence of alerts.
+
+    add() only appends to an in-memory buffer, so it is safe to call from
+    the event loop on the live alert path. A writer thread turns buffered
+    alerts into rows and inserts them with one executemany per transaction,
+    as soon as flush_rows are waiting or flush_interval seconds after the
+    oldest arrived. At most max_backlog alerts are buffered; when the
+    database falls further behind, the oldest are dropped and counted.
+    """
+
+    def __init__(self, bind=None, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL, max_backlog=MAX_BACKLOG):
+        if flush_rows < 1 or max_backlog < flush_rows:
+            raise ValueError("Need 1 <= flush_rows <= max_backlog")
+        self.bind = bind or engine
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self._items = deque()  # (added_at, alert, defaults)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.added = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_seconds = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, alert, **defaults):
+        """
+        Buffer one alert (dict or JSON string) and column values for fields
+        it leaves empty; never blocks on the database.
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.max_backlog:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append((time.monotonic(), alert, defaults))
+            self.added += 1
+            if len(self._items) in (1, self.flush_rows):
+                self._cond.notify()  # start the flush timer, or flush now
+        return True
+
+    def _ready(self):
+        return self._closed or len(self._items) >= self.flush_rows
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ready():
+                    if self._items:
+                        timeout = self._items[0][0] + self.flush_interval - time.monotonic()
+                        if timeout <= 0:
+                            break
+                        self._cond.wait(timeout)
+                    else:
+                        self._cond.wait()
+                n = min(len(self._items), self.flush_rows)
+                batch = [self._items.popleft()[1:] for _ in range(n)]
+                done = self._closed and not self._items
+            if batch:
+                self._flush(batch)
+            if done:
+                return
+
+    def _flush(self, alerts):
+        start = time.perf_counter()
+        rows = []
+        for alert, defaults in alerts:
+            try:
+                rows.append(event_row(alert, defaults))
+            except (ValueError, AttributeError) as e:
+                self.failed += 1
+                log.warning("Not persisting malformed alert: %s", e)
+        if not rows:
+            return
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(Event.__table__.insert(), rows)
+        except Exception as e:
+            self.failed += len(rows)
+            log.error("Writing %d events failed: %s", len(rows), e)
+            return
+        self.written += len(rows)
+        self.batches += 1
+        self.last_flush_seconds = time.perf_counter() - start
+        DB_FLUSH.observe(self.last_flush_seconds, len(rows))
+
+    def close(self, timeout=10.0):
+        """Flush everything buffered, then stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+    def stats(self):
+        return {
+            "buffered": len(self._items),
+            "added": self.added,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
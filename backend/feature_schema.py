@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# -----------------------
+# CONFIG
+# -----------------------
+SCHEMA_VERSION = 1
+SCHEMA_FILE = "feature_schema.json"  # saved next to the scaler
+
+# The 78 CIC-IDS2017 flow features, in the order flow_table.Flow.values()
+# produces them, agents send them and the models are trained on
+FLOW_FEATURES = (
+    "destination port",
+    "flow duration",
+    "total fwd packets",
+    "total backward packets",
+    "total length of fwd packets",
+    "total length of bwd packets",
+    "fwd packet length max",
+    "fwd packet length min",
+    "fwd packet length mean",
+    "fwd packet length std",
+    "bwd packet length max",
+    "bwd packet length min",
+    "bwd packet length mean",
+    "bwd packet length std",
+    "flow bytes/s",
+    "flow packets/s",
+    "flow iat mean",
+    "flow iat std",
+    "flow iat max",
+    "flow iat min",
+    "fwd iat total",
+    "fwd iat mean",
+    "fwd iat std",
+    "fwd iat max",
+    "fwd iat min",
+    "bwd iat total",
+    "bwd iat mean",
+    "bwd iat std",
+    "bwd iat max",
+    "bwd iat min",
+    "fwd psh flags",
+    "bwd psh flags",
+    "fwd urg flags",
+    "bwd urg flags",
+    "fwd header length",
+    "bwd header length",
+    "fwd packets/s",
+    "bwd packets/s",
+    "min packet length",
+    "max packet length",
+    "packet length mean",
+    "packet length std",
+    "packet length variance",
+    "fin flag count",
+    "syn flag count",
+    "rst flag count",
+    "psh flag count",
+    "ack flag count",
+    "urg flag count",
+    "cwe flag count",
+    "ece flag count",
+    "down/up ratio",
+    "average packet size",
+    "avg fwd segment size",
+    "avg bwd segment size",
+    "fwd header length.1",
+    "fwd avg bytes/bulk",
+    "fwd avg packets/bulk",
+    "fwd avg bulk rate",
+    "bwd avg bytes/bulk",
+    "bwd avg packets/bulk",
+    "bwd avg bulk rate",
+    "subflow fwd packets",
+    "subflow fwd bytes",
+    "subflow bwd packets",
+    "subflow bwd bytes",
+    "init_win_bytes_forward",
+    "init_win_bytes_backward",
+    "act_data_pkt_fwd",
+    "min_seg_size_forward",
+    "active mean",
+    "active std",
+    "active max",
+    "active min",
+    "idle mean",
+    "idle std",
+    "idle max",
+    "idle min",
+)
+
+
+class FeatureSchema:
+    """
+    Versioned input layout of one model generation: ordered feature names,
+    name -> column index, and the fitted scaler's per-column offset (mean)
+    and scale (std) as arrays, so rows are scaled without the scaler.
+
+    It is written next to scaler.joblib when the models are trained and
+    checked against the scaler and models when they are loaded, so a
+    width or order mismatch fails there instead of being padded or
+    truncated per request. files optionally records the {file name:
+    [mtime_ns, size]} of the model files published with it, so a
+    generation is only loaded once all of its files are in place.
+    """
+
+    def __init__(self, names, offset=None, scale=None, version=SCHEMA_VERSION, files=None):
+        self.names = tuple(names)
+        self.files = files
+        self.width = len(self.names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != self.width:
+            raise ValueError("Duplicate feature names in schema")
+        self.version = version
+        self.offset = self._column_array(offset, 0.0, "offset")
+        self.scale = self._column_array(scale, 1.0, "scale")
+        if np.any(self.scale == 0):
+            raise ValueError("Schema scale must be non-zero")
+
+    def _column_array(self, values, default, what):
+        if values is None:
+            return np.full(self.width, default)
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (self.width,):
+            raise ValueError(f"Schema {what} has shape {values.shape}, expected ({self.width},)")
+        return values
+
+    @classmethod
+    def from_scaler(cls, scaler, names=None):
+        """
+        Schema of a fitted StandardScaler. names default to the scaler's
+        feature_names_in_ (fitted on a DataFrame), else the first flow features.
+        """
+        n = int(scaler.n_features_in_)
+        if names is None:
+            names = getattr(scaler, "feature_names_in_", None)
+            names = FLOW_FEATURES[:n] if names is None else [str(name) for name in names]
+        if len(names) != n:
+            raise ValueError(f"The scaler was fitted on {n} features, got {len(names)} names")
+        offset = scaler.mean_ if getattr(scaler, "with_mean", True) and scaler.mean_ is not None else None
+        scale = scaler.scale_ if getattr(scaler, "with_std", True) and scaler.scale_ is not None else None
+        return cls(names, offset, scale)
+
+    @property
+    def fingerprint(self):
+        """Short hash of the ordered names; equal fingerprints mean the same columns."""
+        return hashlib.sha1("\n".join(self.names).encode("utf-8")).hexdigest()[:12]
+
+    def check_width(self, n_features, what="input"):
+        if n_features != self.width:
+            raise ValueError(f"{what} has {n_features} features, the schema has {self.width}")
+
+    def columns(self, source_names):
+        """
+        Indices that pick this schema's columns, in order, from rows laid out
+        as source_names; None when they are already its first columns.
+        """
+        source = {name: i for i, name in enumerate(source_names)}
+        missing = [name for name in self.names if name not in source]
+        if missing:
+            raise ValueError(f"Features {missing[:5]} are not in the source layout")
+        idx = np.array([source[name] for name in self.names], dtype=np.intp)
+        return None if np.array_equal(idx, np.arange(self.width)) else idx
+
+    def empty(self, rows):
+        """A preallocated (rows x width) float32 matrix."""
+        return np.zeros((rows, self.width), dtype=np.float32)
+
+    def vector(self, features, out=None):
+        """
+        One float32 row from a {name: value} mapping (API input); raises
+        KeyError for a missing feature.
+        """
+        if out is None:
+            out = np.empty(self.width, dtype=np.float32)
+        for i, name in enumerate(self.names):
+            out[i] = features[name]
+        return out
+
+    def transform(self, X, out=None):
+        """
+        Scales (rows x width) X into a float32 matrix, computed in float64
+        like scaler.transform; extra columns (wider frames) are ignored.
+        """
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] < self.width:
+            raise ValueError(f"Expected (rows x {self.width}) features, got shape {X.shape}")
+        if out is None:
+            out = np.empty((len(X), self.width), dtype=np.float32)
+        np.divide(X[:, :self.width] - self.offset, self.scale, out=out, casting="same_kind")
+        return out
+
+    def matches_scaler(self, scaler):
+        """True if the saved offset and scale are the scaler's."""
+        other = FeatureSchema.from_scaler(scaler, self.names)
+        return np.allclose(self.offset, other.offset, rtol=1e-9) and np.allclose(self.scale, other.scale, rtol=1e-9)
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "names": list(self.names),
+            "offset": self.offset.tolist(),
+            "scale": self.scale.tolist(),
+            **({"files": self.files} if self.files else {}),
+        }
+
+    def info(self):
+        return {"version": self.version, "width": self.width, "fingerprint": self.fingerprint}
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        version = data.get("version")
+        if not isinstance(version, int) or not 1 <= version <= SCHEMA_VERSION:
+            raise ValueError(f"{path} has schema version {version}, this build reads up to {SCHEMA_VERSION}")
+        try:
+            return cls(data["names"], data.get("offset"), data.get("scale"), version, data.get("files"))
+        except KeyError as e:
+            raise ValueError(f"{path} is missing {e}") from None
+
+
+FLOW_SCHEMA = FeatureSchema(FLOW_FEATURES)
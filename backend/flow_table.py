@@ -0,0 +1,414 @@
+import math
+from collections import OrderedDict
+from utils import format_ip, aggregate_window, WindowBuffer
+from feature_schema import FLOW_FEATURES
+
+# -----------------------
+# CONFIG (CICFlowMeter defaults)
+# -----------------------
+ACTIVE_TIMEOUT = 120.0   # seconds a flow may live before it is split
+IDLE_TIMEOUT = 60.0      # seconds without packets before a flow expires
+ACTIVITY_TIMEOUT = 5.0   # gap that separates active and idle periods
+BULK_TIMEOUT = 1.0       # max gap between packets of one bulk transfer
+SUBFLOW_TIMEOUT = 1.0    # gap that starts a new subflow
+
+FIN, SYN, RST, PSH, ACK, URG, ECE, CWR = 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80
+
+US = 1e6  # CIC-IDS2017 reports durations and IATs in microseconds
+
+
+class RunningStats:
+    """Welford running mean/variance with min, max and total in O(1) memory."""
+    __slots__ = ("n", "mean", "m2", "min", "max", "total")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = 0.0
+        self.max = 0.0
+        self.total = 0.0
+
+    def add(self, x):
+        self.n += 1
+        if self.n == 1:
+            self.min = self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        # Sample variance, as reported by CICFlowMeter
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class _Bulk:
+    """Per-direction bulk transfer tracker (CICFlowMeter bulk heuristics)."""
+    __slots__ = ("start_helper", "count_helper", "size_helper", "last_ts",
+                 "state_count", "packet_count", "size_total", "duration")
+
+    def __init__(self):
+        self.start_helper = 0.0
+        self.count_helper = 0
+        self.size_helper = 0
+        self.last_ts = 0.0
+        self.state_count = 0
+        self.packet_count = 0
+        self.size_total = 0
+        self.duration = 0.0
+
+    def update(self, ts, size, other):
+        if size <= 0:
+            return
+        # A packet in the other direction breaks a bulk in progress
+        if other.last_ts > self.start_helper:
+            self.start_helper = 0.0
+        if self.start_helper == 0.0 or ts - self.last_ts > BULK_TIMEOUT:
+            self.start_helper = ts
+            self.count_helper = 1
+            self.size_helper = size
+        else:
+            self.count_helper += 1
+            self.size_helper += size
+            if self.count_helper == 4:
+                self.state_count += 1
+                self.packet_count += 4
+                self.size_total += self.size_helper
+                self.duration += ts - self.start_helper
+            elif self.count_helper > 4:
+                self.packet_count += 1
+                self.size_total += size
+                self.duration += ts - self.last_ts
+        self.last_ts = ts
+
+    def features(self):
+        if self.state_count == 0:
+            return 0.0, 0.0, 0.0
+        rate = self.size_total / self.duration if self.duration > 0 else 0.0
+        return (self.size_total / self.state_count,
+                self.packet_count / self.state_count,
+                rate)
+
+
+def flow_key(src, sport, dst, dport, proto):
+    """Direction-independent 5-tuple key."""
+    a, b = (src, sport), (dst, dport)
+    return (proto, a, b) if a <= b else (proto, b, a)
+
+
+class Flow:
+    """Bidirectional flow with incrementally maintained CIC-IDS2017 statistics."""
+    __slots__ = (
+        "key", "src", "sport", "dst", "dport", "proto",
+        "start", "last_seen", "fwd_last", "bwd_last",
+        "fwd_len", "bwd_len", "all_len", "flow_iat", "fwd_iat", "bwd_iat",
+        "active", "idle", "start_active", "end_active",
+        "fwd_header", "bwd_header", "min_seg_fwd",
+        "flags", "fwd_psh", "bwd_psh", "fwd_urg", "bwd_urg",
+        "init_win_fwd", "init_win_bwd", "act_data_fwd",
+        "fwd_bulk", "bwd_bulk", "subflows", "fin_dirs", "finished",
+        "window_id", "reported_packets", "reported_bytes",
+    )
+
+    def __init__(self, key, pkt):
+        self.key = key
+        self.src, self.sport = pkt.src, pkt.sport
+        self.dst, self.dport = pkt.dst, pkt.dport
+        self.proto = pkt.proto
+        self.start = self.last_seen = pkt.ts
+        self.fwd_last = self.bwd_last = None
+        self.fwd_len, self.bwd_len, self.all_len = RunningStats(), RunningStats(), RunningStats()
+        self.flow_iat, self.fwd_iat, self.bwd_iat = RunningStats(), RunningStats(), RunningStats()
+        self.active, self.idle = RunningStats(), RunningStats()
+        self.start_active = self.end_active = pkt.ts
+        self.fwd_header = self.bwd_header = 0
+        self.min_seg_fwd = 0
+        self.flags = [0] * 8
+        self.fwd_psh = self.bwd_psh = self.fwd_urg = self.bwd_urg = 0
+        self.init_win_fwd = self.init_win_bwd = -1
+        self.act_data_fwd = 0
+        self.fwd_bulk, self.bwd_bulk = _Bulk(), _Bulk()
+        self.subflows = 1
+        self.fin_dirs = 0
+        self.finished = False
+        self.window_id = -1
+        self.reported_packets = 0
+        self.reported_bytes = 0
+
+    def add(self, pkt):
+        """Update every statistic with one packet in O(1)."""
+        ts = pkt.ts
+        fwd = pkt.src == self.src and pkt.sport == self.sport
+
+        if self.all_len.n:
+            gap = ts - self.last_seen
+            self.flow_iat.add(gap * US)
+            if gap > SUBFLOW_TIMEOUT:
+                self.subflows += 1
+            if ts - self.end_active > ACTIVITY_TIMEOUT:
+                if self.end_active > self.start_active:
+                    self.active.add((self.end_active - self.start_active) * US)
+                self.idle.add((ts - self.end_active) * US)
+                self.start_active = ts
+            self.end_active = ts
+        self.last_seen = ts
+
+        size = pkt.payload_len
+        self.all_len.add(size)
+        flags = pkt.flags
+        if fwd:
+            if self.fwd_last is not None:
+                self.fwd_iat.add((ts - self.fwd_last) * US)
+            self.fwd_last = ts
+            self.fwd_len.add(size)
+            self.fwd_header += pkt.header_len
+            self.min_seg_fwd = pkt.header_len if self.fwd_len.n == 1 else min(self.min_seg_fwd, pkt.header_len)
+            if self.init_win_fwd < 0 and self.proto == 6:
+                self.init_win_fwd = pkt.window
+            if size > 0:
+                self.act_data_fwd += 1
+            self.fwd_psh += 1 if flags & PSH else 0
+            self.fwd_urg += 1 if flags & URG else 0
+            self.fwd_bulk.update(ts, size, self.bwd_bulk)
+        else:
+            if self.bwd_last is not None:
+                self.bwd_iat.add((ts - self.bwd_last) * US)
+            self.bwd_last = ts
+            self.bwd_len.add(size)
+            self.bwd_header += pkt.header_len
+            if self.init_win_bwd < 0 and self.proto == 6:
+                self.init_win_bwd = pkt.window
+            self.bwd_psh += 1 if flags & PSH else 0
+            self.bwd_urg += 1 if flags & URG else 0
+            self.bwd_bulk.update(ts, size, self.fwd_bulk)
+
+        if flags:
+            counts = self.flags
+            for bit in range(8):
+                if flags & (1 << bit):
+                    counts[bit] += 1
+            if flags & RST:
+                self.finished = True
+            elif flags & FIN:
+                self.fin_dirs |= 1 if fwd else 2
+                if self.fin_dirs == 3:
+                    self.finished = True
+
+    def close(self):
+        """Account for the trailing active period when the flow ends."""
+        if self.end_active > self.start_active:
+            self.active.add((self.end_active - self.start_active) * US)
+            self.start_active = self.end_active
+        self.finished = True
+
+    def values(self):
+        """Return the current flow statistics as a list in FLOW_FEATURES order."""
+        duration = self.last_seen - self.start
+        fwd, bwd, pkts = self.fwd_len, self.bwd_len, self.all_len
+        seconds = duration if duration > 0 else 0.0
+        fwd_bulk = self.fwd_bulk.features()
+        bwd_bulk = self.bwd_bulk.features()
+        flags = self.flags
+        return [
+            self.dport,  # destination port
+            duration * US,  # flow duration
+            fwd.n,  # total fwd packets
+            bwd.n,  # total backward packets
+            fwd.total,  # total length of fwd packets
+            bwd.total,  # total length of bwd packets
+            fwd.max,  # fwd packet length max
+            fwd.min,  # fwd packet length min
+            fwd.mean,  # fwd packet length mean
+            fwd.std,  # fwd packet length std
+            bwd.max,  # bwd packet length max
+            bwd.min,  # bwd packet length min
+            bwd.mean,  # bwd packet length mean
+            bwd.std,  # bwd packet length std
+            pkts.total / seconds if seconds else 0.0,  # flow bytes/s
+            pkts.n / seconds if seconds else 0.0,  # flow packets/s
+            self.flow_iat.mean,  # flow iat mean
+            self.flow_iat.std,  # flow iat std
+            self.flow_iat.max,  # flow iat max
+            self.flow_iat.min,  # flow iat min
+            self.fwd_iat.total,  # fwd iat total
+            self.fwd_iat.mean,  # fwd iat mean
+            self.fwd_iat.std,  # fwd iat std
+            self.fwd_iat.max,  # fwd iat max
+            self.fwd_iat.min,  # fwd iat min
+            self.bwd_iat.total,  # bwd iat total
+            self.bwd_iat.mean,  # bwd iat mean
+            self.bwd_iat.std,  # bwd iat std
+            self.bwd_iat.max,  # bwd iat max
+            self.bwd_iat.min,  # bwd iat min
+            self.fwd_psh,  # fwd psh flags
+            self.bwd_psh,  # bwd psh flags
+            self.fwd_urg,  # fwd urg flags
+            self.bwd_urg,  # bwd urg flags
+            self.fwd_header,  # fwd header length
+            self.bwd_header,  # bwd header length
+            fwd.n / seconds if seconds else 0.0,  # fwd packets/s
+            bwd.n / seconds if seconds else 0.0,  # bwd packets/s
+            pkts.min,  # min packet length
+            pkts.max,  # max packet length
+            pkts.mean,  # packet length mean
+            pkts.std,  # packet length std
+            pkts.variance,  # packet length variance
+            flags[0],  # fin flag count
+            flags[1],  # syn flag count
+            flags[2],  # rst flag count
+            flags[3],  # psh flag count
+            flags[4],  # ack flag count
+            flags[5],  # urg flag count
+            flags[7],  # cwe flag count
+            flags[6],  # ece flag count
+            bwd.n // fwd.n if fwd.n else 0,  # down/up ratio
+            pkts.mean,  # average packet size
+            fwd.mean,  # avg fwd segment size
+            bwd.mean,  # avg bwd segment size
+            self.fwd_header,  # fwd header length.1
+            fwd_bulk[0],  # fwd avg bytes/bulk
+            fwd_bulk[1],  # fwd avg packets/bulk
+            fwd_bulk[2],  # fwd avg bulk rate
+            bwd_bulk[0],  # bwd avg bytes/bulk
+            bwd_bulk[1],  # bwd avg packets/bulk
+            bwd_bulk[2],  # bwd avg bulk rate
+            fwd.n // self.subflows,  # subflow fwd packets
+            fwd.total // self.subflows,  # subflow fwd bytes
+            bwd.n // self.subflows,  # subflow bwd packets
+            bwd.total // self.subflows,  # subflow bwd bytes
+            self.init_win_fwd,  # init_win_bytes_forward
+            self.init_win_bwd,  # init_win_bytes_backward
+            self.act_data_fwd,  # act_data_pkt_fwd
+            self.min_seg_fwd,  # min_seg_size_forward
+            self.active.mean,  # active mean
+            self.active.std,  # active std
+            self.active.max,  # active max
+            self.active.min,  # active min
+            self.idle.mean,  # idle mean
+            self.idle.std,  # idle std
+            self.idle.max,  # idle max
+            self.idle.min,  # idle min
+        ]
+
+    def take_delta(self):
+        """Packets and bytes since the previous call, and whether this is the first call."""
+        packets, nbytes = self.all_len.n, self.all_len.total
+        delta = (packets - self.reported_packets, nbytes - self.reported_bytes, self.reported_packets == 0)
+        self.reported_packets, self.reported_bytes = packets, nbytes
+        return delta
+
+    def key_string(self):
+        """Flow key as "src sport dst dport proto", in the flow's forward direction."""
+        return f"{format_ip(self.src)} {self.sport} {format_ip(self.dst)} {self.dport} {self.proto}"
+
+    def features(self):
+        """Return the CIC-IDS2017 feature dict for the current flow state."""
+        features = dict(zip(FLOW_FEATURES, self.values()))
+        features["src_ip"] = format_ip(self.src)
+        features["dst_ip"] = format_ip(self.dst)
+        return features
+
+
+class FlowTable:
+    """
+    Flow table keyed by the bidirectional 5-tuple.
+
+    Flows are kept in last-seen order so idle expiry only inspects the
+    oldest entries. Flows that exceed ACTIVE_TIMEOUT are split on their
+    next packet; FIN in both directions or RST terminates a flow.
+    """
+
+    def __init__(self, active_timeout=ACTIVE_TIMEOUT, idle_timeout=IDLE_TIMEOUT):
+        self.active_timeout = active_timeout
+        self.idle_timeout = idle_timeout
+        self.flows = OrderedDict()
+        self.finished = []   # flows completed since the last collect()
+        self.touched = []    # live flows updated since the last collect()
+        self.window_id = 0
+
+    def __len__(self):
+        return len(self.flows)
+
+    def add(self, pkt):
+        """Route one packet to its flow, creating or splitting flows as needed."""
+        key = flow_key(pkt.src, pkt.sport, pkt.dst, pkt.dport, pkt.proto)
+        flow = self.flows.get(key)
+        if flow is not None and pkt.ts - flow.start > self.active_timeout:
+            self._finish(key, flow)
+            flow = None
+        if flow is None:
+            flow = Flow(key, pkt)
+            self.flows[key] = flow
+        else:
+            self.flows.move_to_end(key)
+
+        flow.add(pkt)
+        if flow.window_id != self.window_id:
+            flow.window_id = self.window_id
+            self.touched.append(flow)
+        if flow.finished:
+            self._finish(key, flow)
+        return flow
+
+    def _finish(self, key, flow):
+        del self.flows[key]
+        flow.close()
+        self.finished.append(flow)
+
+    def expire(self, now):
+        """Terminate flows idle for longer than idle_timeout."""
+        flows = self.flows
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if now - flow.last_seen <= self.idle_timeout:
+                break
+            self._finish(key, flow)
+
+    def collect(self, now):
+        """
+        Expire idle flows and return every flow that was active since the
+        previous call: completed flows plus live ones. Live flows keep
+        updating, so read them (values()/features()) before adding packets.
+        """
+        self.expire(now)
+        flows = self.finished
+        flows.extend(flow for flow in self.touched if not flow.finished)
+        self.finished = []
+        self.touched = []
+        self.window_id += 1
+        return flows
+
+
+class FlowAggregator:
+    """
+    Single-process capture engine: a FlowTable plus a reusable WindowBuffer.
+    close_window() aggregates the window's flows and hands the result to emit.
+    """
+
+    def __init__(self, emit, active_timeout=ACTIVE_TIMEOUT, idle_timeout=IDLE_TIMEOUT):
+        self.emit = emit
+        self.flow_table = FlowTable(active_timeout, idle_timeout)
+        self.buffer = WindowBuffer()
+
+    def add(self, pkt):
+        self.flow_table.add(pkt)
+
+    def close_window(self, start, end, flush=False):
+        """Emit the window [start, end); flush expires every remaining flow."""
+        window = self.flow_table.collect(float("inf") if flush else end)
+        agg = aggregate_window(window, self.buffer)
+        agg["start"], agg["end"] = start, end
+        self.emit(agg)
+
+    def close(self):
+        pass
@@ -0,0 +1,262 @@
+import argparse
+import json
+import logging
+import os
+import time
+import urllib.request
+import joblib
+import numpy as np
+import xgboost
+from database import engine, iter_labeled_events
+from feature_schema import FeatureSchema, SCHEMA_FILE
+from model_registry import MODELS_DIR, RF_FILE, XGB_FILE, SCALER_FILE
+from tree_eval import file_stamps
+from utils import FEATURE_ORDER
+import logs
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# CONFIG
+# -----------------------
+STATE_FILE = "train_state.json"  # in the models dir: the labeled events learned so far and the versions
+MIN_ROWS = 200     # labeled events needed before an update is worth publishing
+XGB_ROUNDS = 20    # boosting rounds added per update
+RF_TREES = 10      # trees added to the forest per update
+ADMIN_TOKEN = os.environ.get("IDS_ADMIN_TOKEN")
+
+
+def load_state(models_dir):
+    try:
+        with open(os.path.join(models_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"version": 0, "after": None, "history": []}
+
+
+def save_state(models_dir, state):
+    path = os.path.join(models_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def current_schema(models_dir, scaler):
+    path = os.path.join(models_dir, SCHEMA_FILE)
+    return FeatureSchema.load(path) if os.path.exists(path) else FeatureSchema.from_scaler(scaler)
+
+
+def fetch_delta(schema, after=None, bind=None):
+    """
+    Feature rows (in the schema's columns) and true classes of the events
+    labeled since `after`, and the new (labeled_at, id) position. Events
+    stored without features, or with too few, are skipped.
+    """
+    columns = schema.columns(FEATURE_ORDER)
+    width = schema.width if columns is None else int(columns.max()) + 1
+    rows, labels, skipped = [], [], 0
+    for event in iter_labeled_events(bind, after):
+        after = (event.labeled_at, event.id)
+        if not event.features or len(event.features) < width:
+            skipped += 1
+            continue
+        rows.append(event.features[:width])
+        labels.append(event.verified_label)
+    if skipped:
+        log.warning("Skipped %d labeled events without a full feature row", skipped)
+    X = np.asarray(rows, dtype=np.float64).reshape(len(rows), width)
+    if columns is not None:
+        X = X[:, columns]
+    return X, np.asarray(labels, dtype=np.int32), after
+
+
+def _remap(threshold, feature, old, new):
+    """
+    The value on the new scaling of what was threshold on the old one;
+    scaling is increasing and affine per feature, so a split moved this
+    way separates the same raw values. Unchanged scaling maps exactly.
+    """
+    (old_offset, old_scale), (new_offset, new_scale) = old, new
+    return threshold * (old_scale / new_scale)[feature] + ((old_offset - new_offset) / new_scale)[feature]
+
+
+def _remap_boundary(last_left, feature, old, new, ties_up):
+    """
+    Float32 splits separate the float32 values up to last_left from those
+    above it, i.e. exact scaled values below the midpoint to the next
+    float32 from those above it. The new split point is that midpoint's
+    image rounded to the nearest float32, so the values at the split
+    (often data values themselves) stay on their side.
+    """
+    midpoint = (last_left.astype(np.float64) + np.nextafter(last_left, np.float32(np.inf))) / 2
+    image = _remap(midpoint, feature, old, new)
+    out = image.astype(np.float32)
+    lower = np.where(out > image, np.nextafter(out, np.float32(-np.inf)), out)
+    upper = np.nextafter(lower, np.float32(np.inf))
+    gap = (image - lower) - (upper.astype(np.float64) - image)
+    return np.where((gap > 0) | ((gap == 0) & ties_up), upper, lower)
+
+
+def rescale_xgboost(booster, old, new):
+    """A copy of booster whose split conditions take features scaled with new instead of old."""
+    model = json.loads(booster.save_raw(raw_format="json"))
+    for tree in model["learner"]["gradient_booster"]["model"]["trees"]:
+        split = np.asarray(tree["left_children"]) != -1  # leaves keep their values here
+        cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+        feature = np.asarray(tree["split_indices"])
+        # "x < cond": the last float32 going left is the one below cond
+        last_left = np.nextafter(cond[split], np.float32(-np.inf))
+        cond[split] = _remap_boundary(last_left, feature[split], old, new, ties_up=True)
+        tree["split_conditions"] = cond.astype(np.float64).tolist()
+    rescaled = xgboost.Booster()
+    rescaled.load_model(bytearray(json.dumps(model).encode("utf-8")))
+    rescaled.load_config(booster.save_config())  # training parameters (eta, depth, ...)
+    return rescaled
+
+
+def rescale_forest(forest, old, new):
+    """
+    Moves the split thresholds of a scikit-learn forest from old to new
+    scaling, in place. Values within a float32 step of a split can still
+    round to the other side of it on the new grid, so decisions are kept
+    up to that rounding rather than exactly.
+    """
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        split = tree.children_left != -1
+        threshold = tree.threshold[split]
+        # "x <= threshold" on float32 x: the last float32 going left is the one at or below it
+        last_left = threshold.astype(np.float32)
+        last_left = np.where(last_left > threshold, np.nextafter(last_left, np.float32(-np.inf)), last_left)
+        tree.threshold[split] = _remap_boundary(last_left, tree.feature[split], old, new, ties_up=False)
+    return forest
+
+
+def n_classes(booster):
+    params = json.loads(booster.save_config())["learner"]["learner_model_param"]
+    return max(2, int(params.get("num_class", 0)))
+
+
+def update_models(models_dir, X, y, xgb_rounds=XGB_ROUNDS, rf_trees=RF_TREES):
+    """
+    The next model generation from the current one and a labeled delta:
+
+    - the scaler's statistics are refreshed with partial_fit, and the
+      existing trees' thresholds moved to the new scaling (rescale_*), so
+      they decide as before;
+    - XGBoost continues boosting xgb_rounds rounds on the delta;
+    - the Random Forest (if any) grows rf_trees warm-started trees on it.
+
+    Rows of classes the models do not have are left out: a new class needs
+    full retraining. Returns (scaler, schema, xgb model, rf model or None).
+    """
+    scaler = joblib.load(os.path.join(models_dir, SCALER_FILE))
+    schema = current_schema(models_dir, scaler)
+    xgb_model = joblib.load(os.path.join(models_dir, XGB_FILE))
+    rf_path = os.path.join(models_dir, RF_FILE)
+    rf_model = joblib.load(rf_path) if os.path.exists(rf_path) else None
+
+    booster = xgb_model.get_booster()
+    known = (y >= 0) & (y < n_classes(booster))
+    if not known.all():
+        log.warning("Leaving out %d rows of classes %s the models do not have",
+                    int((~known).sum()), sorted(set(y[~known].tolist())))
+        X, y = X[known], y[known]
+
+    old = (schema.offset, schema.scale)
+    scaler.partial_fit(X)
+    schema = FeatureSchema.from_scaler(scaler, schema.names)
+    new = (schema.offset, schema.scale)
+    Xs = schema.transform(X)
+
+    booster = rescale_xgboost(booster, old, new)
+    booster = xgboost.train({}, xgboost.DMatrix(Xs, label=y), xgb_rounds, xgb_model=booster)
+    xgb_model.load_model(bytearray(booster.save_raw(raw_format="json")))
+
+    if rf_model is not None:
+        rescale_forest(rf_model, old, new)
+        # The forest's classes come from y: classes missing from the delta
+        # get one zero-weight row each, so the new trees keep all of them
+        missing = np.setdiff1d(rf_model.classes_, y)
+        weight = np.concatenate([np.ones(len(y)), np.zeros(len(missing))])
+        rf_model.set_params(warm_start=True, n_estimators=len(rf_model.estimators_) + rf_trees)
+        rf_model.fit(np.vstack([Xs, np.zeros((len(missing), Xs.shape[1]), dtype=Xs.dtype)]),
+                     np.concatenate([y, missing]), sample_weight=weight)
+    return scaler, schema, xgb_model, rf_model
+
+
+def publish(models_dir, scaler, schema, xgb_model, rf_model=None):
+    """
+    Replace the model files as one generation. Everything is written to
+    temporary files and renamed into place, then the schema is written
+    last with the stamps of the renamed files: ModelSet refuses a set
+    whose files do not match them, so a reload that catches the renames
+    half done keeps the running models and retries on the schema write.
+    """
+    files = [(XGB_FILE, xgb_model), (RF_FILE, rf_model), (SCALER_FILE, scaler)]
+    files = [(os.path.join(models_dir, name), obj) for name, obj in files if obj is not None]
+    for path, obj in files:
+        joblib.dump(obj, f"{path}.tmp")
+    for path, _ in files:
+        os.replace(f"{path}.tmp", path)
+    schema.files = file_stamps([path for path, _ in files])
+    schema.save(os.path.join(models_dir, SCHEMA_FILE))
+
+
+def request_reload(url, token=ADMIN_TOKEN):
+    request = urllib.request.Request(url, method="POST", headers={"X-Admin-Token": token} if token else {})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+    except Exception as e:
+        log.warning("Reload request to %s failed (the model watcher picks the files up anyway): %s", url, e)
+        return None
+
+
+def run(models_dir=MODELS_DIR, bind=None, min_rows=MIN_ROWS, xgb_rounds=XGB_ROUNDS, rf_trees=RF_TREES):
+    """
+    One incremental update: fetch the events labeled since the last one,
+    update and publish the models if there are at least min_rows, and
+    record the new version. Returns its history entry, or None.
+    """
+    start = time.perf_counter()
+    state = load_state(models_dir)
+    schema = current_schema(models_dir, joblib.load(os.path.join(models_dir, SCALER_FILE)))
+    X, y, after = fetch_delta(schema, state["after"], bind)
+    if len(X) < min_rows:
+        log.info("%d newly labeled events, waiting for %d", len(X), min_rows)
+        return None
+
+    scaler, schema, xgb_model, rf_model = update_models(models_dir, X, y, xgb_rounds, rf_trees)
+    publish(models_dir, scaler, schema, xgb_model, rf_model)
+    classes, counts = np.unique(y, return_counts=True)
+    entry = {
+        "version": state["version"] + 1,
+        "trained_at": time.time(),
+        "rows": len(y),
+        "classes": {str(c): int(n) for c, n in zip(classes, counts)},
+        "xgb_rounds": xgb_model.get_booster().num_boosted_rounds(),
+        "rf_trees": len(rf_model.estimators_) if rf_model is not None else None,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    state.update(version=entry["version"], after=list(after), history=state["history"] + [entry])
+    save_state(models_dir, state)
+    log.info("Published model version %d from %d labeled events", entry["version"], len(y), extra=entry)
+    return entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the models from newly labeled events")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--min-rows", type=int, default=MIN_ROWS, help="labeled events needed for an update")
+    parser.add_argument("--xgb-rounds", type=int, default=XGB_ROUNDS, help="boosting rounds to add")
+    parser.add_argument("--rf-trees", type=int, default=RF_TREES, help="forest trees to add")
+    parser.add_argument("--reload-url", help="backend /admin/models/reload to call after publishing")
+    parser.add_argument("--log-level", default=logs.LOG_LEVEL)
+    parser.add_argument("--log-format", default=logs.LOG_FORMAT, choices=logs.LOG_FORMATS)
+    args = parser.parse_args()
+    logs.configure(args.log_level, args.log_format)
+
+    entry = run(args.models_dir, engine, args.min_rows, args.xgb_rounds, args.rf_trees)
+    if entry is not None and args.reload_url:
+        request_reload(args.reload_url)
@@ -0,0 +1,167 @@
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from wire_protocol import decode_batch
+
+# -----------------------
+# CONFIG
+# -----------------------
+MAX_BATCH = 64     # rows per batched model call
+MAX_WAIT = 0.005   # seconds the first request of a batch may wait for others
+EXECUTOR = "thread"  # where models run: "thread", "process" or "inline" (on the event loop)
+WORKERS = 2        # executor threads/processes
+
+EXECUTORS = ("thread", "process", "inline")
+
+
+def make_executor(kind=EXECUTOR, workers=WORKERS):
+    """
+    Pool that runs model code off the event loop. Threads suit models that
+    release the GIL (XGBoost, most of scikit-learn); processes isolate
+    models that do not, at the cost of pickling every batch. "inline"
+    returns None: models run on the event loop.
+    """
+    if kind == "thread":
+        return ThreadPoolExecutor(workers, thread_name_prefix="inference")
+    if kind == "process":
+        return ProcessPoolExecutor(workers)
+    if kind == "inline":
+        return None
+    raise ValueError(f"Unknown executor '{kind}', expected one of {EXECUTORS}")
+
+
+async def run_model(executor, fn, *args):
+    """Call fn(*args) on the executor (or inline when it is None) without blocking the loop."""
+    if executor is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+class BatchScheduler:
+    """
+    Micro-batching for single-row predictions.
+
+    submit() queues one feature row and waits for its result. Pending rows
+    are run as one batch as soon as max_batch of them are queued, or
+    max_wait seconds after the first of them arrived, whichever comes
+    first, so a lone request waits at most max_wait. predict(X) receives a
+    (rows x features) matrix and returns one result per row; each caller's
+    future is resolved with its own row's result (or the batch's exception).
+    Batches run on executor (see make_executor), so several can be in
+    flight while the event loop keeps serving other connections.
+    """
+
+    def __init__(self, predict, max_batch=MAX_BATCH, max_wait=MAX_WAIT, executor=None):
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = executor
+        self._pending = []
+        self._timer = None
+        self._running = set()  # keeps batch tasks referenced until they finish
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+
+    async def submit(self, row):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self.batches += 1
+            self.rows += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            task = asyncio.get_running_loop().create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, batch):
+        rows, futures = zip(*batch)
+        try:
+            results = await run_model(self.executor, self.predict, np.stack(rows))
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():  # the caller may have been cancelled
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch": self.rows / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "pending": len(self._pending),
+        }
+
+
+# -----------------------
+# BULK REQUEST BODIES
+# -----------------------
+def rows_from_ndjson(data, feature_order):
+    """
+    Parse newline-delimited JSON: one feature vector per line, either an
+    object keyed by feature name or an array in feature_order. Returns a
+    float64 (rows x features) matrix.
+    """
+    rows = []
+    for n, line in enumerate(data.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            rows.append([item[f] for f in feature_order] if isinstance(item, dict) else item)
+        except (ValueError, KeyError) as e:
+            raise ValueError(f"Line {n}: {e!r}") from None
+    if not rows:
+        return np.zeros((0, len(feature_order)))
+    try:
+        X = np.array(rows, dtype=float)
+    except (ValueError, TypeError):
+        raise ValueError("Every line must have the same number of numeric features") from None
+    if X.ndim != 2:
+        raise ValueError("Each line must be one flat feature vector")
+    return X
+
+
+def rows_from_frame(data, feature_order):
+    """
+    Parse a raw float32 matrix sent as an IDSW frame (wire_protocol). If the
+    frame's meta section names the columns ({"features": [...]}), they are
+    reordered to feature_order; otherwise columns are taken in feature_order.
+    """
+    batch = decode_batch(data)
+    X = batch.features
+    if not isinstance(batch.meta, dict):
+        raise ValueError(f"Frame meta is a {type(batch.meta).__name__}, not an object")
+    names = batch.meta.get("features")
+    if names is not None:
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise ValueError("Frame meta 'features' must be a list of column names")
+        if len(names) != X.shape[1]:
+            raise ValueError(f"Schema names {len(names)} columns, matrix has {X.shape[1]}")
+        index = {name: i for i, name in enumerate(names)}
+        missing = [f for f in feature_order if f not in index]
+        if missing:
+            raise ValueError(f"Missing features: {missing[:5]}")
+        X = X[:, [index[f] for f in feature_order]]
+    return X
@@ -0,0 +1,59 @@
+import json
+import logging
+import os
+import sys
+
+# -----------------------
+# CONFIG
+# -----------------------
+LOG_LEVEL = os.environ.get("IDS_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("IDS_LOG_FORMAT", "text")  # "text" or "json" (one object per line)
+LOG_FORMATS = ("text", "json")
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Attributes every LogRecord has; anything else was passed in extra={...}
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def record_fields(record):
+    """The structured fields a log call added through extra={...}."""
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS}
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines, with the structured fields appended as key=value."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Route every logger of the process through one leveled handler on stderr."""
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{fmt}', expected one of {LOG_FORMATS}")
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return root
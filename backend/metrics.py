@@ -0,0 +1,344 @@
+import bisect
+import functools
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------
+# CONFIG
+# -----------------------
+ENABLED = os.environ.get("IDS_METRICS", "1") != "0"  # 0 leaves the stage functions uninstrumented
+SAMPLE_EVERY = 64  # per-packet stages time one call in this many
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name):
+        yield name, {}, self.value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self.observe)
+
+    def samples(self, name):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{name}_bucket", {"le": _format_value(float(bound))}, cumulative
+        yield f"{name}_sum", {}, total
+        yield f"{name}_count", {}, cumulative
+
+
+class _Timer:
+    __slots__ = ("observe", "start")
+
+    def __init__(self, observe):
+        self.observe = observe
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    """
+    One metric family. Without labelnames it is used directly (inc(),
+    set(), observe()); with them, labels(*values) returns the child for
+    one label combination.
+    """
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def collect(self):
+        for key, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, key))
+            for name, extra, value in child.samples(self.name):
+                yield name, {**labels, **extra}, value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+class CallbackMetric:
+    """
+    A counter or gauge read at scrape time from fn(), which returns a
+    number or a {label value (tuple): number} dict; for values other
+    objects already count (queue depths, stats() totals).
+    """
+
+    def __init__(self, name, help, fn, labelnames=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def collect(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class MetricsRegistry:
+    """Named metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets)
+
+    def callback(self, name, help, fn, labelnames=(), kind="gauge"):
+        """Register (or re-point) a metric computed by fn() on every scrape."""
+        with self._lock:
+            self._metrics[name] = CallbackMetric(name, help, fn, labelnames, kind)
+
+    def render(self):
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            try:
+                samples = list(metric.collect())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {type(e).__name__}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# -----------------------
+# PIPELINE STAGES
+# -----------------------
+STAGE_SECONDS = REGISTRY.histogram("ids_stage_seconds", "Time per call of each pipeline stage", ["stage"])
+STAGE_ITEMS = REGISTRY.counter("ids_stage_items_total",
+                               "Items (packets, windows, flows, messages) handled by each stage", ["stage"])
+
+
+class Stage:
+    """
+    Latency histogram and item counter of one named pipeline stage. Rates
+    of ids_stage_items_total give its throughput.
+    """
+    __slots__ = ("name", "_seconds", "_items")
+
+    def __init__(self, name):
+        self.name = name
+        self._seconds = STAGE_SECONDS.labels(name)
+        self._items = STAGE_ITEMS.labels(name)
+
+    def observe(self, seconds, items=1):
+        self._seconds.observe(seconds)
+        self._items.inc(items)
+
+    def count(self, items=1):
+        self._items.inc(items)
+
+    def time(self, items=1):
+        """Context manager timing one call that handles items items."""
+        return _Timer(lambda seconds: self.observe(seconds, items))
+
+    def call(self, fn, *args, items=1):
+        """fn(*args), timed."""
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.observe(time.perf_counter() - start, items)
+
+
+_stages = {}
+
+
+def stage(name):
+    if name not in _stages:
+        _stages[name] = Stage(name)
+    return _stages[name]
+
+
+def timed(name, sample=1):
+    """
+    Decorator recording the calls of a stage function. With sample > 1
+    only every sample-th call is timed (for per-packet functions, where
+    two clock reads would be a noticeable share of the call) and counts
+    for all of them.
+    """
+    st = stage(name)
+
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        calls = 0
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            if calls % sample:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                st.observe(time.perf_counter() - start, sample)
+
+        return wrapper
+
+    return decorate
+
+
+def render():
+    return REGISTRY.render()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # scrapes are not worth a log line each
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve GET /metrics from a daemon thread (for processes without a web server)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,231 @@
+import logging
+import os
+import threading
+import time
+import joblib
+import numpy as np
+from tree_eval import file_stamps, load_compiled
+from feature_schema import FeatureSchema, SCHEMA_FILE
+from utils import FEATURE_ORDER
+import metrics
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# CONFIG
+# -----------------------
+MODELS_DIR = "models"
+RF_FILE = "rf_model.joblib"
+XGB_FILE = "xgb_model.joblib"
+SCALER_FILE = "scaler.joblib"
+# Largest batch scored by the compiled engines. Measured against XGBoost with
+# 100 depth-6 trees on 78 features: 1.2 ms compiled vs 1.5 ms at 32 rows, but
+# 2.2 vs 2.1 ms at 64 (RF's per-call overhead keeps compiled ahead longer).
+# Rerun `python tree_eval.py MODEL --scaler SCALER --bench` for other models.
+COMPILED_MAX_ROWS = int(os.environ.get("IDS_COMPILED_MAX_ROWS", 32))
+WATCH_INTERVAL = 2.0    # seconds between checks for changed model files
+
+PREPROCESS = metrics.stage("preprocess")
+RF_PREDICT = metrics.stage("rf_predict")
+XGB_PREDICT = metrics.stage("xgb_predict")
+
+
+class ModelSet:
+    """
+    One consistent generation of scaler, XGBoost and (optional) Random
+    Forest models.
+
+    Loading reads only the scaler and feature schema and memory-maps the
+    compiled engines (tree_eval), which serve small batches; the library
+    models are deserialized on the first batch large enough to need them.
+    The schema (feature_schema.json next to the scaler, or derived from
+    the scaler when there is none) must match the scaler, every model must
+    take exactly its width, and its features must all be among the ones
+    agents send (FEATURE_ORDER); otherwise loading fails. So does a
+    generation caught mid-publish: files that change while loading, or
+    that differ from the ones the schema was published with.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, version=1):
+        self.version = version
+        self.loaded_at = time.time()
+        self.paths = {
+            "rf": os.path.join(models_dir, RF_FILE),
+            "xgb": os.path.join(models_dir, XGB_FILE),
+            "scaler": os.path.join(models_dir, SCALER_FILE),
+            "schema": os.path.join(models_dir, SCHEMA_FILE),
+        }
+        for name in ("xgb", "scaler"):
+            if not os.path.exists(self.paths[name]):
+                raise FileNotFoundError(f"Missing {name} model file: {self.paths[name]}")
+        stamps = self._stamps()
+        self.has_rf = os.path.exists(self.paths["rf"])
+        self.scaler = joblib.load(self.paths["scaler"])
+        self.schema = self._load_schema()
+        self.n_features = self.schema.width
+        # Rows arrive in FEATURE_ORDER; None when the models take its leading columns as they are
+        self.columns = self.schema.columns(FEATURE_ORDER)
+        self.input_width = self.n_features if self.columns is None else int(self.columns.max()) + 1
+        self.xgb_engine = load_compiled(self.paths["xgb"], self.paths["scaler"], mmap=True)
+        self.rf_engine = load_compiled(self.paths["rf"], self.paths["scaler"], mmap=True) if self.has_rf else None
+        for name, engine in (("xgb", self.xgb_engine), ("rf", self.rf_engine)):
+            if engine is not None:
+                self._check_width(name, engine.n_features)
+        if self._stamps() != stamps:
+            raise ValueError(f"Model files in {models_dir} changed while loading")
+        if self.schema.files is not None and {k: stamps.get(k) for k in self.schema.files} != self.schema.files:
+            raise ValueError(f"Model files in {models_dir} are not the generation {SCHEMA_FILE} was published with")
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _stamps(self):
+        return file_stamps([self.paths[name] for name in ("rf", "xgb", "scaler", "schema")])
+
+    def _load_schema(self):
+        if not os.path.exists(self.paths["schema"]):
+            return FeatureSchema.from_scaler(self.scaler)
+        schema = FeatureSchema.load(self.paths["schema"])
+        schema.check_width(int(self.scaler.n_features_in_), self.paths["scaler"])
+        if not schema.matches_scaler(self.scaler):
+            raise ValueError(f"{self.paths['schema']} was not saved with {self.paths['scaler']}")
+        return schema
+
+    def _check_width(self, name, n_features):
+        if n_features != self.n_features:
+            raise ValueError(f"{self.paths[name]} takes {n_features} features, "
+                             f"the feature schema has {self.n_features}")
+
+    def model(self, name):
+        """The library model ("rf" or "xgb"), loaded (memory-mapped where joblib can) on first use."""
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = joblib.load(self.paths[name], mmap_mode="r")
+                    self._check_width(name, model.n_features_in_)
+                    self._models[name] = model
+        return model
+
+    def score(self, X):
+        """
+        Scores a (rows x FEATURE_ORDER) matrix: RF labels (None without an
+        RF model) and XGBoost class probabilities. Small batches use the
+        compiled engines, large ones the libraries, whose native loops are
+        faster per row.
+        """
+        n = len(X)
+        if self.columns is not None:
+            X = np.asarray(X)[:, self.columns]
+        if n <= COMPILED_MAX_ROWS:
+            # The engines have the scaling folded into their thresholds
+            rf, xgb = self.rf_engine, self.xgb_engine
+        else:
+            with PREPROCESS.time(n):
+                X = self.schema.transform(X)
+            rf = self.model("rf") if self.has_rf else None
+            xgb = self.model("xgb")
+        rf_pred = None
+        if rf is not None:
+            with RF_PREDICT.time(n):
+                rf_pred = rf.predict(X)
+        with XGB_PREDICT.time(n):
+            proba = xgb.predict_proba(X)
+        return rf_pred, proba
+
+    def info(self):
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "n_features": self.n_features,
+            "schema": self.schema.info(),
+            "rf": self.has_rf,
+            "library_models_loaded": sorted(self._models),
+            "files": {name: path for name, path in self.paths.items() if os.path.exists(path)},
+        }
+
+
+class ModelRegistry:
+    """
+    Holds the live ModelSet and replaces it when the model files change.
+
+    reload() builds a complete new ModelSet next to the current one and
+    publishes it with a single reference swap, so requests already running
+    finish on the models they started with and nothing else (websockets,
+    queues) is touched. If the new files fail to load or do not match the
+    scaler's width, the current models stay live. watch() checks the
+    files' modification times every interval seconds from a daemon thread.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, on_swap=None):
+        self.models_dir = models_dir
+        self.on_swap = on_swap
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.current = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self._stamp = None
+
+    def _files_stamp(self):
+        stamp = []
+        for name in (RF_FILE, XGB_FILE, SCALER_FILE, SCHEMA_FILE):
+            try:
+                st = os.stat(os.path.join(self.models_dir, name))
+                stamp.append((name, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append((name, None, None))
+        return tuple(stamp)
+
+    def reload(self):
+        """Load the model files and make them live; raises (keeping the old models) on failure."""
+        with self._reload_lock:
+            stamp = self._files_stamp()
+            version = self.current.version + 1 if self.current else 1
+            try:
+                models = ModelSet(self.models_dir, version)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._stamp = stamp  # do not retry until the files change again
+                raise
+            self.current = models
+            self._stamp = stamp
+            self.reloads += 1
+            self.last_error = None
+        if self.on_swap is not None:
+            self.on_swap(models)
+        return models
+
+    def reload_if_changed(self):
+        if self._files_stamp() == self._stamp:
+            return False
+        try:
+            models = self.reload()
+        except Exception as e:
+            log.error("Keeping model version %s: %s", self.current.version if self.current else None, e)
+            return False
+        log.info("Model version %s is live", models.version)
+        return True
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Reload automatically whenever the model files change."""
+        if self._watcher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=run, name="model-watch", daemon=True)
+        self._watcher.start()
+
+    def info(self):
+        return {
+            **(self.current.info() if self.current else {}),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
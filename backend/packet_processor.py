@@ -1,18 +1,10 @@
 import numpy as np
+from feature_schema import FLOW_SCHEMA
 
-EXPECTED_FEATURES = 78
+EXPECTED_FEATURES = FLOW_SCHEMA.width
 
-def prepare_packet(packet_data, scaler):
-    packet_data = np.array(packet_data).flatten()
-    n_features = packet_data.shape[0]
-
-    if n_features > EXPECTED_FEATURES:
-        packet_data = packet_data[:EXPECTED_FEATURES]
-        print(f"Warning: packet has more features than expected. Truncated to {EXPECTED_FEATURES}.")
-    elif n_features < EXPECTED_FEATURES:
-        padded = np.zeros(EXPECTED_FEATURES)
-        padded[:n_features] = packet_data
-        packet_data = padded
-
-    scaled_packet = scaler.transform([packet_data])
-    return scaled_packet
+def prepare_packet(packet_data, schema):
+    """Scales one flow vector with a feature_schema.FeatureSchema; its width must match."""
+    packet_data = np.asarray(packet_data, dtype=float).reshape(1, -1)
+    schema.check_width(packet_data.shape[1], "Packet")
+    return schema.transform(packet_data)
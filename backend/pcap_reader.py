@@ -0,0 +1,141 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from packet_decoder import decode_frame, DECODE, SAMPLE_EVERY
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# FILE FORMAT CONSTANTS
+# -----------------------
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+IDB_OPT_TSRESOL = 9
+
+
+def _read_pcap(view, endian, ts_scale, linktype):
+    record = struct.Struct(endian + "IIII").unpack_from
+    offset, size = 24, len(view)
+    while offset + 16 <= size:
+        sec, frac, incl_len, _ = record(view, offset)
+        offset += 16
+        yield sec + frac * ts_scale, linktype, view[offset:offset + incl_len]
+        offset += incl_len
+
+
+def _tsresol(view, offset, end, endian):
+    """Parse the if_tsresol option of an Interface Description Block."""
+    option = struct.Struct(endian + "HH").unpack_from
+    while offset + 4 <= end:
+        code, length = option(view, offset)
+        if code == 0:
+            break
+        if code == IDB_OPT_TSRESOL and length >= 1:
+            value = view[offset + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        offset += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def _read_pcapng(view):
+    size = len(view)
+    offset = 0
+    endian = "<"
+    interfaces = []  # (linktype, ts resolution) per interface id
+    last_ts = 0.0
+    while offset + 12 <= size:
+        block_type = struct.unpack_from(endian + "I", view, offset)[0]
+        if block_type == PCAPNG_SHB:
+            magic = struct.unpack_from("<I", view, offset + 8)[0]
+            endian = "<" if magic == PCAPNG_BYTE_ORDER else ">"
+            interfaces = []
+        block_len = struct.unpack_from(endian + "I", view, offset + 4)[0]
+        if block_len < 12 or offset + block_len > size:
+            break
+        body = offset + 8
+        if block_type == PCAPNG_IDB:
+            linktype = struct.unpack_from(endian + "H", view, body)[0]
+            interfaces.append((linktype, _tsresol(view, body + 8, offset + block_len - 4, endian)))
+        elif block_type == PCAPNG_EPB:
+            if block_len < 32:
+                log.warning("Skipping truncated enhanced packet block at offset %d", offset)
+                offset += block_len
+                continue
+            iface, ts_high, ts_low, cap_len, _ = struct.unpack_from(endian + "IIIII", view, body)
+            if iface >= len(interfaces):
+                log.warning("Skipping packet block at offset %d for undescribed interface %d", offset, iface)
+                offset += block_len
+                continue
+            linktype, resolution = interfaces[iface]
+            last_ts = ((ts_high << 32) | ts_low) * resolution
+            yield last_ts, linktype, view[body + 20:body + 20 + cap_len]
+        elif block_type == PCAPNG_SPB and interfaces:
+            orig_len = struct.unpack_from(endian + "I", view, body)[0]
+            cap_len = min(orig_len, block_len - 16)
+            # Simple packet blocks carry no timestamp
+            yield last_ts, interfaces[0][0], view[body + 4:body + 4 + cap_len]
+        offset += block_len
+
+
+def read_pcap(path):
+    """
+    Yields (timestamp, linktype, frame) for every packet in a pcap or pcapng
+    file. The file is memory-mapped and frames are memoryview slices of it.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        magic = struct.unpack_from("<I", view, 0)[0]
+        if magic == PCAPNG_SHB:
+            yield from _read_pcapng(view)
+            return
+        for endian in ("<", ">"):
+            magic = struct.unpack_from(endian + "I", view, 0)[0]
+            if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                linktype = struct.unpack_from(endian + "I", view, 20)[0] & 0x0FFFFFFF
+                ts_scale = 1e-6 if magic == PCAP_MAGIC_US else 1e-9
+                yield from _read_pcap(view, endian, ts_scale, linktype)
+                return
+        raise ValueError(f"{path} is not a pcap or pcapng file")
+    finally:
+        try:
+            view.release()
+            mm.close()
+        except BufferError:
+            pass  # a consumer still holds a frame view; the map closes on GC
+
+
+def replay_packets(paths, speed=0.0):
+    """
+    Yields a PacketInfo for every decodable packet in the given capture files.
+
+    speed <= 0 replays as fast as possible; otherwise packets are paced by
+    their original timestamps, sped up by the given multiplier.
+    """
+    base_ts = base_wall = None
+    count = 0
+    for path in paths:
+        for ts, linktype, frame in read_pcap(path):
+            if speed > 0:
+                if base_ts is None:
+                    base_ts, base_wall = ts, time.monotonic()
+                delay = (ts - base_ts) / speed - (time.monotonic() - base_wall)
+                if delay > 0:
+                    time.sleep(delay)
+            count += 1
+            if count % SAMPLE_EVERY:
+                info = decode_frame(frame, ts, linktype)
+            else:
+                info = DECODE.call(decode_frame, frame, ts, linktype, items=SAMPLE_EVERY)
+            if info is not None:
+                yield info
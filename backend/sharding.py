@@ -0,0 +1,218 @@
+import multiprocessing as mp
+import socket
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from utils import PacketInfo, merge_windows
+from flow_table import FlowAggregator, flow_key, ACTIVE_TIMEOUT, IDLE_TIMEOUT
+
+# -----------------------
+# CONFIG
+# -----------------------
+RING_CAPACITY = 1 << 16  # packet records per worker ring
+BATCH_SIZE = 512         # packets buffered per shard before a ring write
+POLL_INTERVAL = 0.0005   # seconds a ring endpoint sleeps when full/empty
+
+KIND_PACKET, KIND_WINDOW, KIND_STOP = 0, 1, 2
+
+# One fixed-size record per packet; addresses are packed bytes padded to 16
+PACKET_DTYPE = np.dtype([
+    ("kind", "u1"), ("alen", "u1"), ("proto", "u1"), ("flags", "u1"),
+    ("sport", "u2"), ("dport", "u2"), ("window", "u2"), ("header_len", "u2"),
+    ("payload_len", "i4"), ("ts", "f8"), ("src", "S16"), ("dst", "S16"),
+])
+
+_HEADER_BYTES = 128  # head and tail counters on separate cache lines
+
+
+def _pack_addr(addr):
+    if isinstance(addr, bytes):
+        return addr
+    family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+    return socket.inet_pton(family, addr)
+
+
+class ShmRing:
+    """
+    Single-producer/single-consumer ring of PACKET_DTYPE records in shared
+    memory. head and tail are monotonically increasing counters; the producer
+    writes records before publishing head, the consumer reads before
+    publishing tail.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, name=None):
+        size = _HEADER_BYTES + capacity * PACKET_DTYPE.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:  # Python < 3.13
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.capacity = capacity
+        self.counters = np.ndarray((_HEADER_BYTES // 8,), dtype=np.int64, buffer=self.shm.buf)
+        self.records = np.ndarray((capacity,), dtype=PACKET_DTYPE, buffer=self.shm.buf, offset=_HEADER_BYTES)
+        if name is None:
+            self.counters[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def push(self, batch):
+        """Write a record array, waiting for the consumer while the ring is full."""
+        counters, records, capacity = self.counters, self.records, self.capacity
+        i, n = 0, len(batch)
+        while i < n:
+            head = int(counters[0])
+            free = capacity - (head - int(counters[8]))
+            if free == 0:
+                time.sleep(POLL_INTERVAL)
+                continue
+            k = min(free, n - i)
+            start = head % capacity
+            first = min(k, capacity - start)
+            records[start:start + first] = batch[i:i + first]
+            records[:k - first] = batch[i + first:i + k]
+            counters[0] = head + k
+            i += k
+
+    def pop(self):
+        """Return all available records as a list of tuples (empty if none)."""
+        counters, capacity = self.counters, self.capacity
+        tail = int(counters[8])
+        head = int(counters[0])
+        if head == tail:
+            return []
+        start = tail % capacity
+        end = start + (head - tail)
+        if end <= capacity:
+            out = self.records[start:end].tolist()
+        else:
+            out = self.records[start:].tolist() + self.records[:end - capacity].tolist()
+        counters[8] = head
+        return out
+
+    def close(self, unlink=False):
+        del self.counters, self.records
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker_main(shard, ring_name, capacity, results, active_timeout, idle_timeout):
+    """Worker process: owns the flows of one shard and aggregates them per window."""
+    ring = ShmRing(capacity, name=ring_name)
+    current = {"window_id": 0}
+
+    def emit(agg):
+        del agg["features"]  # recomputed over the merged rows
+        results.put((current["window_id"], shard, agg))
+
+    aggregator = FlowAggregator(emit, active_timeout, idle_timeout)
+    try:
+        while True:
+            records = ring.pop()
+            if not records:
+                time.sleep(POLL_INTERVAL)
+                continue
+            for kind, alen, proto, flags, sport, dport, window, header_len, payload_len, ts, src, dst in records:
+                if kind == KIND_PACKET:
+                    aggregator.add(PacketInfo(
+                        ts, src.ljust(alen, b"\0"), dst.ljust(alen, b"\0"),
+                        sport, dport, proto, payload_len, header_len, flags, window,
+                    ))
+                elif kind == KIND_WINDOW:
+                    # payload_len carries the window id, flags the flush flag
+                    current["window_id"] = payload_len
+                    aggregator.close_window(0.0, ts, flush=bool(flags))
+                else:
+                    return
+    finally:
+        ring.close()
+
+
+class ShardedAggregator:
+    """
+    Multi-process capture engine with the FlowAggregator interface.
+
+    add() hashes each packet's bidirectional flow key to one of n_workers
+    processes and batches it into that worker's shared-memory ring. Each
+    worker keeps the flow state of its shard; close_window() sends a window
+    marker through every ring, and a merger thread combines the workers'
+    per-window outputs (merge_windows) before calling emit.
+    """
+
+    def __init__(self, emit, n_workers, active_timeout=ACTIVE_TIMEOUT, idle_timeout=IDLE_TIMEOUT,
+                 capacity=RING_CAPACITY, batch_size=BATCH_SIZE):
+        self.emit = emit
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self.rings = [ShmRing(capacity) for _ in range(n_workers)]
+        self.batches = [[] for _ in range(n_workers)]
+        self.results = mp.Queue()
+        self.workers = [
+            mp.Process(
+                target=_worker_main,
+                args=(i, ring.name, capacity, self.results, active_timeout, idle_timeout),
+                daemon=True,
+            )
+            for i, ring in enumerate(self.rings)
+        ]
+        for worker in self.workers:
+            worker.start()
+        self.window_id = 0
+        self.windows = {}  # window id -> (start, end)
+        self.merger = threading.Thread(target=self._merge_loop, daemon=True)
+        self.merger.start()
+
+    def add(self, pkt):
+        shard = hash(flow_key(pkt.src, pkt.sport, pkt.dst, pkt.dport, pkt.proto)) % self.n_workers
+        src, dst = _pack_addr(pkt.src), _pack_addr(pkt.dst)
+        batch = self.batches[shard]
+        batch.append((KIND_PACKET, len(src), pkt.proto, pkt.flags, pkt.sport, pkt.dport,
+                      pkt.window, pkt.header_len, pkt.payload_len, pkt.ts, src, dst))
+        if len(batch) >= self.batch_size:
+            self._flush(shard)
+
+    def _flush(self, shard):
+        batch = self.batches[shard]
+        if batch:
+            self.rings[shard].push(np.array(batch, dtype=PACKET_DTYPE))
+            batch.clear()
+
+    def _broadcast(self, kind, ts=0.0, window_id=0, flush=False):
+        for shard in range(self.n_workers):
+            self.batches[shard].append((kind, 0, 0, int(flush), 0, 0, 0, 0, window_id, ts, b"", b""))
+            self._flush(shard)
+
+    def close_window(self, start, end, flush=False):
+        self.windows[self.window_id] = (start, end)
+        self._broadcast(KIND_WINDOW, end, self.window_id, flush)
+        self.window_id += 1
+
+    def _merge_loop(self):
+        partial = {}
+        while True:
+            item = self.results.get()
+            if item is None:
+                return
+            window_id, _, agg = item
+            parts = partial.setdefault(window_id, [])
+            parts.append(agg)
+            if len(parts) == self.n_workers:
+                del partial[window_id]
+                merged = merge_windows(parts)
+                merged["start"], merged["end"] = self.windows.pop(window_id)
+                self.emit(merged)
+
+    def close(self):
+        """Stop workers after every pending window has been merged and emitted."""
+        self._broadcast(KIND_STOP)
+        for worker in self.workers:
+            worker.join()
+        self.results.put(None)
+        self.merger.join()
+        for ring in self.rings:
+            ring.close(unlink=True)
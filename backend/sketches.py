@@ -0,0 +1,329 @@
+import heapq
+import math
+import zlib
+import numpy as np
+
+# -----------------------
+# CONFIG
+# -----------------------
+TOP_K = 32          # hosts tracked exactly per window
+CMS_WIDTH = 2048    # Count-Min columns
+CMS_DEPTH = 4       # Count-Min rows (independent hashes)
+HLL_PRECISION = 8   # 2**p HyperLogLog registers
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def _mix64(x):
+    """splitmix64 finalizer on a uint64 array (multiplications wrap mod 2**64)."""
+    x = x + np.uint64(_GOLDEN)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _key(item):
+    if isinstance(item, str):
+        item = item.encode("utf-8")
+    return zlib.crc32(item) if isinstance(item, bytes) else int(item) & _MASK64
+
+
+def keys(items):
+    """Stable integer keys (uint64) for a sequence of str, bytes or int items."""
+    return np.fromiter((_key(item) for item in items), dtype=np.uint64, count=len(items))
+
+
+def hashes(keys_, seed=0):
+    """
+    64-bit hashes of keys() output. Unlike hash(), they are the same in
+    every process, so sketches from sharded workers can merge.
+    """
+    return _mix64(keys_ ^ np.uint64((seed * _GOLDEN) & _MASK64))
+
+
+def hash64(item, seed=0):
+    return int(hashes(keys([item]), seed)[0])
+
+
+def _bit_length(x):
+    """int.bit_length() for a uint64 array."""
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >> np.uint64(shift) != 0
+        n += big * shift
+        x = np.where(big, x >> np.uint64(shift), x)
+    return n + (x != 0)
+
+
+def _intern(items):
+    """Distinct items in first-seen order, and each item's index into them."""
+    index = {}
+    inverse = np.fromiter((index.setdefault(item, len(index)) for item in items), dtype=np.intp, count=len(items))
+    return list(index), inverse
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-k heavy hitters (Metwally et al.). Keeps at most k
+    counters; a new item replaces the current minimum and inherits its count
+    as the overestimation error. A lazy min-heap finds the minimum.
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def update(self, item, weight=1):
+        """Count item; returns the evicted item, if any."""
+        counts = self.counts
+        evicted = None
+        if item in counts:
+            counts[item] += weight
+        elif len(counts) < self.k:
+            counts[item] = weight
+            self.errors[item] = 0
+        else:
+            # Pop stale heap entries until the true minimum surfaces
+            while True:
+                count, victim = heapq.heappop(self._heap)
+                if counts.get(victim) == count:
+                    break
+            del counts[victim], self.errors[victim]
+            counts[item] = count + weight
+            self.errors[item] = count
+            evicted = victim
+        heapq.heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 8 * self.k:
+            self._heap = [(c, i) for i, c in counts.items()]
+            heapq.heapify(self._heap)
+        return evicted
+
+    def merge(self, other):
+        """Combine two summaries (sum, then keep the k largest)."""
+        merged = SpaceSaving(self.k)
+        counts, errors = dict(self.counts), dict(self.errors)
+        for item, count in other.counts.items():
+            counts[item] = counts.get(item, 0) + count
+            errors[item] = errors.get(item, 0) + other.errors[item]
+        for item, count in heapq.nlargest(self.k, counts.items(), key=lambda kv: kv[1]):
+            merged.counts[item] = count
+            merged.errors[item] = errors[item]
+        merged._heap = [(c, i) for i, c in merged.counts.items()]
+        heapq.heapify(merged._heap)
+        return merged
+
+    def top(self, n=None):
+        """[(item, count, error)] sorted by count, largest first."""
+        items = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        return [(item, count, self.errors[item]) for item, count in items]
+
+
+class CountMinSketch:
+    """Count-Min sketch: fixed width x depth counters, never underestimates."""
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, keys_, row):
+        return (hashes(keys_, row) % np.uint64(self.width)).astype(np.intp)
+
+    def add(self, keys_, counts=1):
+        """Add counts (scalar or per key) for an array of keys()."""
+        counts = np.broadcast_to(np.asarray(counts, dtype=np.int64), keys_.shape)
+        for row in range(self.depth):
+            np.add.at(self.table[row], self._columns(keys_, row), counts)
+
+    def query(self, item):
+        key = keys([item])
+        return int(min(self.table[row, self._columns(key, row)[0]] for row in range(self.depth)))
+
+    def merge(self, other):
+        merged = CountMinSketch(self.width, self.depth)
+        merged.table = self.table + other.table
+        return merged
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2**p one-byte registers."""
+
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, hashes_):
+        """Add an array of hashes() output."""
+        p = np.uint64(self.p)
+        index = (hashes_ >> (np.uint64(64) - p)).astype(np.intp)
+        rank = np.minimum(65 - _bit_length(hashes_ << p), 65 - self.p).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        merged = HyperLogLog(self.p)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int32)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+
+class _Host:
+    """Exact per-host totals plus distinct ports/peers, kept only while the host is in the top-k."""
+    __slots__ = ("bytes", "flows", "ports", "peers")
+
+    def __init__(self, p):
+        self.bytes = 0
+        self.flows = 0
+        self.ports = HyperLogLog(p)
+        self.peers = HyperLogLog(p)
+
+    def merge(self, other):
+        merged = _Host(self.ports.p)
+        merged.bytes = self.bytes + other.bytes
+        merged.flows = self.flows + other.flows
+        merged.ports = self.ports.merge(other.ports)
+        merged.peers = self.peers.merge(other.peers)
+        return merged
+
+
+class HostSketch:
+    """
+    Bounded-memory traffic attribution for one direction (by source or by
+    destination host). Space-Saving picks the top-k hosts by packets, each
+    tracked host carries bytes/flows and HyperLogLogs of distinct ports and
+    peers, a Count-Min sketch answers packet counts for any host, and a
+    HyperLogLog counts distinct hosts. Memory does not depend on how many
+    hosts are seen.
+    """
+
+    def __init__(self, k=TOP_K, width=CMS_WIDTH, depth=CMS_DEPTH, p=HLL_PRECISION):
+        self.top = SpaceSaving(k)
+        self.packets = CountMinSketch(width, depth)
+        self.distinct = HyperLogLog(p)
+        self.hosts = {}
+        self.p = p
+
+    def add_batch(self, names, inverse, peer_keys, port_keys, packets, nbytes, flows):
+        """
+        Add a batch of flows. names are the distinct hosts and inverse maps
+        each flow to its host (see _intern); the remaining arrays are per flow.
+        Flows are summed per host first, so the per-item Python work is one
+        Space-Saving update per distinct host.
+        """
+        n = len(names)
+        host_keys = keys(names)
+        host_packets = np.bincount(inverse, packets, n).astype(np.int64)
+        self.packets.add(host_keys, host_packets)
+        self.distinct.add(hashes(host_keys))
+
+        for j in np.argsort(-host_packets, kind="stable"):
+            evicted = self.top.update(names[j], int(host_packets[j]))
+            if evicted is not None:
+                self.hosts.pop(evicted, None)
+
+        # Per-host details only for hosts that are still tracked
+        tracked = [j for j, host in enumerate(names) if host in self.top.counts]
+        if not tracked:
+            return
+        host_bytes = np.bincount(inverse, nbytes, n)
+        host_flows = np.bincount(inverse, flows, n).astype(np.int64)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(n + 1))
+        port_hashes, peer_hashes = hashes(port_keys)[order], hashes(peer_keys)[order]
+        for j in tracked:
+            stats = self.hosts.get(names[j])
+            if stats is None:
+                stats = self.hosts[names[j]] = _Host(self.p)
+            stats.bytes += float(host_bytes[j])
+            stats.flows += int(host_flows[j])
+            rows = slice(bounds[j], bounds[j + 1])
+            stats.ports.add(port_hashes[rows])
+            stats.peers.add(peer_hashes[rows])
+
+    def merge(self, other):
+        merged = HostSketch(self.top.k, self.packets.width, self.packets.depth, self.p)
+        merged.top = self.top.merge(other.top)
+        merged.packets = self.packets.merge(other.packets)
+        merged.distinct = self.distinct.merge(other.distinct)
+        for host in merged.top.counts:
+            a, b = self.hosts.get(host), other.hosts.get(host)
+            merged.hosts[host] = a.merge(b) if a and b else (a or b)
+        return merged
+
+    def report(self, n=10):
+        """Top hosts with packets (and overestimate), bytes, flows and distinct ports/peers."""
+        out = []
+        for host, packets, error in self.top.top(n):
+            stats = self.hosts[host]
+            out.append({
+                "host": host,
+                "packets": packets,
+                "error": error,
+                "bytes": stats.bytes,
+                "flows": stats.flows,
+                "distinct_ports": stats.ports.count(),
+                "distinct_peers": stats.peers.count(),
+            })
+        return out
+
+    def most_common(self):
+        top = self.top.top(1)
+        return top[0][0] if top else "unknown"
+
+
+class TrafficSketch:
+    """Per-source and per-destination HostSketches for one window."""
+
+    def __init__(self, k=TOP_K):
+        self.sources = HostSketch(k)
+        self.destinations = HostSketch(k)
+
+    def add_flows(self, src, dst, dport, packets, nbytes, new_flow, label=None):
+        """
+        Add a batch of flows given as equal-length sequences (one item per
+        flow). label, if given, turns a raw address into the host name that
+        is tracked; it is applied once per distinct address.
+        """
+        if not len(src):
+            return
+        src_names, src_inverse = _intern(src)
+        dst_names, dst_inverse = _intern(dst)
+        if label is not None:
+            src_names, dst_names = [label(h) for h in src_names], [label(h) for h in dst_names]
+        src_keys, dst_keys = keys(src_names)[src_inverse], keys(dst_names)[dst_inverse]
+        port_keys = np.asarray(dport, dtype=np.uint64)
+        packets = np.asarray(packets, dtype=float)
+        nbytes = np.asarray(nbytes, dtype=float)
+        flows = np.asarray(new_flow, dtype=float)
+        self.sources.add_batch(src_names, src_inverse, dst_keys, port_keys, packets, nbytes, flows)
+        self.destinations.add_batch(dst_names, dst_inverse, src_keys, port_keys, packets, nbytes, flows)
+
+    def add_flow(self, src, dst, dport, packets, nbytes, new_flow=True):
+        self.add_flows([src], [dst], [dport], [packets], [nbytes], [new_flow])
+
+    def merge(self, other):
+        merged = TrafficSketch(self.sources.top.k)
+        merged.sources = self.sources.merge(other.sources)
+        merged.destinations = self.destinations.merge(other.destinations)
+        return merged
+
+    def report(self, n=10):
+        return {
+            "top_sources": self.sources.report(n),
+            "top_destinations": self.destinations.report(n),
+            "distinct_sources": self.sources.distinct.count(),
+            "distinct_destinations": self.destinations.distinct.count(),
+        }
@@ -0,0 +1,440 @@
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+import zipfile
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# -----------------------
+# CONFIG
+# -----------------------
+CHUNK_ROWS = 2048  # rows traversed at once (memory is rows x trees node ids)
+LEAF_CHECK = 4     # traversal steps between "all rows at a leaf?" checks
+
+# XGBoost objectives whose raw scores are turned into probabilities;
+# "forest" averages per-tree class distributions (scikit-learn forests)
+_OBJECTIVES = ("multi:softprob", "multi:softmax", "binary:logistic", "forest")
+
+
+def _parse_floats(value):
+    """learner_model_param numbers are strings, either "5E-1" or "[5E-1,5E-1]"."""
+    return np.array([float(v) for v in value.strip("[]").split(",")], dtype=np.float64)
+
+
+def _le_threshold(threshold):
+    """
+    float32 t' with x < t' exactly when x <= threshold, for any float32 x,
+    so scikit-learn's "x <= t" (float64 t) splits use XGBoost's rule.
+    """
+    t32 = threshold.astype(np.float32)
+    t32 = np.where(t32 > threshold, np.nextafter(t32, np.float32(-np.inf)), t32)  # largest float32 <= t
+    return np.nextafter(t32, np.float32(np.inf))
+
+
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+
+
+def _mmap_npz(path):
+    """
+    Memory-map every array of an uncompressed .npz (as np.savez writes
+    it): each member is a .npy file stored as is, so its data can be mapped
+    at the member's offset in the archive.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} is compressed and cannot be memory-mapped")
+            f.seek(info.header_offset)
+            header = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+            f.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + header[-2] + header[-1])
+            version = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path}: {info.filename} holds Python objects")
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if np.prod(shape) == 0:
+                arrays[name] = np.empty(shape, dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype, "r", f.tell(), shape, "F" if fortran_order else "C")
+    return arrays
+
+
+class TreeEnsemble:
+    """
+    A tree ensemble (XGBoost booster or scikit-learn forest) compiled to
+    flat NumPy arrays.
+
+    Every tree's nodes are numbered breadth-first, so a node's right child
+    is always left + 1, and concatenated into one set of arrays (feature,
+    threshold, left, default_left, value). One step moves every active
+    (row, tree) pair to left + (x >= threshold), with missing values
+    following default_left; leaves have an infinite threshold and point to
+    themselves. Pairs that reached a leaf are dropped every LEAF_CHECK
+    steps, so deep, unbalanced forests cost their average rather than their
+    maximum depth. There is no per-node Python at evaluation time. Only
+    NumPy is needed to load and evaluate a compiled model; XGBoost or
+    scikit-learn is needed once, to compile it. An optional scaler
+    (mean/scale arrays) is applied to the input first.
+
+    value holds one leaf score per node for XGBoost (tree_group says which
+    class margin a tree adds to) and a class distribution per node for
+    forests (averaged over trees).
+    """
+
+    FORMAT = 2  # bumped whenever the array layout changes
+    _FIELDS = ("feature", "threshold", "left", "default_left", "value", "roots",
+               "tree_group", "base_margin", "classes", "scaler_mean", "scaler_scale")
+
+    def __init__(self, feature, threshold, left, default_left, value, roots, tree_group,
+                 base_margin, objective, n_features, max_depth, classes=None,
+                 scaler_mean=None, scaler_scale=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.tree_group = tree_group
+        self.base_margin = base_margin
+        self.objective = objective
+        self.n_features = n_features
+        self.max_depth = max_depth
+        self.classes = classes
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+        self.sources = None  # {file name: [mtime_ns, size]} of the files it was compiled from
+        self._is_leaf = left == np.arange(len(left))
+        # Sums XGBoost leaf scores per output group with one matrix product
+        self._group_matrix = np.zeros((len(roots), len(base_margin)), dtype=np.float32)
+        self._group_matrix[np.arange(len(roots)), tree_group] = 1.0
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    # -----------------------
+    # COMPILE / SAVE / LOAD
+    # -----------------------
+    @classmethod
+    def from_model(cls, model, scaler=None):
+        """Compile a fitted XGBoost or scikit-learn tree model (and an optional StandardScaler)."""
+        if hasattr(model, "get_booster") or hasattr(model, "save_raw"):
+            return cls.from_xgboost(model, scaler)
+        if hasattr(model, "estimators_") or hasattr(model, "tree_"):
+            return cls.from_sklearn(model, scaler)
+        raise TypeError(f"Cannot compile {type(model).__name__}: expected an XGBoost or scikit-learn tree model")
+
+    @classmethod
+    def from_xgboost(cls, model, scaler=None):
+        """Compile an XGBClassifier/XGBRegressor or Booster."""
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+        objective = learner["objective"]["name"]
+        params = learner["learner_model_param"]
+        n_groups = max(1, int(params.get("num_class", 0)))
+        gbtree = learner["gradient_booster"]
+        if gbtree.get("name") == "dart":
+            raise ValueError("DART boosters are not supported")
+
+        nodes = []
+        for tree in gbtree["model"]["trees"]:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits are not supported")
+            left = np.asarray(tree["left_children"], dtype=np.int32)
+            cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+            leaf = left == -1
+            nodes.append((
+                left, np.asarray(tree["right_children"], dtype=np.int32),
+                np.asarray(tree["split_indices"], dtype=np.int32), np.where(leaf, 0.0, cond),
+                np.asarray(tree["default_left"], dtype=bool), np.where(leaf, cond, 0.0)[:, None],
+            ))
+
+        base = _parse_floats(params["base_score"])
+        if base.size == 1:
+            base = np.repeat(base, n_groups)
+        if objective == "binary:logistic":
+            base = np.log(base / (1.0 - base))  # base_score is a probability
+
+        classes = getattr(model, "classes_", None)
+        return cls._build(nodes, np.asarray(gbtree["model"]["tree_info"], dtype=np.int32), base,
+                          objective, int(params["num_feature"]), classes, scaler)
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None):
+        """Compile a scikit-learn forest (RandomForest/ExtraTrees) or decision tree classifier."""
+        if getattr(model, "n_outputs_", 1) != 1 or not hasattr(model, "classes_"):
+            raise ValueError("Only single-output classifiers are supported")
+        nodes = []
+        for estimator in getattr(model, "estimators_", [model]):
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            dist = tree.value[:, 0, :]
+            dist = dist / np.maximum(dist.sum(axis=1, keepdims=True), 1e-300)  # counts or fractions
+            default_left = getattr(tree, "missing_go_to_left", np.ones(tree.node_count, dtype=bool))
+            nodes.append((
+                tree.children_left.astype(np.int32), tree.children_right.astype(np.int32),
+                np.maximum(tree.feature, 0).astype(np.int32),
+                np.where(leaf, 0.0, _le_threshold(tree.threshold)),
+                np.asarray(default_left, dtype=bool), np.where(leaf[:, None], dist, 0.0),
+            ))
+        n_classes = len(model.classes_)
+        return cls._build(nodes, np.zeros(len(nodes), dtype=np.int32), np.zeros(n_classes),
+                          "forest", int(model.n_features_in_), model.classes_, scaler)
+
+    @classmethod
+    def _build(cls, nodes, tree_group, base_margin, objective, n_features, classes, scaler):
+        """Concatenate per-tree (left, right, feature, threshold, default_left, value) arrays."""
+        feature, threshold, left, default_left, value, roots = [], [], [], [], [], []
+        max_depth, offset = 0, 0
+        for lc, rc, feat, thr, dleft, val in nodes:
+            order, first_child, depth = _breadth_first(lc, rc)
+            leaf = first_child == -1
+            roots.append(offset)
+            feature.append(np.where(leaf, 0, feat[order]))
+            threshold.append(np.where(leaf, np.inf, thr[order]))  # leaves always "go left" to themselves
+            left.append(np.where(leaf, np.arange(len(order)), first_child) + offset)
+            default_left.append(dleft[order] | leaf)
+            value.append(val[order])
+            max_depth = max(max_depth, depth)
+            offset += len(order)
+
+        ensemble = cls(
+            np.concatenate(feature).astype(np.intp), np.concatenate(threshold).astype(np.float32),
+            np.concatenate(left).astype(np.intp), np.concatenate(default_left),
+            np.concatenate(value).astype(np.float32), np.asarray(roots, dtype=np.intp),
+            tree_group, np.asarray(base_margin, dtype=np.float32), objective, n_features, max_depth,
+            classes=None if classes is None else np.asarray(classes),
+        )
+        if scaler is not None:
+            ensemble.scaler_mean = np.asarray(scaler.mean_, dtype=np.float64)
+            ensemble.scaler_scale = np.asarray(scaler.scale_, dtype=np.float64)
+        return ensemble
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in self._FIELDS if getattr(self, name) is not None}
+        meta = {"format": self.FORMAT, "objective": self.objective,
+                "n_features": self.n_features, "max_depth": self.max_depth, "sources": self.sources}
+        # Write aside and rename, so processes that memory-mapped the old file keep a valid copy
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        Load a saved ensemble. With mmap the node arrays are memory-mapped
+        from the file instead of read: loading is nearly free, pages are
+        read on first use and shared by every process using the file.
+        """
+        if mmap:
+            data = _mmap_npz(path)
+        else:
+            with np.load(path, allow_pickle=False) as npz:
+                data = {name: npz[name] for name in npz.files}
+        meta = json.loads(data["meta"].tobytes())
+        if meta.get("format", 1) != cls.FORMAT:
+            raise ValueError(f"{path} has compiled format {meta.get('format', 1)}, expected {cls.FORMAT}")
+        arrays = {name: data[name] for name in cls._FIELDS if name in data}
+        ensemble = cls(objective=meta["objective"], n_features=meta["n_features"],
+                       max_depth=meta["max_depth"], **arrays)
+        ensemble.sources = meta.get("sources")
+        return ensemble
+
+    # -----------------------
+    # EVALUATION
+    # -----------------------
+    def _prepare(self, X):
+        # Columns beyond the model's width are ignored (older agents sent zero pads)
+        X = np.asarray(X)[:, :self.n_features]
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        if self.scaler_mean is not None:
+            X = (X - self.scaler_mean) / self.scaler_scale  # float64, as scaler.transform
+        X = np.asarray(X, dtype=np.float32)  # both libraries compare in float32
+        # +inf compares like the largest float32 against finite thresholds, and stays below a leaf's inf
+        return np.minimum(X, np.finfo(np.float32).max)
+
+    def _traverse(self, X):
+        """Leaf reached by every (row, tree) pair, shape (rows, trees)."""
+        n, n_trees = len(X), self.n_trees
+        flat = X.ravel()
+        node = np.tile(self.roots, n)
+        base = np.repeat(np.arange(n, dtype=np.intp) * X.shape[1], n_trees)
+        active = None  # indices into the (rows * trees) result; None while all pairs are active
+        leaves = np.empty(n * n_trees, dtype=np.intp)
+        for step in range(1, self.max_depth + 1):
+            x = flat.take(base + self.feature.take(node))
+            right = ~(x < self.threshold.take(node))
+            missing = np.isnan(x)
+            if missing.any():
+                right[missing] = ~self.default_left.take(node[missing])
+            node = self.left.take(node) + right
+            if step % LEAF_CHECK == 0 and step < self.max_depth:
+                done = self._is_leaf.take(node)
+                if done.all():
+                    break
+                if done.any():
+                    finished = np.flatnonzero(done) if active is None else active[done]
+                    leaves[finished] = node[done]
+                    keep = ~done
+                    active = np.flatnonzero(keep) if active is None else active[keep]
+                    node, base = node[keep], base[keep]
+        if active is None:
+            leaves = node
+        else:
+            leaves[active] = node
+        return leaves.reshape(n, n_trees)
+
+    def decision_function(self, X):
+        """Raw scores, shape (rows, outputs): class margins (XGBoost) or mean class distributions (forests)."""
+        X = self._prepare(X)
+        out = np.empty((len(X), len(self.base_margin)), dtype=np.float32)
+        for start in range(0, len(X), CHUNK_ROWS):
+            leaves = self._traverse(X[start:start + CHUNK_ROWS])
+            if self.objective == "forest":
+                out[start:start + CHUNK_ROWS] = self.value[leaves].mean(axis=1)
+            else:
+                out[start:start + CHUNK_ROWS] = self.value[leaves, 0] @ self._group_matrix + self.base_margin
+        return out
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X).astype(np.float64)
+        if self.objective == "forest":
+            return scores
+        if self.objective.startswith("multi:"):
+            scores -= scores.max(axis=1, keepdims=True)
+            np.exp(scores, out=scores)
+            return scores / scores.sum(axis=1, keepdims=True)
+        if self.objective == "binary:logistic":
+            p = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        raise ValueError(f"Objective '{self.objective}' has no probabilities (supported: {_OBJECTIVES})")
+
+    def predict(self, X):
+        labels = self.predict_proba(X).argmax(axis=1)
+        return labels if self.classes is None else self.classes[labels]
+
+
+def _breadth_first(left, right):
+    """
+    Breadth-first renumbering of one tree in child-array form (-1 = leaf).
+    Returns the old node ids in new order, each new node's first child
+    (its right child is first + 1; -1 for leaves) and the tree's depth.
+    """
+    left, right = left.tolist(), right.tolist()
+    order, first_child, depth = [0], [], [0]
+    i = 0
+    while i < len(order):
+        node = order[i]
+        if left[node] == -1:
+            first_child.append(-1)
+        else:
+            first_child.append(len(order))
+            order += [left[node], right[node]]
+            depth += [depth[i] + 1] * 2
+        i += 1
+    return np.asarray(order), np.asarray(first_child), max(depth)
+
+
+def file_stamps(paths):
+    """{file name: [mtime_ns, size]} of the existing paths."""
+    stamps = {}
+    for path in paths:
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            stamps[os.path.basename(path)] = [st.st_mtime_ns, st.st_size]
+    return stamps
+
+
+def load_compiled(model_path, scaler_path=None, mmap=False):
+    """
+    Load a compiled ensemble for model_path (a joblib XGBoost or scikit-learn model).
+
+    The compiled form is cached next to the model as <name>.npz, with the
+    modification time and size of the model and scaler it was compiled
+    from; it is used as long as those files are unchanged, so XGBoost (and
+    scikit-learn) are only imported when the cache has to be rebuilt.
+    Replacing either file (even with an older one) recompiles.
+    mmap memory-maps the cache (see TreeEnsemble.load).
+    """
+    cache = os.path.splitext(model_path)[0] + ".npz"
+    sources = file_stamps([model_path, scaler_path])  # taken first: a change while compiling recompiles next time
+    if os.path.exists(cache):
+        try:
+            ensemble = TreeEnsemble.load(cache, mmap)
+            if ensemble.sources == sources:
+                return ensemble
+            log.info("Recompiling %s: the model or scaler changed", model_path)
+        except ValueError as e:
+            log.info("Recompiling %s: %s", model_path, e)
+    ensemble = compile_model(model_path, scaler_path)
+    ensemble.sources = sources
+    try:
+        ensemble.save(cache)
+    except OSError as e:
+        log.warning("Could not cache compiled model at %s: %s", cache, e)
+    return ensemble
+
+
+def compile_model(model_path, scaler_path=None):
+    import joblib  # only needed for compiling
+    scaler = joblib.load(scaler_path) if scaler_path else None
+    return TreeEnsemble.from_model(joblib.load(model_path), scaler)
+
+
+def benchmark(model, ensemble, scaler=None, sizes=(1, 10, 100, 1000, 10000), budget=1.0):
+    """
+    Compare predict_proba latency of the original model and the compiled
+    ensemble (both including scaling) for each batch size. Returns rows of
+    (batch size, model seconds/batch, compiled seconds/batch, max |diff|).
+    """
+    rng = np.random.default_rng(0)
+    mean = scaler.mean_ if scaler is not None else np.zeros(ensemble.n_features)
+    scale = scaler.scale_ if scaler is not None else np.ones(ensemble.n_features)
+    transform = scaler.transform if scaler is not None else (lambda X: X)
+
+    def timed(fn, X):
+        runs, start = 0, time.perf_counter()
+        while runs < 3 or (time.perf_counter() - start < budget and runs < 1000):
+            out = fn(X)
+            runs += 1
+        return (time.perf_counter() - start) / runs, out
+
+    results = []
+    for size in sizes:
+        X = mean + scale * rng.normal(size=(size, ensemble.n_features))
+        model_time, expected = timed(lambda X: model.predict_proba(transform(X)), X)
+        compiled_time, got = timed(ensemble.predict_proba, X)
+        results.append((size, model_time, compiled_time, float(np.abs(expected - got).max())))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a tree model (XGBoost or scikit-learn) for NumPy-only inference")
+    parser.add_argument("model", help="joblib-saved XGBoost or scikit-learn tree model")
+    parser.add_argument("--scaler", help="joblib-saved StandardScaler applied before the model")
+    parser.add_argument("-o", "--output", help="output .npz (default: next to the model)")
+    parser.add_argument("--bench", action="store_true",
+                        help="compare latency against the original model for batch sizes 1 to 10k")
+    args = parser.parse_args()
+
+    ensemble = compile_model(args.model, args.scaler)
+    output = args.output or os.path.splitext(args.model)[0] + ".npz"
+    ensemble.save(output)
+    print(f"[INFO] Compiled {ensemble.n_trees} trees (depth {ensemble.max_depth}) to {output}")
+
+    if args.bench:
+        import joblib
+        scaler = joblib.load(args.scaler) if args.scaler else None
+        print(f"{'batch':>6} {'model ms':>10} {'compiled ms':>12} {'speedup':>8} {'max |diff|':>11}")
+        for size, model_time, compiled_time, diff in benchmark(joblib.load(args.model), ensemble, scaler):
+            print(f"{size:>6} {model_time * 1e3:>10.3f} {compiled_time * 1e3:>12.3f} "
+                  f"{model_time / compiled_time:>7.1f}x {diff:>11.2e}")
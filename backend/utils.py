@@ -1,160 +1,202 @@
+import logging
+import socket
+from functools import reduce
 import numpy as np
-from collections import Counter
-
-# Full 78-feature order (replace/add real features from your training dataset)
-FEATURE_ORDER = [
-    "destination port",
-    "flow duration",
-    "total fwd packets",
-    "total backward packets",
-    "total length of fwd packets",
-    "total length of bwd packets",
-    "fwd packet length max",
-    "fwd packet length min",
-    "fwd packet length mean",
-    "fwd packet length std",
-    "bwd packet length max",
-    "bwd packet length min",
-    "bwd packet length mean",
-    "bwd packet length std",
-    "flow bytes/s",
-    "flow packets/s",
-    "flow iat mean",
-    "flow iat std",
-    "flow iat max",
-    "flow iat min",
-    "fwd iat total",
-    "fwd iat mean",
-    "fwd iat std",
-    "fwd iat max",
-    "fwd iat min",
-    "bwd iat total",
-    "bwd iat mean",
-    "bwd iat std",
-    "bwd iat max",
-    "bwd iat min",
-    "fwd psh flags",
-    "bwd psh flags",
-    "fwd urg flags",
-    "bwd urg flags",
-    "fwd header length",
-    "bwd header length",
-    "fwd packets/s",
-    "bwd packets/s",
-    "min packet length",
-    "max packet length",
-    "packet length mean",
-    "packet length std",
-    "packet length variance",
-    "fin flag count",
-    "syn flag count",
-    "rst flag count",
-    "psh flag count",
-    "ack flag count",
-    "urg flag count",
-    "cwe flag count",
-    "ece flag count",
-    "down/up ratio",
-    "average packet size",
-    "avg fwd segment size",
-    "avg bwd segment size",
-    "fwd header length.1",
-    "fwd avg bytes/bulk",
-    "fwd avg packets/bulk",
-    "fwd avg bulk rate",
-    "bwd avg bytes/bulk",
-    "bwd avg packets/bulk",
-    "bwd avg bulk rate",
-    "subflow fwd packets",
-    "subflow fwd bytes",
-    "subflow bwd packets",
-    "subflow bwd bytes",
-    "init_win_bytes_forward",
-    "init_win_bytes_backward",
-    "act_data_pkt_fwd",
-    "min_seg_size_forward",
-    "active mean",
-    "active std",
-    "active max",
-    "active min",
-    "idle mean",
-    "idle std",
-    "idle max",
-    "idle min",
-] + [f"f{i}" for i in range(72)]  # 72 zero-padded features for now
+from collections import namedtuple
+from sketches import TrafficSketch
+from metrics import timed, SAMPLE_EVERY
+from feature_schema import FLOW_FEATURES
 
+log = logging.getLogger(__name__)
+
+BENIGN_LABEL = 0  # LabelEncoder puts "BENIGN" first among the CIC-IDS2017 labels
+
+# Column order of per-flow rows, see feature_schema
+FEATURE_ORDER = list(FLOW_FEATURES)
+
+# Minimal per-packet record consumed by the flow table
+PacketInfo = namedtuple(
+    "PacketInfo",
+    ["ts", "src", "dst", "sport", "dport", "proto", "payload_len", "header_len", "flags", "window"],
+)
+
+def format_ip(addr):
+    """Formats an address kept as packed bytes (raw decoder) or str (pyshark)."""
+    if isinstance(addr, bytes):
+        family = socket.AF_INET if len(addr) == 4 else socket.AF_INET6
+        return socket.inet_ntop(family, addr)
+    return str(addr)
+
+@timed("extract_features", sample=SAMPLE_EVERY)
 def extract_features_from_packet(pkt):
     """
-    Extracts features from a single packet and returns a dict.
+    Extracts the header fields of a single pyshark packet into a PacketInfo.
+    Returns None for packets without an IP layer or that cannot be parsed.
+    Flow-level features are computed by flow_table.FlowTable.
     """
-    features = {}
     try:
-        features["duration"] = getattr(pkt, "duration", 0.01)
-        features["tot_bytes"] = int(getattr(pkt, "length", 0))
-        features["tot_packets"] = 1
-
-        # TCP info
-        if hasattr(pkt, "tcp"):
-            features["src_port"] = int(getattr(pkt.tcp, "srcport", 0))
-            features["dst_port"] = int(getattr(pkt.tcp, "dstport", 0))
-            features["src_ip"] = pkt.ip.src if hasattr(pkt, "ip") else "unknown"
-            features["dst_ip"] = pkt.ip.dst if hasattr(pkt, "ip") else "unknown"
+        ip = pkt.ip if hasattr(pkt, "ip") else getattr(pkt, "ipv6", None)
+        if ip is None:
+            return None
+        if hasattr(pkt, "ip"):
+            src, dst, ip_header = ip.src, ip.dst, int(ip.hdr_len)
         else:
-            features["src_port"] = 0
-            features["dst_port"] = 0
-            features["src_ip"] = getattr(pkt, "ip_src", "unknown")
-            features["dst_ip"] = getattr(pkt, "ip_dst", "unknown")
+            src, dst, ip_header = ip.src, ip.dst, 40
 
-        features["protocol"] = 6 if getattr(pkt, "transport_layer", "") == "TCP" else 17
+        ts = float(pkt.sniff_timestamp)
+        if hasattr(pkt, "tcp"):
+            tcp = pkt.tcp
+            return PacketInfo(
+                ts, src, dst, int(tcp.srcport), int(tcp.dstport), 6,
+                int(tcp.len), ip_header + int(tcp.hdr_len),
+                int(tcp.flags, 16), int(tcp.window_size_value),
+            )
+        if hasattr(pkt, "udp"):
+            udp = pkt.udp
+            return PacketInfo(
+                ts, src, dst, int(udp.srcport), int(udp.dstport), 17,
+                int(udp.length) - 8, ip_header + 8, 0, 0,
+            )
+        return PacketInfo(ts, src, dst, 0, 0, int(getattr(ip, "proto", getattr(ip, "nxt", 0))), 0, ip_header, 0, 0)
     except Exception as e:
-        print(f"[WARN] Could not parse packet: {e}")
+        log.warning("Could not parse packet: %s", e)
+        return None
 
-    # Zero-fill remaining features
-    for f in FEATURE_ORDER:
-        if f not in features:
-            features[f] = 0
+# Layout of the aggregated window vector: mean, std, min and max blocks over FEATURE_ORDER
+AGG_STATS = ("mean", "std", "min", "max")
+AGG_FEATURE_ORDER = [f"{f}_{stat}" for stat in AGG_STATS for f in FEATURE_ORDER]
+AGG_INDEX = {name: i for i, name in enumerate(AGG_FEATURE_ORDER)}
 
+class WindowBuffer:
+    """
+    Preallocated columnar (rows x features) float32 buffer for one window,
+    in the wire and model dtype. Capacity doubles when full and is kept
+    across windows.
+    """
+
+    def __init__(self, n_features=len(FEATURE_ORDER), capacity=1024):
+        self.data = np.zeros((capacity, n_features), dtype=np.float32)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
 
+    def append(self, values):
+        """Write one row; values may be shorter than the width (rest is zero)."""
+        if self.n == len(self.data):
+            grown = np.zeros((2 * len(self.data), self.data.shape[1]), dtype=self.data.dtype)
+            grown[:self.n] = self.data
+            self.data = grown
+        row = self.data[self.n]
+        row[:len(values)] = values
+        self.n += 1
 
-    # Keep consistent order
-    ordered_features = {f: features[f] for f in FEATURE_ORDER}
-    return ordered_features
+    def clear(self):
+        self.data[:self.n] = 0
+        self.n = 0
 
+    def aggregate(self):
+        """Return mean, std, min and max per column as one flat AGG_FEATURE_ORDER vector."""
+        return aggregate_rows(self.data[:self.n], self.data.shape[1])
 
+def aggregate_rows(rows, width=None):
+    """One axis-0 reduction per statistic over a (rows x features) array."""
+    width = rows.shape[1] if width is None else width
+    out = np.zeros(len(AGG_STATS) * width)
+    if len(rows):
+        np.mean(rows, axis=0, dtype=np.float64, out=out[:width])
+        np.std(rows, axis=0, dtype=np.float64, out=out[width:2 * width])
+        np.min(rows, axis=0, out=out[2 * width:3 * width])
+        np.max(rows, axis=0, out=out[3 * width:])
+    return out
 
-def preprocess_features(features: dict, scaler):
+def agg_value(vector, feature, stat="mean"):
+    """Reads one statistic of one feature from an aggregated window vector."""
+    return float(vector[AGG_INDEX[f"{feature}_{stat}"]])
+
+@timed("aggregate_window")
+def aggregate_window(window, buffer=None):
     """
-    Converts a feature dict to a 78-feature numpy array and scales it.
+    Aggregates the flows of a window (flow_table.Flow objects) into a flat
+    AGG_FEATURE_ORDER vector of per-feature mean, std, min and max.
+    Per-host attribution goes into a fixed-size TrafficSketch (top sources
+    and destinations); src_ip is the top source. Also keeps the per-flow
+    rows (float32) and flow keys for scoring on the backend.
     """
-    X = np.array([features[f] for f in FEATURE_ORDER], dtype=float).reshape(1, -1)
-    X_scaled = scaler.transform(X)
-    return X_scaled
+    if buffer is None:
+        buffer = WindowBuffer()
+    buffer.clear()
+    src, dst, dport, deltas = [], [], [], []
+    for flow in window:
+        buffer.append(flow.values())
+        src.append(flow.src)
+        dst.append(flow.dst)
+        dport.append(flow.dport)
+        # Only the packets/bytes since the flow was last reported count for this window
+        deltas.append(flow.take_delta())
+    traffic = TrafficSketch()
+    packets, nbytes, new_flow = zip(*deltas) if deltas else ((), (), ())
+    traffic.add_flows(src, dst, dport, packets, nbytes, new_flow, label=format_ip)
+
+    return {
+        "features": buffer.aggregate(),
+        "src_ip": traffic.sources.most_common(),
+        "traffic": traffic,
+        "n_flows": len(window),
+        "rows": buffer.data[:buffer.n].copy(),
+        "keys": [flow.key_string() for flow in window],
+    }
 
-def aggregate_window(window):
+def merge_windows(aggs):
+    """Merges aggregate_window outputs computed over disjoint sets of flows."""
+    rows = np.concatenate([agg["rows"] for agg in aggs])
+    traffic = reduce(lambda a, b: a.merge(b), (agg["traffic"] for agg in aggs))
+    return {
+        "features": aggregate_rows(rows, len(FEATURE_ORDER)),
+        "src_ip": traffic.sources.most_common(),
+        "traffic": traffic,
+        "n_flows": len(rows),
+        "rows": rows,
+        "keys": [key for agg in aggs for key in agg["keys"]],
+    }
+
+def window_alert(keys, labels, proba, features=None, **fields):
     """
-    Aggregates a list of packet dicts into summary statistics
-    (mean, std, min, max) for numeric features.
-    Also keeps the most common src_ip in the window.
+    Summarizes the per-flow labels and class probabilities of one window as
+    one alert. The riskiest attack flow's source becomes src_ip and its
+    class and class probability label and proba (benign and the lowest
+    benign probability when no flow is an attack); fields (src_ip,
+    timestamp, agent_id, ...) fill in the rest. With the window's feature
+    rows, the riskiest flow's row is kept as features, so a labeled event
+    can be trained on (incremental_train).
     """
-    if not window:
-        agg = {f"{f}_mean": 0 for f in FEATURE_ORDER}
-        agg.update({f"{f}_std": 0 for f in FEATURE_ORDER})
-        agg.update({f"{f}_min": 0 for f in FEATURE_ORDER})
-        agg.update({f"{f}_max": 0 for f in FEATURE_ORDER})
-        agg["src_ip"] = "unknown"
-        return agg
-
-    agg = {}
-    # Numeric feature statistics
-    for f in FEATURE_ORDER:
-        values = [pkt.get(f, 0) for pkt in window]
-        agg[f"{f}_mean"] = float(np.mean(values))
-        agg[f"{f}_std"] = float(np.std(values))
-        agg[f"{f}_min"] = float(np.min(values))
-        agg[f"{f}_max"] = float(np.max(values))
-
-    # Most common src_ip in window
-    src_ips = [pkt.get("src_ip") for pkt in window if "src_ip" in pkt]
-    agg["src_ip"] = Counter(src_ips).most_common(1)[0][0] if src_ips else "unknown"
-
-    return agg
+    n_flows = len(labels)
+    alert = {
+        "alert_type": "Normal Traffic",
+        "src_ip": "unknown",
+        "description": "No intrusion detected",
+        **fields,
+        "n_flows": n_flows,
+        "label": BENIGN_LABEL,
+        "proba": 1.0,
+        "risk": 0.0,
+    }
+    if n_flows == 0:
+        return alert
+
+    risk = 1.0 - proba[:, BENIGN_LABEL]
+    attacks = labels != BENIGN_LABEL
+    alert["risk"] = float(risk.max())
+    alert["proba"] = 1.0 - alert["risk"]
+    worst = int(np.argmax(np.where(attacks, risk, -1.0))) if attacks.any() else int(np.argmax(risk))
+    if features is not None:
+        alert["features"] = features[worst].tolist()
+    if attacks.any():
+        alert.update({
+            "alert_type": "Intrusion Detected",
+            "label": int(labels[worst]),
+            "proba": float(proba[worst, labels[worst]]),
+            "src_ip": keys[worst].split(" ", 1)[0] if len(keys) else "unknown",
+            "description": f"{int(attacks.sum())} of {n_flows} flows classified as attack class {int(labels[worst])}",
+        })
+    return alert
@@ -0,0 +1,129 @@
+import math
+import threading
+import time
+from collections import deque
+import numpy as np
+from utils import AGG_STATS
+
+
+class PaneStats:
+    """
+    Mergeable per-column statistics of one pane (sub-window): count, mean,
+    sum of squared deviations (M2), min and max. Two panes combine with
+    Chan et al.'s parallel variance update, so a window never revisits rows.
+    """
+    __slots__ = ("n", "mean", "m2", "min", "max")
+
+    def __init__(self, n, mean, m2, min_, max_):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.min = min_
+        self.max = max_
+
+    @classmethod
+    def from_vector(cls, vector, n):
+        """Rebuild pane statistics from an AGG_FEATURE_ORDER vector over n rows."""
+        mean, std, min_, max_ = np.split(np.asarray(vector, dtype=float), len(AGG_STATS))
+        return cls(n, mean, std * std * n, min_, max_)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            return other
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        mean = self.mean + delta * (other.n / n)
+        m2 = self.m2 + other.m2 + delta * delta * (self.n * other.n / n)
+        return PaneStats(n, mean, m2, np.minimum(self.min, other.min), np.maximum(self.max, other.max))
+
+    def vector(self):
+        """Return the statistics as an AGG_FEATURE_ORDER vector (population std)."""
+        if self.n == 0:
+            return np.zeros(len(AGG_STATS) * len(self.mean))
+        return np.concatenate([self.mean, np.sqrt(self.m2 / self.n), self.min, self.max])
+
+
+class SlidingWindow:
+    """
+    Combines hop-sized panes into windows of `length` seconds.
+
+    Used as the capture engine's emit callback: each closed pane is merged
+    with the previous length/hop - 1 panes, so an overlapping window costs
+    one pane of new rows plus a constant number of vector merges. The
+    emitted window keeps the newest pane's flow rows and keys (what changed
+    since the last hop) and window-wide features and traffic sketches.
+    """
+
+    def __init__(self, length, hop, emit):
+        if hop <= 0 or length < hop:
+            raise ValueError("Window length must be at least one hop and hop must be positive")
+        self.length = length
+        self.hop = hop
+        self.emit = emit
+        self.panes = deque(maxlen=max(1, round(length / hop)))
+
+    def __call__(self, pane):
+        stats = PaneStats.from_vector(pane["features"], pane["n_flows"])
+        self.panes.append((pane["start"], stats, pane["traffic"]))
+
+        merged = PaneStats(0, None, None, None, None)
+        traffic = None
+        for _, pane_stats, pane_traffic in self.panes:
+            merged = merged.merge(pane_stats)
+            traffic = pane_traffic if traffic is None else traffic.merge(pane_traffic)
+
+        window = dict(pane)
+        window["start"] = self.panes[0][0]
+        window["features"] = merged.vector() if merged.n else np.zeros_like(pane["features"])
+        window["traffic"] = traffic
+        window["src_ip"] = traffic.sources.most_common()
+        window["window_flows"] = merged.n
+        self.emit(window)
+
+
+class WindowClock:
+    """
+    Closes a pane at every multiple of `hop` seconds, including panes in
+    which no packet arrived. advance() is driven either by packet
+    timestamps (replay) or by a timer thread (live capture, see start_timer).
+    """
+
+    def __init__(self, hop, on_pane):
+        self.hop = hop
+        self.on_pane = on_pane
+        self.start = None
+        self.next = None
+
+    def begin(self, now):
+        self.start = math.floor(now / self.hop) * self.hop
+        self.next = self.start + self.hop
+
+    def advance(self, now):
+        if self.next is None:
+            self.begin(now)
+        while now >= self.next:
+            self.on_pane(self.start, self.next)
+            self.start, self.next = self.next, self.next + self.hop
+
+    def flush(self, now):
+        """Close the current partial pane and expire every remaining flow."""
+        if self.next is not None:
+            self.on_pane(self.start, now, flush=True)
+            self.start = None
+            self.next = None
+
+
+def start_timer(clock, lock, stop):
+    """Drive a WindowClock from the wall clock until `stop` is set."""
+    def run():
+        while not stop.wait(max(0.0, clock.next - time.time())):
+            with lock:
+                clock.advance(time.time())
+
+    with lock:
+        clock.begin(time.time())
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
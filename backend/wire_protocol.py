@@ -0,0 +1,133 @@
+import json
+import struct
+import zlib
+from collections import namedtuple
+import numpy as np
+
+# -----------------------
+# FRAME LAYOUT (little-endian)
+# -----------------------
+# header   magic "IDSW", version u8, flags u8, agent id length u16,
+#          rows u32, cols u32, window start f64, window end f64, keys length u32
+# body     agent id (utf-8, padded to 4 bytes)
+#          [FLAG_META] meta length u32 + JSON object (utf-8, padded to 4 bytes)
+# payload  flow keys (utf-8, one per row, "\n"-separated, padded to 4 bytes)
+#          + float32 feature matrix (rows x cols, C order)
+# With FLAG_ZLIB the payload is zlib-compressed as a whole.
+MAGIC = b"IDSW"
+VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_META = 0x02
+MAX_FRAME_BYTES = 64 << 20  # largest decoded payload (keys + feature matrix) a frame may declare
+
+_HEADER = struct.Struct("<4sBBHIIddI")
+_META_LEN = struct.Struct("<I")
+
+WindowBatch = namedtuple("WindowBatch", ["agent_id", "window_start", "window_end", "keys", "features", "meta"])
+
+
+class WireFormatError(ValueError):
+    """Raised for frames that are not valid IDSW frames."""
+
+
+def _pad(n):
+    return -n % 4
+
+
+def encode_batch(features, keys=(), agent_id="", window_start=0.0, window_end=0.0, compress=False, meta=None):
+    """
+    Packs a (rows x features) matrix and its flow keys into one binary frame.
+    meta is an optional JSON-serializable dict of window-level information
+    (e.g. top talkers); it is sent uncompressed ahead of the payload.
+    """
+    matrix = np.ascontiguousarray(features, dtype="<f4")
+    if matrix.ndim != 2:
+        raise ValueError("features must be a 2-D (rows x features) array")
+    rows, cols = matrix.shape
+    keys = list(keys)
+    if keys and len(keys) != rows:
+        raise ValueError(f"Got {len(keys)} flow keys for {rows} rows")
+
+    agent = agent_id.encode("utf-8")
+    key_blob = "\n".join(keys).encode("utf-8")
+    payload = b"".join((key_blob, b"\0" * _pad(len(key_blob)), matrix.tobytes()))
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+
+    body = [agent, b"\0" * _pad(len(agent))]
+    if meta:
+        meta_blob = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        body += [_META_LEN.pack(len(meta_blob)), meta_blob, b"\0" * _pad(len(meta_blob))]
+        flags |= FLAG_META
+
+    header = _HEADER.pack(MAGIC, VERSION, flags, len(agent), rows, cols,
+                          window_start, window_end, len(key_blob))
+    return b"".join((header, *body, payload))
+
+
+def decode_batch(data):
+    """
+    Unpacks a frame produced by encode_batch. For uncompressed frames the
+    feature matrix is a read-only view on the received bytes (no copy).
+    """
+    buf = memoryview(data)
+    if len(buf) < _HEADER.size:
+        raise WireFormatError("Frame shorter than header")
+    magic, version, flags, agent_len, rows, cols, start, end, keys_len = _HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise WireFormatError(f"Bad magic {magic!r}")
+    if version != VERSION:
+        raise WireFormatError(f"Unsupported frame version {version}")
+
+    offset = _HEADER.size
+    try:
+        agent_id = bytes(buf[offset:offset + agent_len]).decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise WireFormatError(f"Bad agent id: {e}") from None
+    offset += agent_len + _pad(agent_len)
+
+    meta = {}
+    if flags & FLAG_META:
+        if len(buf) < offset + _META_LEN.size:
+            raise WireFormatError("Frame truncated in meta section")
+        (meta_len,) = _META_LEN.unpack_from(buf, offset)
+        offset += _META_LEN.size
+        try:
+            meta = json.loads(bytes(buf[offset:offset + meta_len]))
+        except ValueError as e:
+            raise WireFormatError(f"Bad meta section: {e}") from None
+        if not isinstance(meta, dict):
+            raise WireFormatError(f"Meta section is a {type(meta).__name__}, not an object")
+        offset += meta_len + _pad(meta_len)
+
+    payload = buf[offset:]
+    key_end = keys_len + _pad(keys_len)
+    expected = key_end + rows * cols * 4
+    if expected > MAX_FRAME_BYTES:
+        # checked before inflating anything: the header alone must not size the allocation
+        raise WireFormatError(f"Frame declares {rows}x{cols} features, over {MAX_FRAME_BYTES} bytes")
+    if flags & FLAG_ZLIB:
+        # inflate no more than the header promises, so a small frame cannot expand without bound
+        inflater = zlib.decompressobj()
+        try:
+            inflated = inflater.decompress(payload, expected + 1)
+        except zlib.error as e:
+            raise WireFormatError(f"Bad compressed payload: {e}") from None
+        if len(inflated) > expected or inflater.unconsumed_tail:
+            raise WireFormatError("Compressed payload inflates past its header")
+        if not inflater.eof:
+            raise WireFormatError("Compressed payload is truncated")
+        payload = memoryview(inflated)
+    if len(payload) != expected:
+        raise WireFormatError("Frame length does not match its header")
+
+    try:
+        keys = bytes(payload[:keys_len]).decode("utf-8").split("\n") if keys_len else []
+    except UnicodeDecodeError as e:
+        raise WireFormatError(f"Bad flow keys: {e}") from None
+    if keys and len(keys) != rows:
+        raise WireFormatError(f"Frame has {len(keys)} flow keys for {rows} rows")
+    features = np.frombuffer(payload, dtype="<f4", count=rows * cols, offset=key_end).reshape(rows, cols)
+    return WindowBatch(agent_id, start, end, keys, features, meta)
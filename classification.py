@@ -6,14 +6,14 @@ from sklearn.ensemble import RandomForestClassifier
 from xgboost import XGBClassifier
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
+from utils import load_matrix, save_feature_schema
 
 # --------------------------
 # Load merged processed dataset
 # --------------------------
-df = pd.read_csv("data/processed.csv")  # replace with your merged CSV path
-label_col = "label"  # change if your label column has another name
-X = df.drop(columns=[label_col]).values
-y = df[label_col].values
+# float32 feature matrix (memory-mapped) and integer labels of the
+# dataset written by merge_and_preprocess
+X, y, feature_cols = load_matrix("data/processed")
 
 # --------------------------
 # Train/test split
@@ -29,8 +29,9 @@ scaler = StandardScaler()
 X_train = scaler.fit_transform(X_train)
 X_test = scaler.transform(X_test)
 
-# Save scaler for later use
+# Save scaler for later use, with the feature layout it was fitted on
 joblib.dump(scaler, "models/scaler.joblib")
+save_feature_schema(scaler, feature_cols, "models/feature_schema.json")
 
 # --------------------------
 # Train Random Forest
@@ -4,6 +4,13 @@ from utils import save_csv, load_csv, standardize_features
 from sklearn.preprocessing import LabelEncoder
 
 DEFAULT_FEATURES = None  # None means infer from CSV (all numeric except label)
+CLIP = 1e10  # feature values are clipped to [-CLIP, CLIP]
+
+def clean_features(df, feature_cols):
+    """Replace missing and infinite feature values with 0 and clip the rest."""
+    df[feature_cols] = df[feature_cols].replace([np.inf, -np.inf], np.nan).fillna(0)
+    df[feature_cols] = df[feature_cols].clip(lower=-CLIP, upper=CLIP)
+    return df
 
 def basic_preprocess(input_csv="data/raw.csv", output_csv="data/processed.csv", label_col="label"):
     df = load_csv(input_csv)
@@ -15,11 +22,9 @@ def basic_preprocess(input_csv="data/raw.csv", output_csv="data/processed.csv",
     df = df.dropna(axis=1, thresh=int(len(df)*0.5))
     df = df.fillna(0)
 
-    df = df.replace([np.inf, -np.inf], np.nan)
-    df = df.fillna(0)
     numeric_cols = df.select_dtypes(include=[np.number]).columns
     numeric_cols = [c for c in numeric_cols if c != label_col]
-    df[numeric_cols] = df[numeric_cols].clip(lower=-1e10, upper=1e10)
+    df = clean_features(df, numeric_cols)
 
     # Ensure label exists
     if label_col not in df.columns:
@@ -1,21 +1,41 @@
 # ids_project/dataset_optimizer.py
 
+import argparse
+import math
+import os
+import shutil
 import pandas as pd
 import numpy as np
 from sklearn.feature_selection import VarianceThreshold
+from utils import load_dataset
+from dataset_store import DatasetWriter, is_dataset, iter_dataset, read_manifest, save_dataset
 
-def optimize_dataset(input_csv="data/processed.csv", output_csv="data/optimized.csv",
+# -----------------------
+# CONFIG
+# -----------------------
+CHUNK_ROWS = 100_000   # rows per batch (and per output partition) in the out-of-core mode
+RANDOM_SEED = 42
+
+def optimize_dataset(input_csv="data/processed", output_csv="data/optimized",
                      benign_ratio=2, variance_threshold=0.0, corr_threshold=0.95,
-                     binary_labels=True):
+                     binary_labels=True, chunk_rows=None):
     """
     Optimize IDS dataset for efficiency and training usability.
     - Downsamples benign traffic (class balancing)
     - Optionally collapses to binary labels (BENIGN vs ATTACK)
     - Drops low-variance & highly correlated features
+    With chunk_rows, a dataset directory is optimized out of core
+    (optimize_dataset_chunked) instead of loaded whole.
     """
+    if chunk_rows:
+        if not is_dataset(input_csv):
+            raise ValueError(f"The out-of-core mode (chunk_rows) reads dataset directories written by "
+                             f"merge_and_preprocess or save_dataset; {input_csv} is not one")
+        return optimize_dataset_chunked(input_csv, output_csv, benign_ratio, variance_threshold,
+                                        corr_threshold, binary_labels, chunk_rows)
 
     print(f"📥 Loading dataset from {input_csv} ...")
-    df = pd.read_csv(input_csv)
+    df = load_dataset(input_csv)  # a CSV or the partitioned dataset from merge_and_preprocess
     print("Original shape:", df.shape)
 
     # ✅ Normalize column names
@@ -36,7 +56,7 @@ def optimize_dataset(input_csv="data/processed.csv", output_csv="data/optimized.
     # ✅ Drop low-variance features
     if variance_threshold > 0:
         selector = VarianceThreshold(threshold=variance_threshold)
-        numeric_cols = df_balanced.select_dtypes(include=[np.number]).columns.tolist()
+        numeric_cols = [c for c in df_balanced.select_dtypes(include=[np.number]).columns if c != 'label']
         X = df_balanced[numeric_cols]
         selector.fit(X)
         kept = [c for c, keep in zip(numeric_cols, selector.get_support()) if keep]
@@ -45,7 +65,7 @@ def optimize_dataset(input_csv="data/processed.csv", output_csv="data/optimized.
 
     # ✅ Drop highly correlated features
     if corr_threshold < 1.0:
-        corr = df_balanced.corr(numeric_only=True).abs()
+        corr = df_balanced.drop(columns=['label']).corr(numeric_only=True).abs()  # features only: never drop the label
         upper = corr.where(np.triu(np.ones(corr.shape), k=1).astype(bool))
         to_drop = [column for column in upper.columns if any(upper[column] > corr_threshold)]
         df_balanced = df_balanced.drop(columns=to_drop)
@@ -54,9 +74,172 @@ def optimize_dataset(input_csv="data/processed.csv", output_csv="data/optimized.
     # ✅ Shuffle
     df_balanced = df_balanced.sample(frac=1, random_state=42).reset_index(drop=True)
 
-    # ✅ Save optimized dataset
-    df_balanced.to_csv(output_csv, index=False)
+    # ✅ Save optimized dataset (float32 Parquet dataset directory, or CSV for a .csv path)
+    if output_csv.endswith(".csv"):
+        df_balanced.to_csv(output_csv, index=False)
+    else:
+        save_dataset(df_balanced, output_csv)
     print(f"✅ Optimized dataset saved to {output_csv} with shape {df_balanced.shape}")
 
+class StreamingMoments:
+    """
+    Column means and co-moments (covariance matrix times n) of a stream
+    of row blocks, accumulated in float64 in one pass with the pairwise
+    update of Chan et al., so variance and correlation need no second
+    pass and no copy of the data.
+    """
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean = np.zeros(n_features)
+        self.comoment = np.zeros((n_features, n_features))
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        n_block = len(X)
+        if not n_block:
+            return
+        mean_block = X.mean(axis=0)
+        centered = X - mean_block
+        delta = mean_block - self.mean
+        n = self.n + n_block
+        self.comoment += centered.T @ centered + np.outer(delta, delta) * (self.n * n_block / n)
+        self.mean += delta * (n_block / n)
+        self.n = n
+
+    def variance(self):
+        """Population variance (ddof=0), as VarianceThreshold uses."""
+        return np.diag(self.comoment) / max(self.n, 1)
+
+    def correlation(self):
+        """Pearson correlation matrix; NaN for constant columns, as DataFrame.corr gives."""
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.comoment / np.outer(std, std)
+
+
+def benign_code(manifest):
+    """Label code of benign traffic: the BENIGN class, or 0 for datasets without label names."""
+    classes = [str(c).lower() for c in manifest.get("label_classes") or []]
+    return classes.index("benign") if "benign" in classes else 0
+
+
+def class_quotas(counts, benign, benign_ratio):
+    """Rows kept per class: all attack rows and up to benign_ratio benign rows per attack row."""
+    attacks = sum(n for c, n in counts.items() if c != benign)
+    return {c: min(attacks * benign_ratio, n) if c == benign else n for c, n in counts.items()}
+
+
+def sample_rows(labels, remaining, needed, rng):
+    """
+    Positions of the rows of one chunk to keep, so that over the whole
+    stream exactly needed[c] of the remaining[c] rows of each class are
+    kept, uniformly at random. The count taken from a chunk follows the
+    hypergeometric distribution; both dicts are updated in place.
+    """
+    keep = []
+    for c in np.unique(labels):
+        rows = np.flatnonzero(labels == c)
+        take = rng.hypergeometric(len(rows), remaining[c] - len(rows), needed[c]) if needed[c] else 0
+        keep.append(rng.choice(rows, take, replace=False))
+        remaining[c] -= len(rows)
+        needed[c] -= take
+    return np.sort(np.concatenate(keep)) if keep else np.zeros(0, dtype=np.int64)
+
+
+def select_features(moments, features, variance_threshold, corr_threshold):
+    """The features kept by the variance and correlation filters of optimize_dataset."""
+    keep = np.ones(len(features), dtype=bool)
+    if variance_threshold > 0:
+        keep &= moments.variance() > variance_threshold
+    if corr_threshold < 1.0:
+        idx = np.flatnonzero(keep)
+        corr = np.abs(moments.correlation()[np.ix_(idx, idx)])
+        upper = np.triu(corr, k=1)  # NaN (constant columns) never exceeds the threshold
+        keep[idx[(upper > corr_threshold).any(axis=0)]] = False
+    return [f for f, k in zip(features, keep) if k]
+
+
+def optimize_dataset_chunked(input_dir="data/processed", output_dir="data/optimized", benign_ratio=2,
+                             variance_threshold=0.0, corr_threshold=0.95, binary_labels=True,
+                             chunk_rows=CHUNK_ROWS, seed=RANDOM_SEED):
+    """
+    optimize_dataset for a dataset directory larger than memory; memory
+    is bounded by chunk_rows whatever the dataset size.
+
+    1. Count the rows per class, reading only the label column.
+    2. In one pass over all columns, sample the benign rows to keep
+       (sample_rows), accumulate the variance and correlation of the kept
+       rows (StreamingMoments) and scatter them over random spill buckets
+       of about chunk_rows rows each.
+    3. Shuffle every bucket in memory and write it, with the selected
+       features, as one output partition: together a uniformly shuffled
+       dataset.
+    """
+    rng = np.random.default_rng(seed)
+    manifest = read_manifest(input_dir)
+    features, label_col = manifest["feature_cols"], manifest["label_col"]
+    benign = benign_code(manifest)
+
+    def labels_of(df):
+        labels = df[label_col].to_numpy()
+        return (labels != benign).astype(np.int8) if binary_labels else labels
+
+    print(f"📥 Counting classes in {input_dir} ...")
+    counts = {}
+    for df in iter_dataset(input_dir, [label_col], chunk_rows):
+        values, n = np.unique(labels_of(df), return_counts=True)
+        for c, k in zip(values.tolist(), n.tolist()):
+            counts[c] = counts.get(c, 0) + k
+    benign_label = 0 if binary_labels else benign
+    needed = class_quotas(counts, benign_label, benign_ratio)
+    remaining = dict(counts)
+    total = sum(needed.values())
+    print(f"Original rows: {sum(counts.values())}, balanced rows: {total}")
+
+    import pyarrow as pa
+    spill_dir = os.path.join(output_dir, "_spill")
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    os.makedirs(spill_dir)
+    n_buckets = max(1, math.ceil(total / chunk_rows))
+    spill_schema = pa.schema([pa.field(f, pa.float32()) for f in features] + [pa.field(label_col, pa.int32())])
+    buckets = [pa.ipc.new_file(os.path.join(spill_dir, f"{b:04d}.arrow"), spill_schema) for b in range(n_buckets)]
+    moments = StreamingMoments(len(features))
+    try:
+        for df in iter_dataset(input_dir, features + [label_col], chunk_rows):
+            labels = labels_of(df)
+            rows = sample_rows(labels, remaining, needed, rng)
+            kept = df.iloc[rows].assign(**{label_col: labels[rows].astype(np.int32)})
+            moments.update(kept[features].to_numpy())
+            bucket_of = rng.integers(n_buckets, size=len(kept))
+            for b in np.unique(bucket_of):
+                batch = pa.RecordBatch.from_pandas(kept[bucket_of == b], schema=spill_schema, preserve_index=False)
+                buckets[b].write_batch(batch)
+    finally:
+        for bucket in buckets:
+            bucket.close()
+
+    selected = select_features(moments, features, variance_threshold, corr_threshold)
+    print(f"Kept {len(selected)} of {len(features)} features")
+    label_dtype = np.int8 if max(counts, default=0) < 128 else np.int32
+    writer = DatasetWriter(output_dir, selected, label_col, None if binary_labels else manifest.get("label_classes"),
+                           pa.from_numpy_dtype(label_dtype))
+    for b in range(n_buckets):
+        with pa.OSFile(os.path.join(spill_dir, f"{b:04d}.arrow")) as source:
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+        df = df.iloc[rng.permutation(len(df))]
+        writer.write(df.assign(**{label_col: df[label_col].astype(label_dtype)}))
+    shutil.rmtree(spill_dir)
+    writer.close(dropped_cols=[f for f in features if f not in selected], source=input_dir)
+    print(f"✅ Optimized dataset saved to {output_dir} with shape ({writer.rows}, {len(selected) + 1})")
+    return output_dir
+
+
 if __name__ == "__main__":
-    optimize_dataset()
+    parser = argparse.ArgumentParser(description="Balance classes and prune redundant features of an IDS dataset")
+    parser.add_argument("input", nargs="?", default="data/processed", help="dataset directory or CSV")
+    parser.add_argument("-o", "--output", default="data/optimized", help="output dataset directory (or .csv)")
+    parser.add_argument("--chunk-rows", type=int, default=None,
+                        help=f"optimize out of core in batches of this many rows (e.g. {CHUNK_ROWS})")
+    args = parser.parse_args()
+    optimize_dataset(args.input, args.output, chunk_rows=args.chunk_rows)
@@ -0,0 +1,214 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# -----------------------
+# CONFIG
+# -----------------------
+FORMAT_VERSION = 1
+MANIFEST_FILE = "_manifest.json"
+CACHE_DIR = "_cache"          # memory-mappable .npy matrices built from the partitions
+PARTITION_ROWS = 1_000_000    # rows per Parquet file written by save_dataset
+BATCH_ROWS = 100_000          # rows per DataFrame yielded by iter_dataset
+LABEL_COL = "label"
+
+# A dataset is a directory of Parquet partitions sharing one column layout
+# (float32 features, labels as dictionary-encoded names or narrow ints)
+# plus _manifest.json: format version, row count, feature columns, label
+# column, label classes (the dataset-wide encoding of label names) and
+# partitions. merge_and_preprocess writes one in parallel; save_dataset
+# writes a DataFrame as one.
+
+
+def is_dataset(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("version", 1) > FORMAT_VERSION:
+        raise ValueError(f"{path} has dataset format {manifest['version']}, this build reads up to {FORMAT_VERSION}")
+    return manifest
+
+
+def write_manifest(path, manifest):
+    tmp = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"version": FORMAT_VERSION, **manifest}, f, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST_FILE))
+
+
+def arrow_schema(features, label_col=LABEL_COL, label_type=None):
+    """float32 feature columns and a label column (dictionary-encoded names by default)."""
+    import pyarrow as pa
+    label_type = label_type or pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([pa.field(c, pa.float32()) for c in features] + [pa.field(label_col, label_type)])
+
+
+def downcast(df, exclude=()):
+    """float64 columns to float32 and integer columns to the narrowest integer type, in place."""
+    for col in df.columns:
+        if col in exclude:
+            continue
+        kind = df[col].dtype.kind
+        if kind == "f" and df[col].dtype != np.float32:
+            df[col] = df[col].astype(np.float32)
+        elif kind in "iu":
+            df[col] = pd.to_numeric(df[col], downcast="integer" if kind == "i" else "unsigned")
+    return df
+
+
+class DatasetWriter:
+    """
+    Writes a dataset directory one partition per write() call, so it can
+    be produced from a stream of DataFrames; close() writes the manifest.
+    """
+
+    def __init__(self, path, features, label_col=LABEL_COL, label_classes=None, label_type=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.features = list(features)
+        self.label_col = label_col
+        self.label_classes = label_classes
+        self.schema = arrow_schema(self.features, label_col, label_type)
+        self.partitions = []
+        self.rows = 0
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        name = f"part-{len(self.partitions):04d}.parquet"
+        table = pa.Table.from_pandas(df[self.features + [self.label_col]], schema=self.schema, preserve_index=False)
+        pq.write_table(table, os.path.join(self.path, name))
+        self.partitions.append({"path": name, "rows": len(df)})
+        self.rows += len(df)
+
+    def close(self, **manifest):
+        """Write the manifest; keyword arguments are added to it."""
+        write_manifest(self.path, {
+            "format": "parquet",
+            "rows": self.rows,
+            "label_col": self.label_col,
+            "label_classes": self.label_classes,
+            "feature_cols": self.features,
+            **manifest,
+            "partitions": self.partitions,
+        })
+        return self.path
+
+
+def save_dataset(df, path, label_col=LABEL_COL, partition_rows=PARTITION_ROWS, **manifest):
+    """
+    Write a DataFrame as a dataset directory: float32 features and its
+    labels (names are dictionary-encoded with sorted label classes, integer
+    codes are kept as the narrowest integer type). Extra keyword arguments
+    go into the manifest.
+    """
+    import pyarrow as pa
+    labels = df[label_col]
+    if labels.dtype.kind in "iub":
+        labels = pd.to_numeric(labels, downcast="integer")
+        classes, label_type = None, pa.from_numpy_dtype(labels.dtype)
+    else:
+        labels = labels.astype(str).astype("category")
+        classes, label_type = sorted(labels.cat.categories), None
+    df = df.assign(**{label_col: labels})
+    writer = DatasetWriter(path, [c for c in df.columns if c != label_col], label_col, classes, label_type)
+    for start in range(0, max(len(df), 1), partition_rows):
+        writer.write(df.iloc[start:start + partition_rows])
+    return writer.close(**manifest)
+
+
+def _read_table(path, manifest, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    tables = [pq.read_table(os.path.join(path, part["path"]), columns=columns) for part in manifest["partitions"]]
+    return pa.concat_tables(tables)
+
+
+def _encode_labels(labels, manifest):
+    if isinstance(labels.dtype, pd.CategoricalDtype):
+        classes = manifest.get("label_classes") or sorted(labels.cat.categories)
+        return labels.cat.set_categories(classes).cat.codes  # int8 / int16
+    return labels
+
+
+def load_dataset(path, columns=None):
+    """
+    Load a dataset directory (or a CSV file) as a DataFrame with float32
+    features and integer labels. Only the given columns are read (default:
+    the manifest's feature columns and the label); label names are encoded
+    with the dataset-wide label classes.
+    """
+    if not os.path.isdir(path):
+        return downcast(pd.read_csv(path, usecols=columns, engine="pyarrow"))
+    manifest = read_manifest(path)
+    label_col = manifest["label_col"]
+    columns = list(columns) if columns is not None else manifest["feature_cols"] + [label_col]
+    df = _read_table(path, manifest, columns).to_pandas()
+    if label_col in df.columns:
+        df[label_col] = _encode_labels(df[label_col], manifest)
+    return df
+
+
+def iter_dataset(path, columns=None, batch_rows=BATCH_ROWS):
+    """
+    The rows of a dataset directory as DataFrames of at most batch_rows
+    rows, in partition order, with labels encoded as by load_dataset; for
+    passes over datasets larger than memory.
+    """
+    import pyarrow.parquet as pq
+    manifest = read_manifest(path)
+    label_col = manifest["label_col"]
+    columns = list(columns) if columns is not None else manifest["feature_cols"] + [label_col]
+    for part in manifest["partitions"]:
+        for batch in pq.ParquetFile(os.path.join(path, part["path"])).iter_batches(batch_rows, columns=columns):
+            df = batch.to_pandas()
+            if label_col in df.columns:
+                df[label_col] = _encode_labels(df[label_col], manifest)
+            yield df
+
+
+def load_matrix(path, feature_cols=None, mmap=True):
+    """
+    The (rows x features) float32 matrix and label vector of a dataset, for
+    training. The first call for a set of columns writes them as .npy files
+    under _cache/; later calls memory-map those, so the matrix is neither
+    parsed nor copied. Returns (X, y, feature_cols).
+    """
+    manifest = read_manifest(path)
+    feature_cols = list(feature_cols) if feature_cols is not None else manifest["feature_cols"]
+    key = hashlib.sha1("\n".join(feature_cols).encode("utf-8")).hexdigest()[:12]
+    # the manifest's mtime in the file names: rewriting the dataset invalidates them
+    stamp = f"{os.stat(os.path.join(path, MANIFEST_FILE)).st_mtime_ns:x}"
+    cache = os.path.join(path, CACHE_DIR)
+    x_path, y_path = os.path.join(cache, f"{key}.{stamp}.X.npy"), os.path.join(cache, f"{key}.{stamp}.y.npy")
+    if not os.path.exists(y_path):
+        for stale in glob.glob(os.path.join(cache, f"{key}.*")):
+            os.remove(stale)
+        _build_matrix(path, manifest, feature_cols, x_path, y_path)
+    mode = "r" if mmap else None
+    return np.load(x_path, mmap_mode=mode), np.load(y_path, mmap_mode=mode), feature_cols
+
+
+def _build_matrix(path, manifest, feature_cols, x_path, y_path):
+    """Fill the cached matrix batch by batch, so memory stays at one batch."""
+    os.makedirs(os.path.dirname(x_path), exist_ok=True)
+    label_col = manifest["label_col"]
+    X = np.lib.format.open_memmap(x_path + ".tmp", mode="w+", dtype=np.float32,
+                                  shape=(manifest["rows"], len(feature_cols)))
+    labels, row = [], 0
+    for df in iter_dataset(path, feature_cols + [label_col]):
+        X[row:row + len(df)] = df[feature_cols].to_numpy(dtype=np.float32)
+        labels.append(df[label_col].to_numpy())
+        row += len(df)
+    X.flush()
+    del X
+    y = np.concatenate(labels) if labels else np.zeros(0, dtype=np.int8)
+    np.save(y_path + ".tmp.npy", y)
+    os.replace(x_path + ".tmp", x_path)
+    os.replace(y_path + ".tmp.npy", y_path)  # written last: marks the cache complete
@@ -6,3 +6,18 @@ export const fetchResults = async () => {
   const res = await axios.get(`${API_BASE}/results`);
   return res.data;
 };
+
+// One page of stored events (newest first); pass the returned next_cursor
+// as params.cursor for the next page.
+// params: { start, end, label, cluster, min_risk, agent_id, cursor, limit }
+export const fetchEvents = async (params = {}) => {
+  const res = await axios.get(`${API_BASE}/events`, { params });
+  return res.data;
+};
+
+// Bucketed history: { buckets: [{ start, count, max_risk, labels }] }
+// params: { start, end, buckets | bucket, label, cluster, min_risk, agent_id }
+export const fetchTimeline = async (params = {}) => {
+  const res = await axios.get(`${API_BASE}/timeline`, { params });
+  return res.data;
+};
@@ -9,21 +9,38 @@ import {
   ResponsiveContainer,
 } from "recharts";
 import { connectWebSocket } from "../utils/websocket";
+import { fetchTimeline } from "../api";
+
+// Create graph data for last 1 minute
+const bucketSize = 5; // seconds
+const windowSeconds = 60;
 
 function Timeline() {
   const [alerts, setAlerts] = useState([]);
+  const [history, setHistory] = useState({}); // bucket start -> abnormal count
 
   useEffect(() => {
+    // Stored history for the range, so the chart is filled before live alerts arrive
+    const now = Math.floor(Date.now() / 1000);
+    fetchTimeline({ start: now - windowSeconds, end: now, bucket: bucketSize })
+      .then((res) => {
+        const counts = {};
+        res.buckets.forEach((b) => {
+          counts[Math.floor(b.start)] = b.count - (b.labels["0"] || 0);
+        });
+        setHistory(counts);
+      })
+      .catch((err) => console.error("Error loading timeline:", err));
+
     connectWebSocket((data) => {
       setAlerts((prev) => [...prev, data]);
     });
   }, []);
 
-  // Create graph data for last 1 minute
-  const bucketSize = 5; // seconds
   const now = Math.floor(Date.now() / 1000);
-  const startTime = now - 60;
+  const startTime = now - windowSeconds;
   const data = [];
+  const historyStarts = Object.keys(history).map(Number);
 
   for (let t = startTime; t <= now; t += bucketSize) {
     const bucketAlerts = alerts.filter(
@@ -33,9 +50,12 @@ function Timeline() {
     );
 
     // Value is 0 for normal traffic, 1 (or # of abnormal alerts) for spikes
-    const count = bucketAlerts.filter(
+    const live = bucketAlerts.filter(
       (a) => a.alert_type !== "Normal Traffic"
     ).length;
+    // Stored buckets are aligned to the page load; take the one overlapping t
+    const stored = historyStarts.find((h) => h <= t && t < h + bucketSize);
+    const count = Math.max(live, stored === undefined ? 0 : history[stored]);
 
     data.push({
       time: new Date(t * 1000).toLocaleTimeString(),
@@ -46,7 +66,7 @@ function Timeline() {
   return (
     <div className="w-full p-4 border rounded">
       <h2 className="text-2xl font-semibold mb-2">Alert Timeline</h2>
-      {alerts.length === 0 ? (
+      {alerts.length === 0 && historyStarts.length === 0 ? (
         <p>No timeline data yet</p>
       ) : (
         <ResponsiveContainer width="100%" height={300}>
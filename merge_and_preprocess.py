@@ -1,7 +1,30 @@
+import argparse
 import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from data_prep import basic_preprocess
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_prep import clean_features
+from dataset_store import FORMAT_VERSION, arrow_schema, write_manifest
+
+# -----------------------
+# CONFIG
+# -----------------------
+RAW_GLOB = "IDSdata/*.csv"
+OUTPUT_DIR = "data/processed"  # one Parquet partition per raw CSV plus _manifest.json
+CHUNK_ROWS = 200_000      # rows read, cleaned and written at a time per worker
+SAMPLE_ROWS = 1000        # rows per file used to find the numeric columns
+MISSING_THRESHOLD = 0.5   # columns missing in more than this share of all rows are left out
+WORKERS = os.cpu_count() or 1
+LABEL_NAMES = ("label", "attack", "class")
+LABEL_COL = "label"       # label column name in the output
+
+
+def normalize(name):
+    return name.strip().lower()
+
 
 def detect_label_column(df):
     """
@@ -10,7 +33,7 @@ def detect_label_column(df):
     """
     # normalize column names: strip spaces and lowercase
     df.columns = [c.strip() for c in df.columns]
-    candidates = [c for c in df.columns if c.lower() in ["label", "attack", "class"]]
+    candidates = [c for c in df.columns if c.lower() in LABEL_NAMES]
 
     if not candidates:
         raise ValueError(f"No label column found! Columns = {df.columns.tolist()}")
@@ -18,30 +41,110 @@ def detect_label_column(df):
         print(f"⚠️ Multiple possible label columns found: {candidates}, using {candidates[0]}")
     return candidates[0]
 
-# Collect all raw CSVs from IDSdata
-raw_files = glob.glob("IDSdata/*.csv")
-print(f"Found {len(raw_files)} raw CSVs")
 
-processed_files = []
+def infer_schema(files, sample_rows=SAMPLE_ROWS):
+    """
+    One shared layout for all files from a small sample of each: the label
+    column of every file and the union of numeric feature columns (names
+    normalized), in first-seen order.
+    """
+    features, labels = [], {}
+    for path in files:
+        sample = pd.read_csv(path, nrows=sample_rows, low_memory=False)
+        label = normalize(detect_label_column(sample))
+        sample.columns = [normalize(c) for c in sample.columns]
+        labels[path] = label
+        for col in sample.select_dtypes(include=[np.number]).columns:
+            if col != label and col not in features:
+                features.append(col)
+    if not features:
+        raise ValueError("No numeric feature columns found")
+    return features, labels
+
+
+def preprocess_file(path, out_path, features, label_col, chunk_rows=CHUNK_ROWS):
+    """
+    Stream one raw CSV into one Parquet partition with the shared columns.
+    Every chunk is cleaned (clean_features), cast to float32 and appended
+    as a row group, so memory is bounded by chunk_rows. Returns the row count, missing
+    values per feature and the distinct labels seen.
+    """
+    schema = arrow_schema(features, LABEL_COL)
+    missing = np.zeros(len(features), dtype=np.int64)
+    labels, rows = set(), 0
+    tmp = f"{out_path}.tmp"
+    with pq.ParquetWriter(tmp, schema) as writer:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, low_memory=False):
+            chunk.columns = [normalize(c) for c in chunk.columns]
+            chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+            X = chunk.reindex(columns=features).apply(pd.to_numeric, errors="coerce")
+            missing += X.isna().sum().to_numpy()
+            X = clean_features(X, features).astype(np.float32)
+            y = chunk[label_col].astype(str)
+            labels.update(y.unique())
+            table = pa.Table.from_pandas(X.assign(**{LABEL_COL: y.astype("category")}),
+                                         schema=schema, preserve_index=False)
+            writer.write_table(table)
+            rows += len(chunk)
+    os.replace(tmp, out_path)
+    return {"rows": rows, "missing": missing.tolist(), "labels": sorted(labels)}
+
 
-for i, f in enumerate(raw_files, 1):
-    print(f"[{i}/{len(raw_files)}] Inspecting {f}")
-    # peek header
-    df_head = pd.read_csv(f, nrows=5)
-    df_head.columns = [c.strip() for c in df_head.columns]  # strip spaces
-    label_col = detect_label_column(df_head).lower().strip()
+def merge_and_preprocess(files, output_dir=OUTPUT_DIR, workers=WORKERS, chunk_rows=CHUNK_ROWS,
+                         missing_threshold=MISSING_THRESHOLD):
+    """
+    Preprocess raw CSVs in parallel into one partitioned Parquet dataset.
+
+    Each file is streamed by its own worker process into its own partition
+    (one write pass, no intermediate CSVs, memory bounded by chunk_rows per
+    worker). All partitions share one column layout from infer_schema, and
+    the manifest holds the dataset-wide label encoding (sorted label names,
+    as a LabelEncoder fitted on all files would give) and the feature
+    columns to use: those missing in at most missing_threshold of all rows.
+    """
+    files = sorted(files)
+    if not files:
+        raise ValueError("No input files")
+    features, label_cols = infer_schema(files)
+    os.makedirs(output_dir, exist_ok=True)
+    parts = [f"part-{i:04d}.parquet" for i in range(len(files))]
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(files)))) as pool:
+        results = list(pool.map(
+            preprocess_file, files, [os.path.join(output_dir, p) for p in parts],
+            [features] * len(files), [label_cols[f] for f in files], [chunk_rows] * len(files),
+        ))
 
-    out = f"data/processed_{i}.csv"
-    print(f"    Using label column: '{label_col}' -> {out}")
-    processed_csv, meta = basic_preprocess(f, out, label_col=label_col)
-    processed_files.append(out)
+    total = sum(r["rows"] for r in results)
+    missing = np.sum([r["missing"] for r in results], axis=0)
+    keep = missing <= missing_threshold * total
+    manifest = {
+        "version": FORMAT_VERSION,
+        "format": "parquet",
+        "rows": total,
+        "label_col": LABEL_COL,
+        "label_classes": sorted(set().union(*(r["labels"] for r in results))),
+        "feature_cols": [c for c, k in zip(features, keep) if k],
+        "dropped_cols": [c for c, k in zip(features, keep) if not k],
+        "partitions": [{"path": p, "source": os.path.basename(f), "rows": r["rows"]}
+                       for p, f, r in zip(parts, files, results)],
+    }
+    write_manifest(output_dir, manifest)
+    return manifest
 
-# Merge all processed outputs
-dfs = [pd.read_csv(f) for f in processed_files]
-df = pd.concat(dfs, ignore_index=True)
 
-# Strip spaces from all column names in final merged file
-df.columns = [c.strip() for c in df.columns]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess raw CIC-IDS2017 CSVs into a partitioned Parquet dataset")
+    parser.add_argument("files", nargs="*", help=f"raw CSVs (default: {RAW_GLOB})")
+    parser.add_argument("-o", "--output", default=OUTPUT_DIR, help="output dataset directory")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="files preprocessed in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per read/write chunk")
+    args = parser.parse_args()
 
-df.to_csv("data/processed.csv", index=False)
-print("✅ Final merged processed.csv shape:", df.shape)
+    raw_files = args.files or glob.glob(RAW_GLOB)
+    print(f"Found {len(raw_files)} raw CSVs")
+    manifest = merge_and_preprocess(raw_files, args.output, args.workers, args.chunk_rows)
+    print(f"✅ {manifest['rows']} rows x {len(manifest['feature_cols'])} features in "
+          f"{len(manifest['partitions'])} partitions -> {args.output}")
+    if manifest["dropped_cols"]:
+        print(f"    Dropped mostly-missing columns: {manifest['dropped_cols']}")
+    print(f"    Labels: {manifest['label_classes']}")
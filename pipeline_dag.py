@@ -0,0 +1,236 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+# -----------------------
+# CONFIG
+# -----------------------
+CPU_BUDGET = os.cpu_count() or 1   # threads all running stages may use together
+EXECUTOR = "process"               # "process": one spawned worker per stage; "inline": one after another here
+SPILL_BYTES = 1 << 20              # array values at least this large go to workers as memory-mapped .npy files
+THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+              "LOKY_MAX_CPU_COUNT", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS")
+
+EXECUTORS = ("process", "inline")
+
+
+class Stage:
+    """
+    One step of a pipeline: fn(**inputs, **params) returns a dict holding
+    (at least) the named outputs. A stage may use up to cpus threads; the
+    scheduler starts it once that many are free in the budget.
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), cpus=1, **params):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.cpus = cpus
+        self.params = params
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs}, cpus={self.cpus})"
+
+
+class _Spilled:
+    """A large array value stored as .npy in the run's work directory."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, mmap=True):
+        return np.load(self.path, mmap_mode="r" if mmap else None)
+
+
+def stage_cpus():
+    """Threads the running stage may use (for n_jobs); the whole machine outside a pipeline run."""
+    return int(os.environ.get("IDS_STAGE_CPUS", CPU_BUDGET))
+
+
+def _limit_threads(cpus):
+    """Worker initializer: cap OpenMP/BLAS pools and n_jobs=-1 at the stage's cpus."""
+    os.environ["IDS_STAGE_CPUS"] = str(cpus)
+    for var in THREAD_ENV:
+        os.environ[var] = str(cpus)  # libraries loaded from here on
+    threadpool_limits(cpus)          # and those numpy/scipy already loaded
+
+
+def _run_stage(fn, inputs, params, outputs, workdir=None):
+    """Runs in the worker: resolve spilled inputs, call fn, spill large outputs."""
+    inputs = {k: v.load() if isinstance(v, _Spilled) else v for k, v in inputs.items()}
+    start = time.time()
+    result = fn(**inputs, **params)
+    end = time.time()
+    missing = [k for k in outputs if k not in result]
+    if missing:
+        raise ValueError(f"{fn.__name__} did not return {missing}")
+    values = {}
+    for k in outputs:
+        value = result[k]
+        if workdir is not None and isinstance(value, np.ndarray) and value.nbytes >= SPILL_BYTES:
+            path = os.path.join(workdir, f"{k}.npy")
+            np.save(path, value)
+            value = _Spilled(path)
+        values[k] = value
+    return values, start, end, os.getpid()
+
+
+def check_graph(stages, given=()):
+    """
+    Stages in an order that runs every one after the producers of its
+    inputs. Raises ValueError for duplicate names or outputs, inputs
+    nobody produces, and cycles.
+    """
+    producer = {k: None for k in given}
+    for s in stages:
+        for k in s.outputs:
+            if k in producer:
+                raise ValueError(f"{k} is produced twice ({s.name})")
+            producer[k] = s.name
+    if len({s.name for s in stages}) != len(stages):
+        raise ValueError("Stage names must be unique")
+    for s in stages:
+        missing = [k for k in s.inputs if k not in producer]
+        if missing:
+            raise ValueError(f"Stage {s.name} needs {missing}, which no stage produces")
+
+    order, done, pending = [], set(given), list(stages)
+    while pending:
+        ready = [s for s in pending if done.issuperset(s.inputs)]
+        if not ready:
+            raise ValueError(f"Stages {[s.name for s in pending]} depend on each other")
+        for s in ready:
+            order.append(s)
+            done.update(s.outputs)
+        pending = [s for s in pending if s not in ready]
+    return order
+
+
+def critical_path(stages, timings, given=()):
+    """The chain of dependent stages with the largest total time, and that time."""
+    producer = {k: s.name for s in stages for k in s.outputs if k not in given}
+    best = {}
+    for s in check_graph(stages, given):
+        parents = {producer[k] for k in s.inputs if k in producer}
+        before = max(parents, key=lambda p: best[p][0], default=None)
+        seconds, path = best[before] if before else (0.0, [])
+        best[s.name] = (seconds + timings[s.name], path + [s.name])
+    seconds, path = max(best.values(), default=(0.0, []))
+    return path, seconds
+
+
+def run_dag(stages, inputs=None, cpu_budget=CPU_BUDGET, executor=EXECUTOR, workdir=None):
+    """
+    Run a stage graph. Every stage starts as soon as its inputs exist and
+    its cpus fit in what running stages leave of cpu_budget (stages wanting
+    more than the budget get all of it), each in its own spawned worker
+    process whose thread pools are limited to the stage's cpus, so nested
+    n_jobs=-1 and BLAS threads do not oversubscribe the machine. Large
+    arrays pass between stages as memory-mapped files in workdir (a
+    temporary directory by default) instead of through pipes.
+
+    Returns (values, report): every input and output by name, and the
+    per-stage timing report (format_report prints it).
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor '{executor}', expected one of {EXECUTORS}")
+    inputs = dict(inputs or {})
+    order = check_graph(stages, inputs)
+    cpus = {s.name: max(1, min(s.cpus, cpu_budget)) for s in stages}
+    values, timings = dict(inputs), {}
+    run_start = time.time()
+
+    def record(s, result):
+        out, start, end, pid = result
+        values.update(out)
+        timings[s.name] = {"stage": s.name, "cpus": cpus[s.name], "pid": pid, "start": round(start - run_start, 4),
+                           "end": round(end - run_start, 4), "seconds": round(end - start, 4)}
+
+    if executor == "inline":
+        for s in order:
+            with threadpool_limits(cpus[s.name]):
+                record(s, _run_stage(s.fn, {k: values[k] for k in s.inputs}, s.params, s.outputs))
+    else:
+        tmp = workdir is None
+        workdir = tempfile.mkdtemp(prefix="pipeline-") if tmp else workdir
+        os.makedirs(workdir, exist_ok=True)
+        try:
+            _run_processes(order, cpus, cpu_budget, values, record, workdir)
+            values = {k: v.load(mmap=False) if isinstance(v, _Spilled) else v for k, v in values.items()}
+        finally:
+            if tmp:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    wall = time.time() - run_start
+    path, path_seconds = critical_path(stages, {k: t["seconds"] for k, t in timings.items()}, inputs)
+    report = {
+        "cpu_budget": cpu_budget,
+        "executor": executor,
+        "wall_seconds": round(wall, 4),
+        "stage_seconds": round(sum(t["seconds"] for t in timings.values()), 4),
+        "critical_path": path,
+        "critical_path_seconds": round(path_seconds, 4),
+        "stages": [timings[s.name] for s in order],
+    }
+    return values, report
+
+
+def _run_processes(order, cpus, cpu_budget, values, record, workdir):
+    context = multiprocessing.get_context("spawn")  # fresh interpreters: no forked BLAS/TensorFlow state
+    pending, running, free, error = list(order), {}, cpu_budget, None
+    finished = []  # pools of completed stages, joined at the end so exits never hold up scheduling
+    try:
+        while pending or running:
+            if error is None:
+                # start what is ready, in stage order, while the budget allows
+                for s in [s for s in pending if all(k in values for k in s.inputs)]:
+                    if cpus[s.name] > free:
+                        continue
+                    pool = ProcessPoolExecutor(1, mp_context=context, initializer=_limit_threads,
+                                               initargs=(cpus[s.name],))
+                    future = pool.submit(_run_stage, s.fn, {k: values[k] for k in s.inputs}, s.params,
+                                         s.outputs, workdir)
+                    running[future] = (s, pool)
+                    pending.remove(s)
+                    free -= cpus[s.name]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                s, pool = running.pop(future)
+                pool.shutdown(wait=False)
+                finished.append(pool)
+                free += cpus[s.name]
+                try:
+                    record(s, future.result())
+                except Exception as e:
+                    # let running stages finish, start no more, then report the first failure
+                    if error is None:
+                        error = RuntimeError(f"Stage {s.name} failed: {type(e).__name__}: {e}")
+                        error.__cause__ = e
+        if error is not None:
+            raise error
+    finally:
+        for _, pool in running.values():
+            pool.shutdown(cancel_futures=True)
+        for pool in finished:
+            pool.shutdown()
+
+
+def format_report(report):
+    """The timing report as a text table, stages in the order they ran."""
+    rows = sorted(report["stages"], key=lambda t: t["start"])
+    width = max([len(t["stage"]) for t in rows] + [5])
+    lines = [f"{'stage':<{width}}  cpus   start     end  seconds"]
+    for t in rows:
+        lines.append(f"{t['stage']:<{width}}  {t['cpus']:>4}  {t['start']:>6.2f}  {t['end']:>6.2f}  {t['seconds']:>7.2f}")
+    lines.append(f"wall {report['wall_seconds']:.2f}s for {report['stage_seconds']:.2f}s of stages "
+                 f"(budget {report['cpu_budget']} cpus); critical path {report['critical_path_seconds']:.2f}s: "
+                 + " -> ".join(report["critical_path"]))
+    return "\n".join(lines)
@@ -1,25 +1,21 @@
 import numpy as np
 import json
-from sklearn.decomposition import PCA
 from utils import load_csv, train_val_test_split, standardize_features, save_json
-from clustering import run_kmeans, run_dbscan, run_autoencoder_clustering
-from classification import train_random_forest, train_xgboost, build_dnn, evaluate_model
-from predictor import vulnerability_score_from_confidence
+from pipeline_dag import CPU_BUDGET, EXECUTOR, Stage, format_report, run_dag
 
+# Every step below is a stage of one graph (see stages()): the stages that
+# only need the standardized split (clustering, RF, XGB, DNN) run at the
+# same time in worker processes. Stages import their libraries themselves,
+# so a worker only loads what its stage uses (TensorFlow only for the
+# autoencoder and the DNN).
 
-def run(
-    input_csv="data/optimized.csv",
-    label_col="label",
-    feature_cols=None,
-    outdir="output",
-    sample_size=50000,
-    pca_components=20,
-    max_dbscan=20000
-):
+
+def prepare(input_csv, label_col, feature_cols, sample_size):
     # -------------------------
     # Load data
     # -------------------------
-    df = load_csv(input_csv)
+    # float32 features; a dataset directory only reads the requested columns
+    df = load_csv(input_csv, None if feature_cols is None else [*feature_cols, label_col])
 
     if feature_cols is None:
         feature_cols = [c.strip().lower() for c in df.columns if c != label_col]
@@ -35,11 +31,9 @@ def run(
     # Standardize
     # -------------------------
     X_train, scaler, train_medians = standardize_features(train_df, feature_cols)
-    X_val = scaler.transform(val_df[feature_cols].values)
     X_test = scaler.transform(test_df[feature_cols].values)
 
     y_train = train_df[label_col].values
-    y_val = val_df[label_col].values
     y_test = test_df[label_col].values
 
     # -------------------------
@@ -48,53 +42,68 @@ def run(
     if len(X_train) > sample_size:
         idx = np.random.choice(len(X_train), sample_size, replace=False)
         X_train_small = X_train[idx]
-        y_train_small = y_train[idx]
     else:
         X_train_small = X_train
-        y_train_small = y_train
 
-    # -------------------------
-    # Dimensionality Reduction
-    # -------------------------
+    return {"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test,
+            "X_train_small": X_train_small}
+
+
+def reduce_dimensions(X_train_small, pca_components):
+    from sklearn.decomposition import PCA
     pca = PCA(n_components=pca_components, random_state=42)
-    X_train_small_pca = pca.fit_transform(X_train_small)
+    return {"pca": pca, "X_train_small_pca": pca.fit_transform(X_train_small)}
 
-    results = {}
 
-    # -------------------------
-    # Clustering (on reduced data)
-    # -------------------------
-    kres = run_kmeans(X_train_small_pca, n_clusters=6)
-    dres = run_dbscan(X_train_small_pca, eps=0.8, min_samples=5)
+# -------------------------
+# Clustering (on reduced data)
+# -------------------------
+def cluster_kmeans(X_train_small_pca):
+    from clustering import run_kmeans
+    return {"kmeans_silhouette": run_kmeans(X_train_small_pca, n_clusters=6)["silhouette"]}
+
+
+def cluster_dbscan(X_train_small_pca):
+    from clustering import run_dbscan
+    return {"dbscan_silhouette": run_dbscan(X_train_small_pca, eps=0.8, min_samples=5)["silhouette"]}
+
+
+def cluster_autoencoder(X_train_small):
+    from clustering import run_autoencoder_clustering
     aeres = run_autoencoder_clustering(
         X_train_small, encoding_dim=8, n_clusters=6, epochs=10, batch_size=32, verbose=0
     )
+    return {"ae_kmeans_silhouette": aeres["silhouette"]}
 
-    results["clustering"] = {
-        "kmeans_silhouette": kres["silhouette"],
-        "dbscan_silhouette": dres["silhouette"],
-        "ae_kmeans_silhouette": aeres["silhouette"],
-    }
 
-    # -------------------------
-    # Classification
-    # -------------------------
+# -------------------------
+# Classification
+# -------------------------
+def classify_rf(X_train, y_train, X_test, y_test):
+    from classification import train_random_forest, evaluate_model
     rf = train_random_forest(X_train, y_train, n_estimators=50)
+    return {"rf_eval": evaluate_model(rf, X_test, y_test)}
+
+
+def classify_xgb(X_train, y_train, X_test, y_test):
+    from classification import train_xgboost, evaluate_model
     xgb = train_xgboost(X_train, y_train, n_estimators=50)
+    return {"xgb_eval": evaluate_model(xgb, X_test, y_test), "probs": xgb.predict_proba(X_test)}
 
-    dnn = build_dnn(X_train.shape[1], n_classes=len(set(y_train)))
-    dnn.fit(X_train, y_train, epochs=8, batch_size=32, verbose=0)
 
-    results["classification"] = {
-        "rf": evaluate_model(rf, X_test, y_test),
-        "xgb": evaluate_model(xgb, X_test, y_test),
-        "dnn": evaluate_model(dnn, X_test, y_test, is_keras=True),
-    }
+def classify_dnn(X_train, y_train, X_test, y_test):
+    from classification import build_dnn, evaluate_model
+    model = build_dnn(X_train.shape[1], n_classes=len(set(y_train)))
+    model.fit(X_train, y_train, epochs=8, batch_size=32, verbose=0)
+    return {"dnn_eval": evaluate_model(model, X_test, y_test, is_keras=True)}
 
-    # -------------------------
-    # Vulnerability Score (safe DBSCAN)
-    # -------------------------
-    probs = xgb.predict_proba(X_test)
+
+# -------------------------
+# Vulnerability Score (safe DBSCAN)
+# -------------------------
+def score_vulnerability(X_test, probs, pca, max_dbscan):
+    from clustering import run_dbscan
+    from predictor import vulnerability_score_from_confidence
 
     # Subsample test set for DBSCAN
     if len(X_test) > max_dbscan:
@@ -111,18 +120,73 @@ def run(
     vuln_scores = vulnerability_score_from_confidence(
         probs_small, cluster_labels=dres_test["labels"]
     )
-
-    results["vulnerability"] = {
+    return {"vulnerability": {
         "mean_score": float(vuln_scores.mean()),
         "top_5": vuln_scores[:5].tolist(),
         "n_samples": len(X_test_small),
+    }}
+
+
+def stages(input_csv, label_col, feature_cols, sample_size, pca_components, max_dbscan, cpu_budget=CPU_BUDGET):
+    """
+    The pipeline as a stage graph. Heavy stages get a share of the CPU
+    budget for their thread pools; listed longest first, so they start first.
+    """
+    split = ("X_train", "y_train", "X_test", "y_test")
+    share = max(1, cpu_budget // 4)
+    return [
+        Stage("prepare", prepare, outputs=split + ("X_train_small",), cpus=cpu_budget, input_csv=input_csv,
+              label_col=label_col, feature_cols=feature_cols, sample_size=sample_size),
+        Stage("xgboost", classify_xgb, split, ("xgb_eval", "probs"), cpus=share),
+        Stage("random_forest", classify_rf, split, ("rf_eval",), cpus=share),
+        Stage("dnn", classify_dnn, split, ("dnn_eval",), cpus=share),
+        Stage("autoencoder", cluster_autoencoder, ("X_train_small",), ("ae_kmeans_silhouette",), cpus=share),
+        Stage("pca", reduce_dimensions, ("X_train_small",), ("pca", "X_train_small_pca"),
+              pca_components=pca_components),
+        Stage("dbscan", cluster_dbscan, ("X_train_small_pca",), ("dbscan_silhouette",)),
+        Stage("kmeans", cluster_kmeans, ("X_train_small_pca",), ("kmeans_silhouette",)),
+        Stage("vulnerability", score_vulnerability, ("X_test", "probs", "pca"), ("vulnerability",),
+              max_dbscan=max_dbscan),
+    ]
+
+
+def run(
+    input_csv="data/optimized",
+    label_col="label",
+    feature_cols=None,
+    outdir="output",
+    sample_size=50000,
+    pca_components=20,
+    max_dbscan=20000,
+    cpu_budget=CPU_BUDGET,
+    executor=EXECUTOR,
+):
+    values, report = run_dag(
+        stages(input_csv, label_col, feature_cols, sample_size, pca_components, max_dbscan, cpu_budget),
+        cpu_budget=cpu_budget, executor=executor,
+    )
+
+    results = {
+        "clustering": {
+            "kmeans_silhouette": values["kmeans_silhouette"],
+            "dbscan_silhouette": values["dbscan_silhouette"],
+            "ae_kmeans_silhouette": values["ae_kmeans_silhouette"],
+        },
+        "classification": {
+            "rf": values["rf_eval"],
+            "xgb": values["xgb_eval"],
+            "dnn": values["dnn_eval"],
+        },
+        "vulnerability": values["vulnerability"],
     }
 
     # -------------------------
     # Save + Print
     # -------------------------
     save_json(results, f"{outdir}/results_summary.json")
+    save_json(report, f"{outdir}/stage_timings.json")
     print(json.dumps(results, indent=2))
+    print(format_report(report))
     return results
 
 
@@ -2,15 +2,13 @@ import os
 import joblib
 import numpy as np
 from classification import train_random_forest, train_xgboost
-import pandas as pd
+from utils import load_matrix
 
 MODELS_DIR = "models"
 os.makedirs(MODELS_DIR, exist_ok=True)
 
 # Load preprocessed dataset
-df = pd.read_csv("data/processed.csv")  # your merged CSV
-X = df.drop(columns=["label"]).values
-y = df["label"].values
+X, y, _ = load_matrix("data/processed")  # float32, memory-mapped
 
 # Optional: split data (here just using all data for fast saving)
 X_train, y_train = X, y
@@ -0,0 +1,25 @@
+import importlib
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def import_backend(name):
+    """
+    Import a module from backend/ the way the backend runs it (backend/ on
+    sys.path) without letting backend/utils.py shadow the top-level utils.
+    """
+    saved = sys.modules.pop("utils", None)
+    if "backend_utils" in sys.modules:
+        sys.modules["utils"] = sys.modules["backend_utils"]
+    sys.path.insert(0, BACKEND_DIR)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(BACKEND_DIR)
+        backend_utils = sys.modules.pop("utils", None)
+        if backend_utils is not None:
+            sys.modules["backend_utils"] = backend_utils
+        if saved is not None:
+            sys.modules["utils"] = saved
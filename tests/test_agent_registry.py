@@ -0,0 +1,132 @@
+import asyncio
+import numpy as np
+from ._backend import import_backend
+
+registry_mod = import_backend("agent_registry")
+wire = import_backend("wire_protocol")
+
+
+def frame(agent, n_rows, n_features=4):
+    features = np.full((n_rows, n_features), 1.0, dtype=np.float32)
+    return {"type": "websocket.receive", "bytes": wire.encode_batch(features, agent_id=agent, window_end=1.0)}
+
+
+def score(batches):
+    return [{"agent": b.agent_id, "rows": len(b.features)} for b in batches]
+
+
+class FakeAgent:
+    """Websocket stand-in that delivers the given messages, then disconnects."""
+
+    def __init__(self, messages, client=("10.0.0.9", 4000)):
+        self.messages = list(messages)
+        self.client = client
+
+    async def receive(self):
+        await asyncio.sleep(0)
+        if self.messages:
+            return self.messages.pop(0)
+        return {"type": "websocket.disconnect", "code": 1000}
+
+
+def test_windows_from_all_agents_share_scoring_calls_fairly():
+    registry = registry_mod.AgentRegistry(score, lambda s, a: None, max_rows=6)
+    noisy, quiet = registry.connect("noisy"), registry.connect("quiet")
+    for _ in range(10):
+        registry.ingest(noisy, frame("noisy", 2))
+    registry.ingest(quiet, frame("quiet", 2))
+
+    picked = registry._take()
+    agents = [session.agent_id for session, _, _ in picked]
+    assert sorted(agents) == ["noisy", "noisy", "quiet"]  # the burst does not crowd out the quiet agent
+    assert len(noisy.inbox) == 8 and not quiet.inbox
+
+
+def test_per_agent_buffers_are_bounded():
+    registry = registry_mod.AgentRegistry(score, lambda s, a: None, maxsize=3)
+    burst, other = registry.connect("burst"), registry.connect("other")
+    for _ in range(10):
+        registry.ingest(burst, frame("burst", 1))
+    registry.ingest(other, frame("other", 1))
+    stats = {a["agent_id"]: a for a in registry.stats()["per_agent"]}
+    assert stats["burst"]["queued"] == 3 and stats["burst"]["dropped"] == 7
+    assert stats["other"]["queued"] == 1 and stats["other"]["dropped"] == 0
+    assert stats["burst"]["windows_per_s"] > stats["other"]["windows_per_s"]
+
+
+def test_serve_scores_and_emits_per_agent():
+    emitted = []
+
+    async def main():
+        registry = registry_mod.AgentRegistry(score, lambda s, a: emitted.append((s.agent_id, a)), min_features=4)
+        agents = [
+            FakeAgent([frame("a", 3), frame("a", 1)]),
+            FakeAgent([frame("b", 2), {"type": "websocket.receive", "text": '{"alert_type": "x"}'}]),
+            FakeAgent([frame("", 2)], client=("10.0.0.7", 4001)),
+            FakeAgent([frame("narrow", 2, n_features=2)]),
+        ]
+        await asyncio.gather(*(registry.serve(ws) for ws in agents))
+        await asyncio.sleep(0.01)  # windows buffered before a disconnect are still scored
+        registry.stop()
+        return registry
+
+    registry = asyncio.run(main())
+    assert len(registry) == 0  # sessions end with their connections
+    windows = sorted(a["agent"] + str(a["rows"]) for _, a in emitted if isinstance(a, dict))
+    assert windows == ["2", "a1", "a3", "b2"]
+    assert ("b", '{"alert_type": "x"}') in emitted  # agent-built alerts pass straight through
+    assert ("10.0.0.7:4001", {"agent": "", "rows": 2}) in emitted  # unnamed agents fall back to their address
+    assert registry.stats()["windows_scored"] == 4
+
+
+def test_scoring_errors_do_not_stop_the_stage():
+    emitted = []
+
+    def flaky(batches):
+        if any(b.agent_id == "bad" for b in batches):
+            raise RuntimeError("model failed")
+        return score(batches)
+
+    async def main():
+        registry = registry_mod.AgentRegistry(flaky, lambda s, a: emitted.append(a), scorers=1)
+        registry.start()
+        bad, good = registry.connect("bad"), registry.connect("good")
+        registry.ingest(bad, frame("bad", 1))
+        await asyncio.sleep(0.01)
+        registry.ingest(good, frame("good", 1))
+        await asyncio.sleep(0.01)
+        registry.stop()
+        return registry
+
+    registry = asyncio.run(main())
+    assert emitted == [{"agent": "good", "rows": 1}]
+    assert registry.stats()["scoring_errors"] == 1
+
+
+def test_bad_frames_from_one_agent_do_not_fail_the_shared_call():
+    emitted = []
+
+    def strict_score(batches):  # reads meta and keys like app.alerts_from_batches
+        return [{"agent": b.agent_id, "src": (b.meta.get("top_sources") or [{"host": "-"}])[0]["host"],
+                 "key": b.keys[len(b.features) - 1] if b.keys else None} for b in batches]
+
+    def raw(data):
+        return {"type": "websocket.receive", "bytes": data}
+
+    good = wire.encode_batch(np.ones((2, 4)), ["k1", "k2"], agent_id="good", meta={"top_sources": [{"host": "h"}]})
+    bad_meta = wire.encode_batch(np.ones((2, 4)), agent_id="bad", meta={"top_sources": "10.0.0.1"})
+    list_meta = wire.encode_batch(np.ones((1, 4)), agent_id="bad", meta={"x": 1})
+    list_meta = list_meta.replace(b'{"x":1}', b'[1,2,3]')  # valid JSON, not an object
+    short_keys = wire.encode_batch(np.ones((2, 4)), ["only", "one"], agent_id="bad").replace(b"only\none", b"only one")
+
+    async def main():
+        registry = registry_mod.AgentRegistry(strict_score, lambda s, a: emitted.append(a), min_features=4)
+        await asyncio.gather(registry.serve(FakeAgent([raw(bad_meta), raw(list_meta), raw(short_keys)])),
+                             registry.serve(FakeAgent([raw(good)], client=("10.0.0.8", 4000))))
+        await asyncio.sleep(0.01)
+        registry.stop()
+        return registry
+
+    registry = asyncio.run(main())
+    assert emitted == [{"agent": "good", "src": "h", "key": "k2"}]
+    assert registry.errors == 0 and registry.stats()["windows_scored"] == 1
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from ._backend import import_backend
+
+broadcast = import_backend("broadcast")
+
+
+class FakeClient:
+    """Websocket stand-in: send_text takes `delay` seconds; receive blocks until closed."""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.received = []
+        self.closed = asyncio.Event()
+        self.client = ("127.0.0.1", 5000)
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        await asyncio.sleep(self.delay)
+        self.received.append(text)
+
+    async def receive(self):
+        await self.closed.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def close(self):
+        self.closed.set()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_slow_client_does_not_delay_others():
+    async def main():
+        hub = broadcast.BroadcastHub(maxsize=4, policy="drop_oldest")
+        fast, slow = FakeClient(), FakeClient(delay=10.0)
+        hub.add(fast), hub.add(slow)
+        for i in range(10):
+            hub.publish({"n": i})
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.01)
+        stats = hub.stats()
+        hub.remove(fast), hub.remove(slow)
+        return fast, stats
+
+    fast, stats = run(main())
+    assert fast.received == ['{"n": %d}' % i for i in range(10)]
+    slow_stats = stats["per_client"][1]
+    assert slow_stats["sent"] == 0
+    assert slow_stats["queued"] == 4 and slow_stats["dropped"] == 5  # one message is in flight
+    assert slow_stats["lag"] > 0
+
+
+def test_message_serialized_once_and_shared():
+    async def main():
+        hub = broadcast.BroadcastHub()
+        clients = [FakeClient() for _ in range(3)]
+        for c in clients:
+            hub.add(c)
+        hub.publish({"alert_type": "Normal Traffic"})
+        await asyncio.sleep(0.01)
+        return clients
+
+    clients = run(main())
+    assert all(len(c.received) == 1 for c in clients)
+    assert clients[0].received[0] is clients[1].received[0] is clients[2].received[0]
+
+
+def test_conflate_keeps_only_newest():
+    async def main():
+        hub = broadcast.BroadcastHub(maxsize=2, policy="conflate")
+        slow = FakeClient(delay=0.05)
+        hub.add(slow)
+        for i in range(6):
+            hub.publish(str(i))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.3)
+        return slow, hub.stats()
+
+    slow, stats = run(main())
+    assert slow.received[0] == "0" and slow.received[-1] == "5"
+    assert len(slow.received) < 6
+    assert stats["per_client"][0]["dropped"] == 6 - len(slow.received)
+
+
+def test_disconnect_policy_and_failing_clients_are_removed():
+    async def main():
+        hub = broadcast.BroadcastHub(maxsize=2, policy="disconnect")
+        slow, broken, ok = FakeClient(delay=10.0), FakeClient(fail=True), FakeClient()
+        tasks = [asyncio.create_task(hub.serve(c)) for c in (slow, broken, ok)]
+        await asyncio.sleep(0)
+        for i in range(4):
+            hub.publish(str(i))
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.01)
+        remaining = len(hub)
+        await ok.close()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1.0)
+        return hub, slow, ok, remaining
+
+    hub, slow, ok, remaining = run(main())
+    assert remaining == 1
+    assert slow.closed.is_set()
+    assert ok.received == ["0", "1", "2", "3"]
+    assert len(hub) == 0 and hub.stats()["disconnected"] == 2
+
+
+def test_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        broadcast.BroadcastHub(policy="block")
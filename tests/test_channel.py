@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+import pytest
+from ._backend import import_backend
+
+channel = import_backend("channel")
+
+
+def test_drop_policies_and_counters():
+    oldest = channel.BoundedChannel(2, "drop_oldest")
+    newest = channel.BoundedChannel(2, "drop_newest")
+    for i in range(5):
+        oldest.put(i)
+        newest.put(i)
+    assert [oldest.get_nowait(), oldest.get_nowait()] == [3, 4]
+    assert [newest.get_nowait(), newest.get_nowait()] == [0, 1]
+    stats = oldest.stats()
+    assert (stats["enqueued"], stats["dropped"], stats["max_depth"], stats["depth"]) == (5, 3, 2, 0)
+    with pytest.raises(ValueError):
+        channel.BoundedChannel(2, "spill")
+
+
+def test_thread_producer_wakes_async_consumer():
+    chan = channel.BoundedChannel(1, "block")
+
+    def produce():
+        for i in range(50):
+            chan.put(i)
+        chan.close()
+
+    async def consume():
+        threading.Thread(target=produce, daemon=True).start()
+        items = []
+        while True:
+            item = await asyncio.wait_for(chan.get(), timeout=5)
+            if item is None:
+                return items
+            items.append(item)
+
+    assert asyncio.run(consume()) == list(range(50))
+    assert chan.stats()["dropped"] == 0
+
+
+def test_block_timeout_counts_as_drop():
+    chan = channel.BoundedChannel(1, "block")
+    assert chan.put("a")
+    start = time.monotonic()
+    assert not chan.put("b", timeout=0.05)
+    assert time.monotonic() - start >= 0.04
+    assert chan.stats()["dropped"] == 1
@@ -0,0 +1,130 @@
+import json
+import sqlite3
+import time
+import pytest
+from ._backend import import_backend
+
+database = import_backend("database")
+
+
+def alert(i, **fields):
+    return {"alert_type": "Normal Traffic", "src_ip": f"10.0.0.{i % 250}", "timestamp": 1000.0 + i,
+            "agent_id": "sensor-1", "n_flows": i, "label": 0, "proba": 1.0, "risk": 0.0, **fields}
+
+
+def count(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+def make(tmp_path):
+    path = tmp_path / "events.db"
+    engine = database.make_engine(f"sqlite:///{path}")
+    database.init_db(engine)
+    return path, engine
+
+
+def test_batches_flush_on_size_and_close(tmp_path):
+    path, engine = make(tmp_path)
+    writer = database.EventWriter(engine, flush_rows=100, flush_interval=60.0).start()
+    for i in range(250):
+        writer.add(alert(i))
+    deadline = time.time() + 5
+    while writer.written < 200 and time.time() < deadline:
+        time.sleep(0.01)
+    assert writer.written == 200 and writer.batches == 2  # the remaining 50 wait for the timer
+    writer.close()
+    assert count(path) == 250 and writer.stats()["buffered"] == 0
+
+
+def test_flushes_on_interval_and_stores_json_alerts(tmp_path):
+    path, engine = make(tmp_path)
+    writer = database.EventWriter(engine, flush_rows=100, flush_interval=0.05).start()
+    writer.add(json.dumps(alert(7, top_sources=[{"host": "10.0.0.7", "packets": 3}])))
+    writer.add("not json")
+    time.sleep(0.3)
+    assert writer.written == 1 and writer.failed == 1
+    with sqlite3.connect(path) as conn:
+        src_ip, top_sources = conn.execute("SELECT src_ip, top_sources FROM events").fetchone()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert src_ip == "10.0.0.7" and json.loads(top_sources)[0]["packets"] == 3
+    writer.close()
+
+
+def test_backlog_is_bounded():
+    writer = database.EventWriter(flush_rows=10, max_backlog=20)  # not started: nothing drains
+    for i in range(50):
+        writer.add(alert(i))
+    assert len(writer) == 20 and writer.dropped == 30
+
+
+def test_init_db_adds_missing_columns(tmp_path):
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE events (id INTEGER NOT NULL, label INTEGER, proba FLOAT, anomaly FLOAT, "
+                     "cluster INTEGER, risk FLOAT, features JSON, PRIMARY KEY (id))")
+        conn.execute("INSERT INTO events (label) VALUES (3)")
+    database.init_db(database.make_engine(f"sqlite:///{path}"))
+    with sqlite3.connect(path) as conn:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+        assert {"timestamp", "agent_id", "alert_type", "top_sources"} <= columns
+        assert conn.execute("SELECT label FROM events").fetchone()[0] == 3
+
+
+def populate(tmp_path, n=300):
+    path, engine = make(tmp_path)
+    writer = database.EventWriter(engine).start()
+    for i in range(n):
+        # Three events per second, so pages break inside equal timestamps
+        writer.add(alert(i, timestamp=1000.0 + i // 3, label=i % 3, risk=(i % 10) / 10, cluster=i % 2))
+    writer.close()
+    return path, engine
+
+
+def test_keyset_pages_cover_every_event_once(tmp_path):
+    _, engine = populate(tmp_path)
+    seen, cursor = [], None
+    while True:
+        rows, cursor = database.query_events(engine, start=1010.0, end=1090.0, cursor=cursor, limit=7)
+        seen.extend(rows)
+        if cursor is None:
+            break
+    keys = [(r["timestamp"], r["id"]) for r in seen]
+    assert keys == sorted(keys, reverse=True) and len(set(keys)) == 240
+
+    rows, _ = database.query_events(engine, label=2, cluster=0, min_risk=0.5, limit=1000)
+    assert rows and all(r["label"] == 2 and r["cluster"] == 0 and r["risk"] >= 0.5 for r in rows)
+    assert len(rows) == sum(1 for i in range(300) if i % 3 == 2 and i % 2 == 0 and i % 10 >= 5)
+
+
+def test_range_queries_use_the_indexes(tmp_path):
+    path, _ = populate(tmp_path, n=3)
+    with sqlite3.connect(path) as conn:
+        plans = {
+            sql: " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+            for sql in (
+                "SELECT * FROM events WHERE timestamp >= 1 AND timestamp < 2 ORDER BY timestamp DESC, id DESC",
+                "SELECT * FROM events WHERE label = 1 AND timestamp >= 1 ORDER BY timestamp DESC, id DESC",
+            )
+        }
+    for plan in plans.values():
+        assert "USING INDEX ix_events_" in plan and "TEMP B-TREE" not in plan
+
+
+def test_timeline_buckets(tmp_path):
+    _, engine = populate(tmp_path)
+    result = database.timeline(engine, start=1000.0, end=1100.0, bucket=10.0)
+    buckets = result["buckets"]
+    assert len(buckets) == 10 and buckets[0]["start"] == 1000.0
+    assert all(b["count"] == 30 for b in buckets)
+    assert buckets[0]["labels"] == {"0": 10, "1": 10, "2": 10}
+    assert buckets[0]["max_risk"] == 0.9
+    empty = database.timeline(engine, start=2000.0, end=2010.0, buckets=5)["buckets"]
+    assert [b["count"] for b in empty] == [0] * 5
+
+
+@pytest.mark.parametrize("kwargs", [{"bucket": 0}, {"bucket": -5.0}, {"buckets": 0}, {"buckets": -1}])
+def test_timeline_rejects_non_positive_buckets(tmp_path, kwargs):
+    _, engine = populate(tmp_path)
+    with pytest.raises(ValueError, match="must be positive"):
+        database.timeline(engine, start=1000.0, end=1100.0, **kwargs)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dataset_optimizer import StreamingMoments, optimize_dataset
+from dataset_store import load_dataset, read_manifest, save_dataset
+
+
+def test_streaming_moments_match_full_pass():
+    rng = np.random.default_rng(1)
+    X = rng.normal(loc=[5.0, -3.0, 1e6], scale=[1.0, 4.0, 10.0], size=(1000, 3))
+    X[:, 1] += X[:, 0]
+    moments = StreamingMoments(3)
+    for block in np.array_split(X, [1, 10, 400, 401]):
+        moments.update(block)
+    assert moments.n == 1000
+    assert np.allclose(moments.mean, X.mean(axis=0))
+    assert np.allclose(moments.variance(), X.var(axis=0))
+    assert np.allclose(moments.correlation(), np.corrcoef(X, rowvar=False))
+
+
+def test_chunked_mode_matches_in_memory_optimizer(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 3000
+    a = rng.normal(size=n)
+    df = pd.DataFrame({
+        "a": a,
+        "b": 2 * a + rng.normal(scale=0.01, size=n),  # correlated with a: dropped
+        "c": rng.normal(size=n),
+        "label": rng.choice(["BENIGN", "Bot", "DDoS"], p=[0.8, 0.05, 0.15], size=n),
+    })
+    save_dataset(df, str(tmp_path / "in"), partition_rows=1000)
+    optimize_dataset(str(tmp_path / "in"), str(tmp_path / "mem.csv"))
+    optimize_dataset(str(tmp_path / "in"), str(tmp_path / "out"), chunk_rows=400)
+
+    expected, out = pd.read_csv(tmp_path / "mem.csv"), load_dataset(str(tmp_path / "out"))
+    assert list(out.columns) == list(expected.columns) == ["a", "c", "label"]
+    assert out["label"].value_counts().to_dict() == expected["label"].value_counts().to_dict()
+    assert out["a"].dtype == np.float32 and read_manifest(str(tmp_path / "out"))["dropped_cols"] == ["b"]
+    attacks = df.loc[df["label"] != "BENIGN", "c"].astype(np.float32)
+    assert sorted(out.loc[out["label"] == 1, "c"]) == sorted(attacks)  # every attack row kept
+    assert not (out["label"].diff().fillna(0) >= 0).all()  # shuffled, not grouped by class
+
+
+def test_label_is_never_pruned_and_csv_inputs_need_the_in_memory_mode(tmp_path):
+    rng = np.random.default_rng(0)
+    label = rng.choice(["BENIGN", "DDoS"], size=500)
+    df = pd.DataFrame({"leak": (label == "DDoS") + rng.normal(scale=0.01, size=500),  # tracks the label
+                       "c": rng.normal(size=500), "label": label})
+    df.to_csv(tmp_path / "in.csv", index=False)
+    optimize_dataset(str(tmp_path / "in.csv"), str(tmp_path / "out.csv"))
+    assert list(pd.read_csv(tmp_path / "out.csv").columns) == ["leak", "c", "label"]
+    with pytest.raises(ValueError, match="is not one"):
+        optimize_dataset(str(tmp_path / "in.csv"), str(tmp_path / "out"), chunk_rows=100)
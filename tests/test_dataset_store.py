@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from dataset_store import load_dataset, load_matrix, save_dataset, read_manifest
+
+
+def frame(n=10):
+    return pd.DataFrame({
+        "flow duration": np.arange(n, dtype=np.float64),
+        "total fwd packets": np.arange(n, dtype=np.int64) * 2,
+        "label": ["DDoS" if i % 3 else "BENIGN" for i in range(n)],
+    })
+
+
+def test_dataset_round_trip_is_float32_with_encoded_labels(tmp_path):
+    path = str(tmp_path / "ds")
+    save_dataset(frame(), path, partition_rows=4)
+    manifest = read_manifest(path)
+    assert manifest["rows"] == 10 and len(manifest["partitions"]) == 3
+    assert manifest["label_classes"] == ["BENIGN", "DDoS"]
+
+    df = load_dataset(path)
+    assert (df.dtypes[["flow duration", "total fwd packets"]] == np.float32).all()
+    assert df["label"].dtype == np.int8 and df["label"].tolist() == [0 if i % 3 == 0 else 1 for i in range(10)]
+    assert list(load_dataset(path, columns=["label"]).columns) == ["label"]
+
+
+def test_matrix_is_cached_and_memory_mapped(tmp_path):
+    path = str(tmp_path / "ds")
+    save_dataset(frame(), path, partition_rows=4)
+    X, y, cols = load_matrix(path)
+    assert isinstance(X, np.memmap) and X.dtype == np.float32 and X.shape == (10, 2)
+    assert cols == ["flow duration", "total fwd packets"]
+    assert X[:, 1].tolist() == [2.0 * i for i in range(10)] and y.tolist() == load_dataset(path)["label"].tolist()
+
+    X2, _, _ = load_matrix(path, ["total fwd packets"])
+    assert X2.shape == (10, 1)
+
+    save_dataset(frame(6), path)  # rewriting the dataset invalidates the cache
+    X, y, _ = load_matrix(path)
+    assert X.shape == (6, 2) and len(y) == 6
@@ -0,0 +1,61 @@
+import json
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+feature_schema = import_backend("feature_schema")
+
+
+def fitted_scaler(n_features=5, seed=0):
+    from sklearn.preprocessing import StandardScaler
+    X = np.random.default_rng(seed).normal(size=(200, n_features)) * 100 + 50
+    return StandardScaler().fit(X), X
+
+
+def test_transform_matches_the_scaler_and_survives_save(tmp_path):
+    scaler, X = fitted_scaler()
+    schema = feature_schema.FeatureSchema.from_scaler(scaler)
+    assert schema.names == feature_schema.FLOW_FEATURES[:5]
+    path = tmp_path / feature_schema.SCHEMA_FILE
+    schema.save(path)
+    loaded = feature_schema.FeatureSchema.load(path)
+    assert loaded.fingerprint == schema.fingerprint and loaded.matches_scaler(scaler)
+
+    wide = np.hstack([X, np.zeros((len(X), 3))])  # zero pads past the schema are ignored
+    out = loaded.empty(len(X))
+    assert loaded.transform(wide, out=out) is out and out.dtype == np.float32
+    np.testing.assert_array_equal(out, scaler.transform(X).astype(np.float32))
+    with pytest.raises(ValueError):
+        loaded.transform(X[:, :4])
+
+
+def test_vectors_and_column_projection():
+    schema = feature_schema.FeatureSchema(["b", "a"])
+    np.testing.assert_array_equal(schema.vector({"a": 1, "b": 2, "c": 3}), [2, 1])
+    with pytest.raises(KeyError):
+        schema.vector({"a": 1})
+    np.testing.assert_array_equal(schema.columns(["a", "b", "c"]), [1, 0])
+    assert schema.columns(["b", "a", "c"]) is None
+    with pytest.raises(ValueError):
+        schema.columns(["a", "c"])
+
+
+def test_mismatched_or_newer_schemas_are_rejected(tmp_path):
+    scaler, _ = fitted_scaler()
+    with pytest.raises(ValueError):
+        feature_schema.FeatureSchema.from_scaler(scaler, names=["a", "b"])
+    with pytest.raises(ValueError):
+        feature_schema.FeatureSchema(["a", "a"])
+    path = tmp_path / "schema.json"
+    path.write_text(json.dumps({"version": feature_schema.SCHEMA_VERSION + 1, "names": ["a"]}))
+    with pytest.raises(ValueError):
+        feature_schema.FeatureSchema.load(path)
+
+
+def test_training_scripts_save_the_backend_schema(tmp_path):
+    from sklearn.preprocessing import StandardScaler
+    import utils  # the top-level training helpers
+    scaler = StandardScaler().fit(np.random.default_rng(0).normal(size=(20, 3)))
+    utils.save_feature_schema(scaler, [" Flow Duration", "b", "c"], str(tmp_path / "models" / "feature_schema.json"))
+    schema = feature_schema.FeatureSchema.load(tmp_path / "models" / "feature_schema.json")
+    assert schema.names == ("flow duration", "b", "c") and schema.matches_scaler(scaler)
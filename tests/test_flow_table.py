@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+butils = import_backend("utils")
+flow_table = import_backend("flow_table")
+PacketInfo = butils.PacketInfo
+SYN, ACK, PSH, FIN = flow_table.SYN, flow_table.ACK, flow_table.PSH, flow_table.FIN
+
+
+def pkt(ts, fwd=True, payload=0, flags=ACK, window=1024):
+    if fwd:
+        return PacketInfo(ts, "10.0.0.1", "10.0.0.2", 40000, 80, 6, payload, 40, flags, window)
+    return PacketInfo(ts, "10.0.0.2", "10.0.0.1", 80, 40000, 6, payload, 40, flags, window)
+
+
+def test_bidirectional_flow_statistics():
+    table = flow_table.FlowTable()
+    table.add(pkt(0.0, True, 0, SYN, window=8192))
+    table.add(pkt(0.1, False, 0, SYN | ACK, window=4096))
+    table.add(pkt(0.2, True, 100, PSH | ACK))
+    table.add(pkt(0.4, False, 300, PSH | ACK))
+    assert len(table) == 1
+
+    (flow,) = table.collect(now=0.5)
+    row = flow.features()
+    assert row["destination port"] == 80
+    assert row["total fwd packets"] == 2
+    assert row["total backward packets"] == 2
+    assert row["total length of fwd packets"] == 100
+    assert row["total length of bwd packets"] == 300
+    assert row["flow duration"] == pytest.approx(0.4e6)
+    assert row["flow iat mean"] == pytest.approx(0.4e6 / 3)
+    assert row["fwd iat total"] == pytest.approx(0.2e6)
+    assert row["packet length mean"] == pytest.approx(100.0)
+    assert row["packet length std"] == pytest.approx(141.42135, rel=1e-5)
+    assert row["syn flag count"] == 2
+    assert row["psh flag count"] == 2
+    assert row["init_win_bytes_forward"] == 8192
+    assert row["init_win_bytes_backward"] == 4096
+    assert row["act_data_pkt_fwd"] == 1
+    assert row["src_ip"] == "10.0.0.1"
+    assert all(f in row for f in butils.FEATURE_ORDER)
+
+
+def test_fin_in_both_directions_finishes_flow():
+    table = flow_table.FlowTable()
+    table.add(pkt(0.0, True, 0, SYN))
+    table.add(pkt(0.1, True, 0, FIN | ACK))
+    assert len(table) == 1
+    table.add(pkt(0.2, False, 0, FIN | ACK))
+    assert len(table) == 0
+    assert len(table.collect(now=0.3)) == 1
+    assert table.collect(now=0.4) == []
+
+
+def test_idle_and_active_timeouts():
+    table = flow_table.FlowTable(active_timeout=10.0, idle_timeout=2.0)
+    table.add(pkt(0.0))
+    table.add(pkt(1.0))
+    table.collect(now=1.5)
+    assert len(table) == 1
+    table.collect(now=5.0)
+    assert len(table) == 0
+
+    # A flow that keeps talking is split once it outlives the active timeout
+    for t in range(0, 12):
+        table.add(pkt(100.0 + t))
+    flows = table.collect(now=112.0)
+    assert len(flows) == 2
+    assert sum(f.features()["total fwd packets"] for f in flows) == 12
+
+
+def test_active_idle_periods():
+    table = flow_table.FlowTable()
+    table.add(pkt(0.0))
+    table.add(pkt(1.0))
+    table.add(pkt(10.0))
+    table.add(pkt(10.5))
+    (row,) = [f.features() for f in table.collect(now=11.0)]
+    assert row["idle mean"] == pytest.approx(9.0e6)
+    assert row["active max"] == pytest.approx(1.0e6)
+
+
+def test_aggregate_window_matches_per_feature_statistics():
+    table = flow_table.FlowTable()
+    for i in range(5):
+        for t in range(i + 1):
+            p = pkt(float(t), payload=10 * i)
+            table.add(p._replace(sport=1000 + i))
+    flows = table.collect(now=10.0)
+    buffer = butils.WindowBuffer(capacity=2)  # forces the buffer to grow
+    agg = butils.aggregate_window(flows, buffer)
+    rows = np.array([[f.features()[name] for name in butils.FEATURE_ORDER] for f in flows], dtype=float)
+
+    vec = agg["features"]
+    assert vec.shape == (4 * len(butils.FEATURE_ORDER),)
+    np.testing.assert_allclose(vec[butils.AGG_INDEX["flow duration_mean"]], rows[:, 1].mean())
+    for stat, fn in [("mean", np.mean), ("std", np.std), ("min", np.min), ("max", np.max)]:
+        expected = fn(rows, axis=0)
+        got = np.array([butils.agg_value(vec, name, stat) for name in butils.FEATURE_ORDER])
+        np.testing.assert_allclose(got, expected)
+    assert agg["src_ip"] == "10.0.0.1"
+    assert agg["n_flows"] == 5
+
+    empty = butils.aggregate_window([], buffer)
+    assert not empty["features"].any() and empty["src_ip"] == "unknown"
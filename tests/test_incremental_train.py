@@ -0,0 +1,80 @@
+import os
+import joblib
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+xgb = pytest.importorskip("xgboost")
+database = import_backend("database")
+incremental_train = import_backend("incremental_train")
+model_registry = import_backend("model_registry")
+FEATURE_ORDER = import_backend("feature_schema").FLOW_FEATURES
+from .test_model_registry import write_models  # noqa: E402
+
+
+def store_labeled(engine, X, y, start_id=0):
+    """Stored window events carrying full FEATURE_ORDER rows, then labeled by class."""
+    rows = np.zeros((len(X), len(FEATURE_ORDER)))
+    rows[:, :X.shape[1]] = X
+    with engine.begin() as conn:
+        conn.execute(database.Event.__table__.insert(), [
+            {"id": start_id + i, "timestamp": 1000.0 + i, "label": 0, "features": row.tolist()}
+            for i, row in enumerate(rows)
+        ])
+    for label in np.unique(y):
+        ids = (start_id + np.flatnonzero(y == label)).tolist()
+        assert database.label_events(ids, int(label), engine) == len(ids)
+
+
+def test_rescaled_trees_decide_as_before(tmp_path):
+    X = write_models(tmp_path)
+    scaler = joblib.load(tmp_path / "scaler.joblib")
+    old = (scaler.mean_.copy(), scaler.scale_.copy())
+    xgb_model, rf_model = joblib.load(tmp_path / "xgb_model.joblib"), joblib.load(tmp_path / "rf_model.joblib")
+    expected_xgb = xgb_model.predict_proba(scaler.transform(X))
+    expected_rf = rf_model.predict(scaler.transform(X))
+
+    scaler.partial_fit(X[:50] * 3 + 7)  # shifted statistics
+    new = (scaler.mean_, scaler.scale_)
+    booster = incremental_train.rescale_xgboost(xgb_model.get_booster(), old, new)
+    incremental_train.rescale_forest(rf_model, old, new)
+    Xs = scaler.transform(X)
+    np.testing.assert_allclose(booster.predict(xgb.DMatrix(Xs)), expected_xgb, atol=1e-5)
+    assert (rf_model.predict(Xs) == expected_rf).mean() > 0.99  # float32 rounding at exact thresholds
+
+
+def test_update_publishes_a_loadable_version_and_advances(tmp_path):
+    X = write_models(tmp_path)
+    y = (X[:, 0] > 5).astype(int) + (X[:, 1] > 10)
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    database.init_db(engine)
+    delta = np.flatnonzero(y[:150] != 2)  # class 2 missing from the delta
+    store_labeled(engine, X[delta], y[delta])
+    rounds = joblib.load(tmp_path / "xgb_model.joblib").get_booster().num_boosted_rounds()
+
+    entry = incremental_train.run(tmp_path, engine, min_rows=100, xgb_rounds=3, rf_trees=2)
+    assert entry["version"] == 1 and entry["rows"] == len(delta)
+    assert entry["xgb_rounds"] == rounds + 3 and entry["rf_trees"] == 7
+    models = model_registry.ModelSet(tmp_path)  # scaler, schema and models still agree
+    rf_pred, proba = models.score(X)
+    assert proba.shape == (len(X), 3) and set(rf_pred) <= {0, 1, 2}
+    assert (proba.argmax(axis=1) == y).mean() > 0.9
+
+    assert incremental_train.run(tmp_path, engine, min_rows=1) is None  # nothing newly labeled
+    store_labeled(engine, X[150:], y[150:], start_id=len(delta))
+    assert incremental_train.run(tmp_path, engine, min_rows=100, xgb_rounds=3, rf_trees=2)["rows"] == len(X) - 150
+    assert incremental_train.load_state(tmp_path)["version"] == 2
+
+
+def test_half_published_generation_is_refused(tmp_path):
+    X = write_models(tmp_path)
+    scaler = joblib.load(tmp_path / "scaler.joblib")
+    schema = incremental_train.current_schema(tmp_path, scaler)
+    xgb_model = joblib.load(tmp_path / "xgb_model.joblib")
+    incremental_train.publish(tmp_path, scaler, schema, xgb_model, joblib.load(tmp_path / "rf_model.joblib"))
+    model_registry.ModelSet(tmp_path)
+
+    joblib.dump(xgb_model, tmp_path / "xgb_model.joblib.tmp")  # the next publish, caught after one rename
+    os.replace(tmp_path / "xgb_model.joblib.tmp", tmp_path / "xgb_model.joblib")
+    with pytest.raises(ValueError, match="not the generation"):
+        model_registry.ModelSet(tmp_path)
@@ -0,0 +1,96 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+inference = import_backend("inference")
+wire = import_backend("wire_protocol")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_requests_share_batches():
+    calls = []
+
+    def predict(X):
+        calls.append(len(X))
+        return X.sum(axis=1).tolist()
+
+    async def main():
+        scheduler = inference.BatchScheduler(predict, max_batch=16, max_wait=0.05)
+        rows = [np.full(3, i, dtype=float) for i in range(40)]
+        results = await asyncio.gather(*(scheduler.submit(row) for row in rows))
+        return scheduler, results
+
+    scheduler, results = run(main())
+    assert results == [3.0 * i for i in range(40)]  # each caller gets its own row's result
+    assert calls == [16, 16, 8]
+    assert scheduler.stats()["batches"] == 3
+
+
+def test_lone_request_waits_at_most_max_wait():
+    async def main():
+        scheduler = inference.BatchScheduler(lambda X: [0] * len(X), max_batch=64, max_wait=0.01)
+        start = time.perf_counter()
+        await scheduler.submit(np.zeros(2))
+        return time.perf_counter() - start
+
+    assert run(main()) < 0.5
+
+
+def test_batch_errors_reach_every_caller():
+    def predict(X):
+        raise RuntimeError("model failed")
+
+    async def main():
+        scheduler = inference.BatchScheduler(predict, max_batch=4, max_wait=0.01)
+        return await asyncio.gather(*(scheduler.submit(np.zeros(1)) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in run(main()))
+    with pytest.raises(ValueError):
+        inference.BatchScheduler(print, max_batch=0)
+
+
+def test_batches_run_on_executor_threads():
+    import threading
+    seen = set()
+
+    def predict(X):
+        seen.add(threading.current_thread().name)
+        return X[:, 0].tolist()
+
+    async def main():
+        executor = inference.make_executor("thread", 2)
+        scheduler = inference.BatchScheduler(predict, max_batch=8, max_wait=0.01, executor=executor)
+        try:
+            return await asyncio.gather(*(scheduler.submit(np.array([i])) for i in range(20)))
+        finally:
+            executor.shutdown()
+
+    assert run(main()) == list(range(20))
+    assert seen and all(name.startswith("inference") for name in seen)
+    with pytest.raises(ValueError):
+        inference.make_executor("gpu")
+
+
+def test_bulk_bodies():
+    order = ["a", "b", "c"]
+    X = inference.rows_from_ndjson(b'{"c": 3, "a": 1, "b": 2}\n\n[4, 5, 6]\n', order)
+    np.testing.assert_array_equal(X, [[1, 2, 3], [4, 5, 6]])
+    assert inference.rows_from_ndjson(b"", order).shape == (0, 3)
+    with pytest.raises(ValueError):
+        inference.rows_from_ndjson(b'{"a": 1}', order)
+    for body in (b'{"a": {"x": 1}, "b": 2, "c": 3}', b'[1, [2], 3]', b'[1, {"x": 2}, 3]'):
+        with pytest.raises(ValueError):
+            inference.rows_from_ndjson(body, order)
+
+    frame = wire.encode_batch(np.array([[3, 1, 2]]), meta={"features": ["c", "a", "b"]})
+    np.testing.assert_array_equal(inference.rows_from_frame(frame, order), [[1, 2, 3]])
+    with pytest.raises(ValueError):
+        inference.rows_from_frame(wire.encode_batch(np.ones((1, 2)), meta={"features": ["a", "x"]}), order)
+    for meta in ([1, 2, 3], {"features": 3}, {"features": [["a"], "b", "c"]}):
+        with pytest.raises(ValueError):
+            inference.rows_from_frame(wire.encode_batch(np.ones((1, 3)), meta=meta), order)
@@ -0,0 +1,36 @@
+import json
+import numpy as np
+import pandas as pd
+from dataset_store import MANIFEST_FILE
+from merge_and_preprocess import merge_and_preprocess
+from utils import load_dataset
+
+
+def write_raw(path, labels, extra=None, label_name=" Label"):
+    n = len(labels)
+    df = pd.DataFrame({" Flow Duration": np.arange(n, dtype=float), "Total Fwd Packets": np.ones(n)})
+    df.loc[0, " Flow Duration"] = np.inf
+    for name, values in (extra or {}).items():
+        df[name] = values
+    df[label_name] = labels
+    df.to_csv(path, index=False)
+
+
+def test_files_share_columns_and_label_encoding(tmp_path):
+    write_raw(tmp_path / "monday.csv", ["BENIGN"] * 5 + ["DDoS"] * 2)
+    write_raw(tmp_path / "tuesday.csv", ["PortScan", "BENIGN", "Bot"], extra={"Sparse": [1.0, None, None]})
+    out = tmp_path / "processed"
+    manifest = merge_and_preprocess([tmp_path / "tuesday.csv", tmp_path / "monday.csv"], out, workers=2,
+                                    chunk_rows=2)
+
+    assert manifest["rows"] == 10 and [p["rows"] for p in manifest["partitions"]] == [7, 3]
+    assert manifest["label_classes"] == ["BENIGN", "Bot", "DDoS", "PortScan"]
+    assert manifest["feature_cols"] == ["flow duration", "total fwd packets"]
+    assert manifest["dropped_cols"] == ["sparse"]  # missing in 9 of 10 rows
+    assert json.loads((out / MANIFEST_FILE).read_text()) == manifest
+
+    df = load_dataset(str(out))
+    assert list(df.columns) == ["flow duration", "total fwd packets", "label"]
+    assert df["label"].tolist() == [0] * 5 + [2] * 2 + [3, 0, 1]  # one encoding across files
+    assert df["flow duration"].iloc[0] == 0 and np.isfinite(df["flow duration"]).all()
+    assert list(load_dataset(str(out), columns=["total fwd packets"]).columns) == ["total fwd packets"]
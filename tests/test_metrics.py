@@ -0,0 +1,84 @@
+import io
+import json
+import logging
+import urllib.request
+from ._backend import import_backend
+
+metrics = import_backend("metrics")
+logs = import_backend("logs")
+
+
+def samples(text):
+    """{sample line without value: value} of a Prometheus text page."""
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            out[name] = float(value)
+    return out
+
+
+def test_histograms_counters_and_callbacks_render_as_prometheus_text():
+    registry = metrics.MetricsRegistry()
+    latency = registry.histogram("t_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.labels("decode").observe(value)
+    registry.counter("t_total", "Things").inc(3)
+    depths = {"a": 2, 'we"ird': 5}
+    registry.callback("t_depth", "Queue depth", lambda: depths, ["agent_id"])
+
+    text = registry.render()
+    assert "# TYPE t_seconds histogram" in text and "# TYPE t_total counter" in text
+    values = samples(text)
+    assert values['t_seconds_bucket{stage="decode",le="0.1"}'] == 1
+    assert values['t_seconds_bucket{stage="decode",le="1.0"}'] == 3
+    assert values['t_seconds_bucket{stage="decode",le="+Inf"}'] == 4
+    assert values['t_seconds_count{stage="decode"}'] == 4 and values['t_seconds_sum{stage="decode"}'] == 4.05
+    assert values["t_total"] == 3
+    assert values['t_depth{agent_id="we\\"ird"}'] == 5
+    assert registry.counter("t_total", "Things") is registry.counter("t_total", "Things")
+
+
+def test_sampled_stage_counts_every_call_but_times_a_few():
+    calls = []
+
+    @metrics.timed("test_sampled", sample=4)
+    def work(x):
+        calls.append(x)
+        return x * 2
+
+    assert [work(i) for i in range(8)] == [i * 2 for i in range(8)] and len(calls) == 8
+    values = samples(metrics.render())
+    assert values['ids_stage_items_total{stage="test_sampled"}'] == 8
+    assert values['ids_stage_seconds_count{stage="test_sampled"}'] == 2
+
+
+def test_metrics_http_endpoint():
+    metrics.stage("test_http").observe(0.002, items=5)
+    server = metrics.serve(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            values = samples(response.read().decode())
+    finally:
+        server.shutdown()
+    assert values['ids_stage_items_total{stage="test_http"}'] == 5
+
+
+def test_json_logs_carry_structured_fields():
+    stream = io.StringIO()
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        logs.configure("WARNING", "json", stream)
+        log = logging.getLogger("test")
+        log.info("hidden")
+        log.warning("Dropping frame: %s", "bad magic", extra={"agent_id": "sensor-1"})
+    finally:
+        root.handlers[:], root.level = handlers, level
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert entry["level"] == "WARNING" and entry["msg"] == "Dropping frame: bad magic"
+    assert entry["agent_id"] == "sensor-1" and entry["logger"] == "test"
@@ -0,0 +1,110 @@
+import os
+import joblib
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+xgb = pytest.importorskip("xgboost")
+model_registry = import_backend("model_registry")
+
+
+def write_models(directory, n_features=6, rf=True, seed=0):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(300, n_features)) * 10 + 5
+    y = (X[:, 0] > 5).astype(int) + (X[:, 1] > 10)
+    scaler = StandardScaler().fit(X)
+    Xs = scaler.transform(X)
+    joblib.dump(scaler, directory / "scaler.joblib")
+    joblib.dump(xgb.XGBClassifier(n_estimators=5, max_depth=3).fit(Xs, y), directory / "xgb_model.joblib")
+    if rf:
+        joblib.dump(RandomForestClassifier(n_estimators=5, random_state=0).fit(Xs, y), directory / "rf_model.joblib")
+    return X
+
+
+def bump_mtime(directory):
+    for name in os.listdir(directory):
+        if name.endswith(".joblib"):
+            st = os.stat(directory / name)
+            os.utime(directory / name, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def test_small_batches_do_not_load_library_models(tmp_path):
+    X = write_models(tmp_path)
+    models = model_registry.ModelSet(tmp_path)
+    rf_small, proba_small = models.score(X[:10])
+    assert models.info()["library_models_loaded"] == []
+
+    rf_large, proba_large = models.score(X)  # above COMPILED_MAX_ROWS: library models
+    assert models.info()["library_models_loaded"] == ["rf", "xgb"]
+    np.testing.assert_array_equal(rf_small, rf_large[:10])
+    np.testing.assert_allclose(proba_small, proba_large[:10], atol=1e-5)
+
+
+def test_random_forest_is_optional(tmp_path):
+    X = write_models(tmp_path, rf=False)
+    rf_pred, proba = model_registry.ModelSet(tmp_path).score(X)
+    assert rf_pred is None and proba.shape == (len(X), 3)
+
+
+def test_reload_swaps_on_change_and_keeps_models_on_failure(tmp_path):
+    X = write_models(tmp_path)
+    swapped = []
+    registry = model_registry.ModelRegistry(tmp_path, on_swap=swapped.append)
+    first = registry.reload()
+    assert not registry.reload_if_changed()
+
+    write_models(tmp_path, seed=1)
+    bump_mtime(tmp_path)
+    assert registry.reload_if_changed()
+    assert registry.current.version == 2 and swapped[-1] is registry.current
+    first.score(X[:5])  # a batch still holding the old generation keeps working
+
+    # Models of the wrong width for the scaler never go live
+    from sklearn.preprocessing import StandardScaler
+    write_models(tmp_path, n_features=4)
+    joblib.dump(StandardScaler().fit(np.ones((3, 6))), tmp_path / "scaler.joblib")
+    bump_mtime(tmp_path)
+    assert not registry.reload_if_changed()
+    assert registry.current.version == 2 and "features" in registry.info()["last_error"]
+    with pytest.raises(ValueError):
+        registry.reload()
+
+
+def test_feature_schema_is_checked_and_applied_at_load(tmp_path):
+    feature_schema = import_backend("feature_schema")
+    X = write_models(tmp_path)
+    scaler = joblib.load(tmp_path / "scaler.joblib")
+    expected_rf, expected_proba = model_registry.ModelSet(tmp_path).score(X)
+
+    # Models trained on flow features in another order see their columns picked from agent rows
+    names = list(feature_schema.FLOW_FEATURES[:6])[::-1]
+    flow_rows = np.zeros((len(X), len(feature_schema.FLOW_FEATURES)))
+    flow_rows[:, :6] = X[:, ::-1]
+    reordered = feature_schema.FeatureSchema(names, scaler.mean_, scaler.scale_)
+    reordered.save(tmp_path / feature_schema.SCHEMA_FILE)
+    models = model_registry.ModelSet(tmp_path)
+    assert models.columns.tolist() == [5, 4, 3, 2, 1, 0] and models.input_width == 6
+    rf_pred, proba = models.score(flow_rows)
+    np.testing.assert_array_equal(rf_pred, expected_rf)
+    np.testing.assert_allclose(proba, expected_proba, atol=1e-6)
+
+    # A schema of another width, or not saved with this scaler, fails the load
+    feature_schema.FeatureSchema(names[:5]).save(tmp_path / feature_schema.SCHEMA_FILE)
+    with pytest.raises(ValueError):
+        model_registry.ModelSet(tmp_path)
+    feature_schema.FeatureSchema(names, scaler.mean_ + 1, scaler.scale_).save(tmp_path / feature_schema.SCHEMA_FILE)
+    with pytest.raises(ValueError):
+        model_registry.ModelSet(tmp_path)
+
+
+def test_compiled_cache_follows_a_replaced_scaler_even_if_older(tmp_path):
+    X = write_models(tmp_path)
+    model_registry.ModelSet(tmp_path)  # compiles and caches the engines
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler().fit(X * 2)
+    joblib.dump(scaler, tmp_path / "scaler.joblib")
+    os.utime(tmp_path / "scaler.joblib", ns=(0, 10**9))  # older than the cache
+    engine = model_registry.load_compiled(str(tmp_path / "xgb_model.joblib"), str(tmp_path / "scaler.joblib"))
+    np.testing.assert_allclose(engine.scaler_mean, scaler.mean_)
@@ -0,0 +1,145 @@
+import socket
+import struct
+from ._backend import import_backend
+
+butils = import_backend("utils")
+decoder = import_backend("packet_decoder")
+
+
+def eth(ethertype, payload, vlan=None):
+    header = b"\x00\x11\x22\x33\x44\x55" + b"\x66\x77\x88\x99\xaa\xbb"
+    if vlan is not None:
+        header += struct.pack("!HH", 0x8100, vlan)
+    return header + struct.pack("!H", ethertype) + payload
+
+
+def ipv4(proto, l4, src="192.168.1.10", dst="10.0.0.5", frag=0):
+    total = 20 + len(l4)
+    return struct.pack(
+        "!BBHHHBBH4s4s", 0x45, 0, total, 1, frag, 64, proto, 0,
+        socket.inet_aton(src), socket.inet_aton(dst),
+    ) + l4
+
+
+def ipv6(next_header, l4, src="2001:db8::1", dst="2001:db8::2"):
+    return struct.pack(
+        "!IHBB16s16s", 6 << 28, len(l4), next_header, 64,
+        socket.inet_pton(socket.AF_INET6, src), socket.inet_pton(socket.AF_INET6, dst),
+    ) + l4
+
+
+def tcp(sport, dport, flags, window, payload=b"", options=b""):
+    offset = (20 + len(options)) // 4
+    return struct.pack("!HHIIBBHHH", sport, dport, 1, 0, offset << 4, flags, window, 0, 0) + options + payload
+
+
+def udp(sport, dport, payload=b""):
+    return struct.pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+
+
+def test_ipv4_tcp():
+    frame = eth(0x0800, ipv4(6, tcp(51000, 443, 0x18, 502, b"x" * 30, options=b"\x01" * 12)))
+    info = decoder.decode_frame(frame, 1.5)
+    assert info == butils.PacketInfo(
+        1.5, socket.inet_aton("192.168.1.10"), socket.inet_aton("10.0.0.5"),
+        51000, 443, 6, 30, 20 + 32, 0x18, 502,
+    )
+    assert butils.format_ip(info.src) == "192.168.1.10"
+
+
+def test_vlan_ipv4_udp_with_padding():
+    # Ethernet frames are padded to 60 bytes; lengths must come from the headers
+    frame = eth(0x0800, ipv4(17, udp(53, 5353, b"abc")), vlan=10) + b"\x00" * 20
+    info = decoder.decode_frame(memoryview(frame), 0.0)
+    assert (info.sport, info.dport, info.proto, info.payload_len, info.header_len) == (53, 5353, 17, 3, 28)
+
+
+def test_ipv6_with_extension_header():
+    hop_by_hop = struct.pack("!BB6x", 6, 0)
+    frame = eth(0x86DD, ipv6(0, hop_by_hop + tcp(80, 1234, 0x02, 64240)))
+    info = decoder.decode_frame(frame, 0.0)
+    assert butils.format_ip(info.dst) == "2001:db8::2"
+    assert (info.proto, info.sport, info.flags, info.header_len, info.payload_len) == (6, 80, 0x02, 68, 0)
+
+
+def test_raw_ip_linktype_and_fragments():
+    packet = ipv4(6, b"\x00" * 40, frag=10)
+    info = decoder.decode_frame(packet, 0.0, decoder.LINKTYPE_RAW)
+    assert (info.sport, info.dport, info.payload_len) == (0, 0, 40)
+
+
+def test_ipv6_fragments():
+    def fragment(offset, data):
+        return ipv6(44, struct.pack("!BBHI", 17, 0, offset << 3 | 1, 7) + data)
+
+    first = decoder.decode_frame(eth(0x86DD, fragment(0, udp(53, 5353, b"abc"))), 0.0)
+    assert (first.proto, first.sport, first.dport, first.header_len) == (17, 53, 5353, 56)
+    later = decoder.decode_frame(eth(0x86DD, fragment(185, b"\xff" * 24)), 0.0)  # payload bytes, not a UDP header
+    assert (later.proto, later.sport, later.dport, later.payload_len, later.header_len) == (17, 0, 0, 24, 48)
+
+
+def test_non_ip_and_truncated_frames():
+    assert decoder.decode_frame(eth(0x0806, b"\x00" * 28), 0.0) is None
+    assert decoder.decode_frame(eth(0x0800, ipv4(6, tcp(1, 2, 0, 0)))[:40], 0.0) is None
+
+
+pcap_reader = import_backend("pcap_reader")
+
+FRAMES = [
+    (1.25, eth(0x0800, ipv4(6, tcp(1000, 80, 0x02, 512)))),
+    (2.5, eth(0x0800, ipv4(17, udp(53, 9999, b"hello")))),
+]
+
+
+def write_pcap(path, endian="<", nsec=False):
+    magic = 0xA1B23C4D if nsec else 0xA1B2C3D4
+    scale = 1e9 if nsec else 1e6
+    data = struct.pack(endian + "IHHiIII", magic, 2, 4, 0, 0, 65535, 1)
+    for ts, frame in FRAMES:
+        sec = int(ts)
+        data += struct.pack(endian + "IIII", sec, round((ts - sec) * scale), len(frame), len(frame)) + frame
+    path.write_bytes(data)
+
+
+def write_pcapng(path):
+    def block(block_type, body):
+        body += b"\x00" * (-len(body) % 4)
+        length = len(body) + 12
+        return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+    data = block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1))
+    tsresol = struct.pack("<HHB3x", 9, 1, 9) + struct.pack("<HH", 0, 0)  # nanoseconds
+    data += block(1, struct.pack("<HHI", 1, 0, 65535) + tsresol)
+    for ts, frame in FRAMES:
+        ticks = round(ts * 1e9)
+        data += block(6, struct.pack("<IIIII", 0, ticks >> 32, ticks & 0xFFFFFFFF, len(frame), len(frame)) + frame)
+    path.write_bytes(data)
+
+
+def test_pcap_variants(tmp_path):
+    for name, kwargs in [("le.pcap", {}), ("be.pcap", {"endian": ">"}), ("ns.pcap", {"nsec": True})]:
+        write_pcap(tmp_path / name, **kwargs)
+        records = list(pcap_reader.read_pcap(str(tmp_path / name)))
+        assert [(round(ts, 6), lt, bytes(f)) for ts, lt, f in records] == [(ts, 1, f) for ts, f in FRAMES]
+
+
+def test_pcapng_and_replay(tmp_path):
+    write_pcapng(tmp_path / "a.pcapng")
+    records = list(pcap_reader.read_pcap(str(tmp_path / "a.pcapng")))
+    assert [round(ts, 6) for ts, _, _ in records] == [1.25, 2.5]
+
+    write_pcap(tmp_path / "b.pcap")
+    infos = list(pcap_reader.replay_packets([str(tmp_path / "a.pcapng"), str(tmp_path / "b.pcap")]))
+    assert [(i.proto, i.dport) for i in infos] == [(6, 80), (17, 9999)] * 2
+
+
+def test_pcapng_packets_of_undescribed_interfaces_are_skipped(tmp_path):
+    write_pcapng(tmp_path / "a.pcapng")
+    data = (tmp_path / "a.pcapng").read_bytes()
+    headers = 28 + 32  # section header and interface description blocks
+    frame = FRAMES[0][1] + b"\x00" * (-len(FRAMES[0][1]) % 4)
+    length = 32 + len(frame)
+    orphan = struct.pack("<IIIIIII", 6, length, 7, 0, 0, len(FRAMES[0][1]), len(FRAMES[0][1])) + frame
+    (tmp_path / "a.pcapng").write_bytes(data[:headers] + orphan + struct.pack("<I", length) + data[headers:])
+    records = list(pcap_reader.read_pcap(str(tmp_path / "a.pcapng")))
+    assert [round(ts, 6) for ts, _, _ in records] == [1.25, 2.5]
@@ -0,0 +1,60 @@
+import os
+import time
+import numpy as np
+import pytest
+from pipeline_dag import Stage, check_graph, format_report, run_dag
+
+
+def make_data(n):
+    return {"X": np.arange(n * 4, dtype=np.float32).reshape(n, 4)}
+
+
+def column_sums(X, pause):
+    time.sleep(pause)
+    return {"sums": X.sum(axis=0), "mapped": isinstance(X, np.memmap), "threads": os.environ.get("OMP_NUM_THREADS")}
+
+
+def row_count(X, pause):
+    time.sleep(pause)
+    return {"rows": len(X)}
+
+
+def combine(sums, rows):
+    return {"mean": sums / rows}
+
+
+def graph(n=100_000, pause=0.5, cpus=1):
+    return [
+        Stage("data", make_data, outputs=("X",), n=n),
+        Stage("sums", column_sums, ("X",), ("sums", "mapped", "threads"), cpus=cpus, pause=pause),
+        Stage("rows", row_count, ("X",), ("rows",), cpus=cpus, pause=pause),
+        Stage("mean", combine, ("sums", "rows"), ("mean",)),
+    ]
+
+
+def test_independent_stages_run_concurrently_in_limited_workers():
+    values, report = run_dag(graph(), cpu_budget=2)
+    np.testing.assert_allclose(values["mean"], make_data(100_000)["X"].mean(axis=0))
+    assert values["mapped"] and values["threads"] == "1"  # large arrays arrive memory-mapped
+    timings = {t["stage"]: t for t in report["stages"]}
+    assert timings["sums"]["start"] < timings["rows"]["end"] and timings["rows"]["start"] < timings["sums"]["end"]
+    assert report["critical_path"][0] == "data" and report["critical_path"][-1] == "mean"
+    assert "critical path" in format_report(report)
+
+
+def test_stages_wait_for_their_share_of_the_cpu_budget():
+    values, report = run_dag(graph(n=10, pause=0.2, cpus=2), cpu_budget=2)
+    timings = {t["stage"]: t for t in report["stages"]}
+    first, second = sorted((timings["sums"], timings["rows"]), key=lambda t: t["start"])
+    assert first["end"] <= second["start"] and values["threads"] == "2"
+    inline, _ = run_dag(graph(n=10, pause=0), executor="inline")
+    np.testing.assert_allclose(inline["mean"], values["mean"])
+
+
+def test_graph_errors():
+    with pytest.raises(ValueError, match="no stage produces"):
+        check_graph([Stage("a", combine, ("sums", "rows"), ("mean",))])
+    with pytest.raises(ValueError, match="depend on each other"):
+        check_graph([Stage("a", combine, ("x",), ("y",)), Stage("b", combine, ("y",), ("x",))])
+    with pytest.raises(RuntimeError, match="Stage rows failed"):
+        run_dag([Stage("data", make_data, outputs=("X",), n=10), Stage("rows", row_count, ("X",), ("rows",))])
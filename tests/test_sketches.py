@@ -0,0 +1,63 @@
+import numpy as np
+from ._backend import import_backend
+
+sketches = import_backend("sketches")
+
+
+def zipf_stream(n, hosts, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"10.0.{i // 256}.{i % 256}" for i in rng.zipf(1.3, size=n) % hosts]
+
+
+def test_space_saving_finds_heavy_hitters():
+    stream = zipf_stream(20000, 5000)
+    exact = {}
+    for host in stream:
+        exact[host] = exact.get(host, 0) + 1
+    ss = sketches.SpaceSaving(k=32)
+    for host in stream:
+        ss.update(host)
+
+    assert len(ss) == 32
+    true_top = sorted(exact, key=exact.get, reverse=True)[:5]
+    assert [host for host, _, _ in ss.top(5)] == true_top
+    for host, count, error in ss.top():
+        assert count - error <= exact.get(host, 0) <= count
+
+
+def test_count_min_never_underestimates():
+    cms = sketches.CountMinSketch(width=256, depth=4)
+    cms.add(sketches.keys([i % 700 for i in range(2000)]), 3)
+    assert all(cms.query(i) >= 3 * (2000 // 700 + (i < 2000 % 700)) for i in range(700))
+
+
+def test_hyperloglog_accuracy_and_merge():
+    a, b = sketches.HyperLogLog(p=10), sketches.HyperLogLog(p=10)
+    a.add(sketches.hashes(sketches.keys([f"host-{i}" for i in range(0, 30000, 2)])))
+    b.add(sketches.hashes(sketches.keys([f"host-{i}" for i in range(1, 30000, 2)])))
+    a.add(sketches.hashes(sketches.keys([f"host-{i}" for i in range(100)])))  # duplicates do not count twice
+    assert abs(a.merge(b).count() - 30000) / 30000 < 0.1
+    assert abs(sketches.HyperLogLog(p=10).count()) == 0
+
+
+def test_hash_is_stable_across_processes():
+    # Sketches from different worker processes must hash items identically
+    assert sketches.hash64("10.0.0.1") == sketches.hash64(b"10.0.0.1") == 0x86A3145CF5CC986C
+    assert sketches.hash64(443, 1) != sketches.hash64(443, 2)
+
+
+def test_traffic_sketch_merge_matches_single_pass():
+    flows = [(f"10.0.0.{i % 7}", f"192.168.1.{i % 50}", 1000 + i % 300, 1 + i % 5, 60 * (1 + i % 5))
+             for i in range(3000)]
+    whole, left, right = sketches.TrafficSketch(), sketches.TrafficSketch(), sketches.TrafficSketch()
+    whole.add_flows(*zip(*flows), [True] * len(flows))
+    for flow in flows[:1000]:
+        left.add_flow(*flow)
+    right.add_flows(*zip(*flows[1000:]), [True] * 2000)
+
+    merged = left.merge(right).report(3)
+    assert merged["top_sources"] == whole.report(3)["top_sources"]  # fewer hosts than k: exact
+    top = merged["top_sources"][0]
+    assert top["flows"] == sum(1 for f in flows if f[0] == top["host"])
+    assert merged["distinct_sources"] == 7
+    assert 270 <= top["distinct_ports"] <= 330
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+xgb = pytest.importorskip("xgboost")
+tree_eval = import_backend("tree_eval")
+
+
+def data(n=600, classes=3, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 8)).astype(np.float32)
+    y = (X[:, 0] > 0).astype(int) + (classes > 2) * (X[:, 1] > 0.5)
+    X[rng.random(X.shape) < 0.05] = np.nan  # exercise default (missing-value) directions
+    return X, y
+
+
+@pytest.mark.parametrize("classes", [2, 3])
+def test_matches_xgboost_predict_proba(classes, tmp_path):
+    X, y = data(classes=classes)
+    model = xgb.XGBClassifier(n_estimators=20, max_depth=4, learning_rate=0.3).fit(X, y)
+
+    ensemble = tree_eval.TreeEnsemble.from_xgboost(model)
+    np.testing.assert_allclose(ensemble.predict_proba(X), model.predict_proba(X), atol=1e-5)
+
+    ensemble.save(tmp_path / "model.npz")
+    loaded = tree_eval.TreeEnsemble.load(tmp_path / "model.npz")
+    np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+    mapped = tree_eval.TreeEnsemble.load(tmp_path / "model.npz", mmap=True)
+    assert isinstance(mapped.threshold, np.memmap)
+    np.testing.assert_array_equal(mapped.predict_proba(X), loaded.predict_proba(X))
+
+
+def test_scaler_and_padding_columns():
+    from sklearn.preprocessing import StandardScaler
+    X, y = data(classes=3)
+    X = np.nan_to_num(X).astype(float) * 50 + 10  # scaled in float64, like the backend
+    scaler = StandardScaler().fit(X)
+    model = xgb.XGBClassifier(n_estimators=10, max_depth=3).fit(scaler.transform(X), y)
+
+    ensemble = tree_eval.TreeEnsemble.from_xgboost(model, scaler)
+    padded = np.hstack([X, np.zeros((len(X), 4))])  # extra zero columns are ignored
+    np.testing.assert_allclose(ensemble.predict_proba(padded), model.predict_proba(scaler.transform(X)), atol=1e-5)
+    with pytest.raises(ValueError):
+        ensemble.predict_proba(X[:, :5])
+
+
+def test_matches_random_forest_predict_proba(tmp_path):
+    from sklearn.ensemble import RandomForestClassifier
+    X, y = data(n=800, classes=3, seed=1)
+    X = np.nan_to_num(X)
+    labels = np.array(["BENIGN", "DoS", "PortScan"])[y]
+    model = RandomForestClassifier(n_estimators=15, random_state=0).fit(X, labels)
+
+    ensemble = tree_eval.TreeEnsemble.from_model(model)
+    # Rows exactly on split thresholds exercise sklearn's "x <= t" rule
+    feature, threshold = model.estimators_[0].tree_.feature[0], model.estimators_[0].tree_.threshold[0]
+    X_edge = X[:50].copy()
+    X_edge[:, feature] = np.float32(threshold)
+    for rows in (X, X_edge, X[:1]):
+        np.testing.assert_allclose(ensemble.predict_proba(rows), model.predict_proba(rows), atol=1e-6)
+        np.testing.assert_array_equal(ensemble.predict(rows), model.predict(rows))
+
+    ensemble.save(tmp_path / "rf.npz")
+    np.testing.assert_array_equal(tree_eval.TreeEnsemble.load(tmp_path / "rf.npz").predict(X), model.predict(X))
+
+
+def test_benchmark_reports_every_batch_size():
+    X, y = data()
+    model = xgb.XGBClassifier(n_estimators=5, max_depth=3).fit(X, y)
+    results = tree_eval.benchmark(model, tree_eval.TreeEnsemble.from_model(model), sizes=(1, 10), budget=0.01)
+    assert [size for size, *_ in results] == [1, 10]
+    assert all(diff < 1e-5 for *_, diff in results)
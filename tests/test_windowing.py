@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+butils = import_backend("utils")
+sketches = import_backend("sketches")
+windowing = import_backend("windowing")
+
+
+def pane(rows, start, end, src="10.0.0.1"):
+    traffic = sketches.TrafficSketch()
+    for _ in range(len(rows)):
+        traffic.add_flow(src, "10.0.0.254", 80, 1, 100)
+    return {
+        "features": butils.aggregate_rows(rows),
+        "n_flows": len(rows),
+        "traffic": traffic,
+        "rows": rows,
+        "keys": [],
+        "start": start,
+        "end": end,
+    }
+
+
+def test_merged_panes_match_full_window():
+    rng = np.random.default_rng(1)
+    chunks = [rng.normal(size=(n, 5)) * 100 for n in (3, 0, 7, 4)]
+    out = []
+    sliding = windowing.SlidingWindow(length=3, hop=1, emit=out.append)
+    for i, rows in enumerate(chunks):
+        sliding(pane(rows, float(i), float(i + 1), src=f"h{i}"))
+
+    assert [w["start"] for w in out] == [0.0, 0.0, 0.0, 1.0]
+    full = np.concatenate(chunks[1:])
+    np.testing.assert_allclose(out[-1]["features"], butils.aggregate_rows(full))
+    assert out[-1]["window_flows"] == len(full)
+    assert out[-1]["n_flows"] == 4  # rows of the newest pane only
+    top = out[-1]["traffic"].sources.report()
+    assert [(h["host"], h["packets"], h["flows"]) for h in top] == [("h2", 7, 7), ("h3", 4, 4)]
+    assert out[-1]["src_ip"] == "h2"
+
+
+def test_clock_emits_empty_panes_on_time():
+    closed = []
+    clock = windowing.WindowClock(hop=2.0, on_pane=lambda s, e, flush=False: closed.append((s, e, flush)))
+    clock.advance(101.0)
+    clock.advance(107.5)   # three boundaries passed with no packets in between
+    clock.flush(108.0)
+    assert closed == [(100.0, 102.0, False), (102.0, 104.0, False), (104.0, 106.0, False), (106.0, 108.0, True)]
+
+
+def test_invalid_hop():
+    with pytest.raises(ValueError):
+        windowing.SlidingWindow(length=1, hop=2, emit=print)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from ._backend import import_backend
+
+wire = import_backend("wire_protocol")
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_roundtrip(compress):
+    X = np.random.default_rng(0).normal(size=(37, 78))
+    keys = [f"10.0.0.{i} {40000 + i} 2001:db8::1 443 6" for i in range(37)]
+    frame = wire.encode_batch(X, keys, agent_id="sensor-é", window_start=10.0, window_end=20.0, compress=compress)
+    batch = wire.decode_batch(frame)
+    assert batch.agent_id == "sensor-é"
+    assert (batch.window_start, batch.window_end) == (10.0, 20.0)
+    assert batch.keys == keys
+    assert batch.features.dtype == np.float32
+    np.testing.assert_array_equal(batch.features, X.astype(np.float32))
+
+
+def test_uncompressed_decode_is_zero_copy():
+    frame = wire.encode_batch(np.ones((4, 3)), agent_id="a")
+    batch = wire.decode_batch(frame)
+    assert not batch.features.flags.owndata
+    assert not batch.features.flags.writeable
+    assert batch.keys == []
+
+
+def test_empty_window_and_bad_frames():
+    batch = wire.decode_batch(wire.encode_batch(np.zeros((0, 78))))
+    assert batch.features.shape == (0, 78)
+    frame = wire.encode_batch(np.ones((2, 2)))
+    with pytest.raises(wire.WireFormatError):
+        wire.decode_batch(b"JUNK" + frame[4:])
+    with pytest.raises(wire.WireFormatError):
+        wire.decode_batch(frame[:-4])
+    with pytest.raises(ValueError):
+        wire.encode_batch(np.ones((2, 2)), keys=["only one"])
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_meta_section_round_trip(compress):
+    meta = {"top_sources": [{"host": "10.0.0.1", "packets": 12}], "distinct_sources": 3}
+    batch = wire.decode_batch(wire.encode_batch(np.ones((2, 3)), ["a", "b"], "agent", meta=meta, compress=compress))
+    assert batch.meta == meta
+    assert batch.keys == ["a", "b"]
+    np.testing.assert_array_equal(batch.features, np.ones((2, 3)))
+    assert wire.decode_batch(wire.encode_batch(np.ones((1, 1)))).meta == {}
+
+
+def test_corrupted_and_oversized_compressed_frames():
+    import zlib
+    frame = wire.encode_batch(np.ones((2, 2)), compress=True)
+    header = frame[:wire._HEADER.size]
+    with pytest.raises(wire.WireFormatError):
+        wire.decode_batch(header + b"\x78\x01garbage")
+    with pytest.raises(wire.WireFormatError):
+        wire.decode_batch(frame[:-3])  # truncated stream
+    bomb = zlib.compress(b"\0" * 50_000_000, 9)  # ~50 KB inflating to 50 MB for a 2x2 header
+    with pytest.raises(wire.WireFormatError, match="inflates past"):
+        wire.decode_batch(header + bomb)
+    bad_agent = wire.encode_batch(np.ones((2, 2)), agent_id="ab")
+    with pytest.raises(wire.WireFormatError):
+        wire.decode_batch(bad_agent[:wire._HEADER.size] + b"\xff\xfe" + bad_agent[wire._HEADER.size + 2:])
+
+
+def test_oversized_headers_key_counts_and_meta_types_are_rejected():
+    import struct
+    import zlib
+    header = wire._HEADER.pack(wire.MAGIC, wire.VERSION, wire.FLAG_ZLIB, 0, 0xFFFFFFFF, 0xFFFFFFFF, 0.0, 0.0, 0)
+    with pytest.raises(wire.WireFormatError, match="over"):
+        wire.decode_batch(header + zlib.compress(b"\0" * 1000))
+    header = wire._HEADER.pack(wire.MAGIC, wire.VERSION, 0, 0, 2, 1, 0.0, 0.0, 1)
+    with pytest.raises(wire.WireFormatError, match="flow keys"):
+        wire.decode_batch(header + b"a\0\0\0" + np.ones(2, dtype="<f4").tobytes())
+    frame = wire.encode_batch(np.ones((1, 1)), meta={"x": 1})
+    meta = b"[1,2,3]\0"  # valid JSON, not an object
+    body = frame[wire._HEADER.size:]
+    with pytest.raises(wire.WireFormatError, match="not an object"):
+        wire.decode_batch(frame[:wire._HEADER.size] + struct.pack("<I", 7) + meta + body[4 + 8:])
@@ -1,11 +1,15 @@
 import os
+import sys
 import json
+import importlib.util
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
+from dataset_store import load_dataset, load_matrix
 
 RANDOM_SEED = 42
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
 
 def ensure_dir(d):
     os.makedirs(d, exist_ok=True)
@@ -15,8 +19,9 @@ def save_json(obj, path):
     with open(path, "w") as f:
         json.dump(obj, f, indent=2)
 
-def load_csv(path):
-    return pd.read_csv(path)
+def load_csv(path, columns=None):
+    """A CSV file or dataset directory, with float32 features and narrow integer columns."""
+    return load_dataset(path, columns)
 
 def save_csv(df, path):
     ensure_dir(os.path.dirname(path) or ".")
@@ -44,6 +49,32 @@ def standardize_features(df, feature_cols):
     return X, scaler, medians
 
 
+def _feature_schema_module():
+    """
+    backend/feature_schema.py, the one definition of feature_schema.json
+    (it only needs NumPy). Loaded by path: putting backend/ on sys.path
+    would let backend/utils.py shadow this module.
+    """
+    module = sys.modules.get("feature_schema")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("feature_schema", os.path.join(BACKEND_DIR, "feature_schema.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["feature_schema"] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def save_feature_schema(scaler, feature_cols, path):
+    """
+    Save the column names and the scaler's offset/scale next to the
+    scaler, so the backend and agents reject models whose features do not
+    match theirs when loading them.
+    """
+    ensure_dir(os.path.dirname(path) or ".")
+    schema = _feature_schema_module().FeatureSchema
+    schema.from_scaler(scaler, [c.strip().lower() for c in feature_cols]).save(path)
+
+
 def apply_scaler(df, feature_cols, scaler, train_medians=None):
     # Replace inf/-inf with NaN
     df[feature_cols] = df[feature_cols].replace([np.inf, -np.inf], np.nan)